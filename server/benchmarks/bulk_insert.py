@@ -0,0 +1,75 @@
+import time
+import datetime
+import argparse
+from psycopg2 import extras
+from ..model.dbconnector import PostgresConnector
+
+# Compares rows/sec of the three ways of writing power readings:
+# one INSERT per row, psycopg2 execute_values, and COPY ... FROM STDIN
+#   python -m server.benchmarks.bulk_insert --rows 100000
+
+parser = argparse.ArgumentParser(description="Power reading bulk insert benchmark.")
+parser.add_argument('--rows', type=int, default=100000, help="Rows written by the batched paths.")
+parser.add_argument('--per-row-rows', type=int, default=10000, help="Rows written by the (slow) per-row path.")
+
+connector = PostgresConnector(
+    host="localhost",
+    port=5432,
+    database="postgres",
+    user="postgres",
+    password="password",
+)
+
+# Scratch table with the same columns as p.power_reading, without the consumption foreign key
+TABLE = "bench_power_reading"
+
+
+def generate_rows(count):
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        yield (1, start + datetime.timedelta(hours=i), float(i % 1000) + 0.25)
+
+
+def per_row(conn, count):
+    for row in generate_rows(count):
+        conn.execute(f"INSERT INTO {TABLE} (consumption_id, reading_timestamp, power) VALUES (%s, %s, %s)", row)
+
+
+def execute_values(conn, count):
+    with conn.conn.cursor() as cur:
+        extras.execute_values(cur, f"INSERT INTO {TABLE} (consumption_id, reading_timestamp, power) VALUES %s",
+                              generate_rows(count), page_size=1000)
+
+
+def copy(conn, count):
+    conn.copy_rows(TABLE, ("consumption_id", "reading_timestamp", "power"), generate_rows(count))
+
+
+def run(conn, label, method, count):
+    conn.execute(f"TRUNCATE {TABLE}")
+    started = time.perf_counter()
+    method(conn, count)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    print(f"-- {label:<15} {count:>9} rows  {elapsed:8.2f}s  {count / elapsed:>12,.0f} rows/sec")
+
+
+def main(args):
+    with connector.connection() as conn:
+        conn.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {TABLE} (
+                consumption_id INT NOT NULL,
+                reading_timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                power NUMERIC(10, 2) NOT NULL
+            )""")
+        try:
+            run(conn, "per-row INSERT", per_row, args.per_row_rows)
+            run(conn, "execute_values", execute_values, args.rows)
+            run(conn, "COPY", copy, args.rows)
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    connector.close_pool()
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
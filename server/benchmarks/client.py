@@ -0,0 +1,76 @@
+import json
+import time
+import http.client
+import urllib.parse
+import urllib.request
+
+# Minimal HTTP client helpers shared by the benchmarks (standard library only)
+
+
+def login(base_url, username, password):
+    body = json.dumps({"username": username, "password": password}).encode()
+    request = urllib.request.Request(f"{base_url}/auth/login", data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())["access_token"]
+
+
+def timed_request(url, token, method="GET", payload=None):
+    headers = {"Authorization": f"Bearer {token}"}
+    body = None
+    if payload is not None:
+        body = json.dumps(payload).encode()
+        headers["Content-Type"] = "application/json"
+    request = urllib.request.Request(url, data=body, headers=headers, method=method)
+    started = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        content = response.read()
+    return time.perf_counter() - started, content
+
+
+def timed_get(url, token):
+    return timed_request(url, token)[0]
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# Keep-alive connection to the API, for load tests: one per client thread, so the latencies measure the server
+# rather than connection setup. request() returns (seconds, status, content); error statuses are returned, not
+# raised. A reused connection closed by the server meanwhile (keep-alive timeout) is reopened and the request sent again
+class HttpSession:
+    def __init__(self, base_url, token=None, timeout=120):
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port, self.prefix = url.hostname, url.port or 80, url.path.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, path, method="GET", payload=None):
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+
+        for attempt in range(2):
+            reused = self.conn is not None
+            if not reused:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            started = time.perf_counter()
+            try:
+                self.conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                content = response.read()
+                return time.perf_counter() - started, response.status, content
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if not reused or attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
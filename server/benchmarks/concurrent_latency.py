@@ -0,0 +1,61 @@
+import argparse
+import threading
+import statistics
+from .client import login, timed_get, percentile
+
+# Measures getDevices latency on its own, and again while getUserConsumptionComparisonByCategory
+# runs concurrently, against a running server:
+#   python -m uvicorn server.main:app
+#   python -m server.benchmarks.concurrent_latency --requests 500 --background 4
+
+parser = argparse.ArgumentParser(description="p99 latency of getDevices under concurrent statistics load.")
+parser.add_argument('--base-url', default="http://localhost:8000", help="Base url of the running API.")
+parser.add_argument('--username', default="athtech", help="User to log in as.")
+parser.add_argument('--password', default="athtech", help="Password of the user.")
+parser.add_argument('--requests', type=int, default=300, help="Number of getDevices requests per phase.")
+parser.add_argument('--background', type=int, default=4, help="Concurrent statistics request loops during the loaded phase.")
+
+
+def measure(base_url, token, count):
+    return [timed_get(f"{base_url}/data/getDevices", token) for _ in range(count)]
+
+
+def report(label, samples):
+    print(f"-- {label}: n={len(samples)} "
+          f"mean={statistics.mean(samples) * 1000:.1f}ms "
+          f"p50={percentile(samples, 50) * 1000:.1f}ms "
+          f"p95={percentile(samples, 95) * 1000:.1f}ms "
+          f"p99={percentile(samples, 99) * 1000:.1f}ms")
+
+
+def main(args):
+    token = login(args.base_url, args.username, args.password)
+
+    # Phase 1 - getDevices on an idle server
+    report("getDevices (idle)", measure(args.base_url, token, args.requests))
+
+    # Phase 2 - getDevices while statistics queries run in the background
+    stop = threading.Event()
+    background_count = [0]
+
+    def statistics_loop():
+        while not stop.is_set():
+            timed_get(f"{args.base_url}/data/getUserConsumptionComparisonByCategory", token)
+            background_count[0] += 1
+
+    workers = [threading.Thread(target=statistics_loop, daemon=True) for _ in range(args.background)]
+    for worker in workers:
+        worker.start()
+    try:
+        samples = measure(args.base_url, token, args.requests)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    report(f"getDevices (with {args.background} concurrent statistics loops)", samples)
+    print(f"-- Background statistics requests completed: {background_count[0]}")
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,64 @@
+import json
+import argparse
+import statistics
+from .client import login, timed_request, percentile
+
+# Payload size and latency of the reading endpoints, raw and downsampled, against a running server:
+#   python -m uvicorn server.main:app
+#   python -m server.benchmarks.downsampling --device-id 1 --runs 20
+#
+# The device should have a long history (e.g. two years of generated consumptions) for the numbers to mean
+# anything. Every variant also reports whether the highest reading of the raw series survived.
+
+parser = argparse.ArgumentParser(description="Payload size and latency of downsampled reading endpoints.")
+parser.add_argument('--base-url', default="http://localhost:8000", help="Base url of the running API.")
+parser.add_argument('--username', default="athtech", help="User to log in as.")
+parser.add_argument('--password', default="athtech", help="Password of the user.")
+parser.add_argument('--device-id', type=int, required=True, help="Device (owned by the user) whose readings are requested.")
+parser.add_argument('--runs', type=int, default=20, help="Requests per variant.")
+parser.add_argument('--max-points', type=int, default=500, help="max_points of the LTTB variants.")
+
+VARIANTS = [
+    ("raw", ""),
+    ("lttb", "?max_points={max_points}"),
+    ("min/max per day", "?resolution=day"),
+    ("min/max per week", "?resolution=week"),
+    ("min/max per day + lttb", "?resolution=day&max_points={max_points}"),
+]
+
+
+def main(args):
+    token = login(args.base_url, args.username, args.password)
+    url = f"{args.base_url}/data/getDevicePowerReadings/{args.device_id}"
+
+    results = []
+    raw_peak = None
+    for label, query in VARIANTS:
+        samples = []
+        for _ in range(args.runs):
+            elapsed, content = timed_request(url + query.format(max_points=args.max_points), token)
+            samples.append(elapsed)
+
+        readings = json.loads(content)
+        peak = max((reading["power"] for reading in readings), default=None)
+        if raw_peak is None:
+            raw_peak = peak
+
+        result = {
+            "variant": label,
+            "points": len(readings),
+            "payload_bytes": len(content),
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "mean_ms": statistics.mean(samples) * 1000,
+            "peak_kept": peak == raw_peak,
+        }
+        results.append(result)
+        print(f"-- {label}: {result['points']} points, {result['payload_bytes'] / 1024:,.0f} KiB, "
+              f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms, peak kept: {result['peak_kept']}")
+
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+import io
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import pandas as pd
+import pyarrow.parquet  # noqa: F401 - loaded by every variant, so the baselines are comparable
+from ..model.dbconnector import PostgresConnector
+from ..model.export import EXPORT_CHUNK_SIZE, encode_power_readings
+
+# Peak memory and time to first byte of the readings download of a device: the xlsx export (fetch everything,
+# build a DataFrame, render the workbook) against the streaming exports (server-side cursor, one chunk at a time).
+# Every variant runs in a fresh process, and reports its peak RSS above the baseline after imports:
+#   python -m server.benchmarks.export_memory --device-id 1
+#
+# The device should have a long history (e.g. several years of generated consumptions) for the numbers to mean anything.
+
+parser = argparse.ArgumentParser(description="Peak RSS of the xlsx and the streaming readings exports.")
+parser.add_argument('--username', default="athtech", help="Owner of the device.")
+parser.add_argument('--device-id', type=int, required=True, help="Device whose readings are exported.")
+parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help="Rows per chunk of the streaming exports.")
+parser.add_argument('--variant', default=None, help=argparse.SUPPRESS)  # run a single variant (in the child process)
+
+VARIANTS = ["xlsx", "csv", "csv.gz", "parquet"]
+
+connector = PostgresConnector(
+    host="localhost",
+    port=5432,
+    database="postgres",
+    user="postgres",
+    password="password",
+)
+
+# Same query as downloadAllConsumptionPowerReadings
+QUERY = """
+    SELECT p.power_reading.reading_timestamp, p.power_reading.power
+    FROM p.device
+    JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+    JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+    JOIN p.power_reading ON p.consumption.id = p.power_reading.consumption_id
+        AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+        AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
+    WHERE p.device.id = %s AND p.device.user_username = %s
+    ORDER BY p.power_reading.reading_timestamp
+"""
+
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# The steps of the xlsx endpoint: the whole file exists before its first byte can be sent
+def export_xlsx(conn, params, chunk_size):
+    result = conn.execute(QUERY, params)
+    df = pd.DataFrame(result, columns=['reading_timestamp', 'power'])
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        df.to_excel(writer, index=False, sheet_name='Power Readings')
+    yield output.getvalue()
+
+
+def export_streaming(export_format):
+    def export(conn, params, chunk_size):
+        return encode_power_readings(conn.iter_query(QUERY, params, chunk_size), export_format)
+    return export
+
+
+def run_variant(args):
+    export = export_xlsx if args.variant == "xlsx" else export_streaming(args.variant)
+    with connector.connection() as conn:
+        baseline = peak_rss_mib()
+        started = time.perf_counter()
+        first_byte, size = None, 0
+        for data in export(conn, (args.device_id, args.username), args.chunk_size):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            size += len(data)
+        elapsed = time.perf_counter() - started
+    connector.close_pool()
+    print(json.dumps({"variant": args.variant, "bytes": size, "first_byte_s": first_byte, "total_s": elapsed,
+                      "peak_rss_mib": peak_rss_mib() - baseline}))
+
+
+def main(args):
+    results = []
+    for variant in VARIANTS:
+        process = subprocess.run([sys.executable, "-m", "server.benchmarks.export_memory", "--device-id", str(args.device_id),
+                                  "--username", args.username, "--chunk-size", str(args.chunk_size), "--variant", variant],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            # e.g. an xlsx sheet holds at most 1,048,576 rows
+            error = (process.stderr.strip().splitlines() or ["failed"])[-1]
+            results.append({"variant": variant, "error": error})
+            print(f"-- {variant:<8} failed: {error}")
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"-- {variant:<8} {result['bytes'] / 1024 / 1024:8.1f} MiB  first byte {result['first_byte_s'] * 1000:8.0f}ms  "
+              f"total {result['total_s']:6.2f}s  peak RSS +{result['peak_rss_mib']:.1f} MiB")
+
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    arguments = parser.parse_args()
+    run_variant(arguments) if arguments.variant else main(arguments)
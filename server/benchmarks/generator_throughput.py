@@ -0,0 +1,46 @@
+import json
+import argparse
+import datetime
+import statistics
+from .client import login, timed_request
+
+# Measures readings/sec written by POST /data/addConsumptionPowerReadings, against a running server.
+# Run it against two builds (e.g. before / after a change to the write path) and compare:
+#   python -m server.benchmarks.generator_throughput --device-id 1 --days 365 --runs 3 --cleanup
+
+parser = argparse.ArgumentParser(description="Throughput of the consumption generator endpoint.")
+parser.add_argument('--base-url', default="http://localhost:8000", help="Base url of the running API.")
+parser.add_argument('--username', default="athtech", help="User to log in as.")
+parser.add_argument('--password', default="athtech", help="Password of the user.")
+parser.add_argument('--device-id', type=int, required=True, help="Device (owned by the user) to generate readings for.")
+parser.add_argument('--days', type=int, default=365, help="Length of the generated period, in days.")
+parser.add_argument('--runs', type=int, default=3, help="Number of generation requests.")
+parser.add_argument('--cleanup', action='store_true', help="Remove the device's consumptions after each run.")
+
+
+def main(args):
+    token = login(args.base_url, args.username, args.password)
+    start_date = datetime.date(2020, 1, 1)
+    end_date = start_date + datetime.timedelta(days=args.days)
+    readings = args.days * 24 + 1
+
+    rates = []
+    for run in range(args.runs):
+        elapsed, _ = timed_request(f"{args.base_url}/data/addConsumptionPowerReadings", token, method="POST", payload={
+            "device_id": args.device_id,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "duration_days": args.days,
+            "seed": run,
+        })
+        rates.append(readings / elapsed)
+        print(f"-- Run {run + 1}: {readings} readings in {elapsed:.2f}s ({readings / elapsed:,.0f} readings/sec)")
+
+        if args.cleanup:
+            timed_request(f"{args.base_url}/data/removeAllDeviceConsumption/{args.device_id}", token, method="DELETE")
+
+    print(json.dumps({"readings_per_run": readings, "median_readings_per_sec": statistics.median(rates)}))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
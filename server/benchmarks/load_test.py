@@ -0,0 +1,327 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from .client import login, percentile, HttpSession
+from ..model.dbconnector import PostgresConnector
+
+# End-to-end load test of the API: boots the app (uvicorn, in a child process) against the local database, logs
+# in as users of a synthetic fleet, and replays a mix of dashboard, device detail, statistics and generation
+# scenarios from concurrent clients. Reports throughput and p50 / p95 / p99 latency per route, and writes them
+# as JSON, which a later run can be compared against (exits with 1 on a regression):
+#   python -m server.benchmarks.load_test --seed-fleet --output baseline.json           # first run, seeds the fleet
+#   python -m server.benchmarks.load_test --output current.json --baseline baseline.json
+#
+# The fleet is generated once with server.database.fleet (see --seed-fleet), on an initialized database.
+# Compare runs made with the same arguments, fleet and machine. The response cache is off in the booted app
+# (unless --response-cache), so that the routes measure their queries
+
+parser = argparse.ArgumentParser(description="Throughput and latency per route of the API under a mix of concurrent scenarios.")
+parser.add_argument('--base-url', default=None, help="Base url of an already running API, instead of booting one.")
+parser.add_argument('--port', type=int, default=8010, help="Port of the booted API.")
+parser.add_argument('--response-cache', action='store_true', help="Keep the response cache of the booted API on.")
+parser.add_argument('--seed-fleet', action='store_true', help="Generate the fleet first (python -m server.database.fleet).")
+parser.add_argument('--fleet-users', type=int, default=50, help="Users of the generated fleet.")
+parser.add_argument('--fleet-devices-per-user', type=int, default=4, help="Devices per user of the generated fleet.")
+parser.add_argument('--fleet-months', type=int, default=6, help="Months of readings of the generated fleet.")
+parser.add_argument('--prefix', default="loadtest", help="Username prefix of the fleet users.")
+parser.add_argument('--password', default="loadtest", help="Password of the fleet users.")
+parser.add_argument('--users', type=int, default=10, help="Fleet users the clients log in as.")
+parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients.")
+parser.add_argument('--duration', type=float, default=60, help="Measured seconds.")
+parser.add_argument('--warmup', type=float, default=5, help="Seconds run before measuring.")
+parser.add_argument('--mix', default="dashboard=40,device=35,statistics=20,generation=5", help="Scenario weights.")
+parser.add_argument('--seed', type=int, default=0, help="Seed of the scenario draws.")
+parser.add_argument('--output', default=None, help="File to write the results to (JSON).")
+parser.add_argument('--baseline', default=None, help="Results of a previous run to compare against.")
+parser.add_argument('--tolerance', type=float, default=0.25, help="Relative p95 / p99 increase over the baseline reported as a regression.")
+parser.add_argument('--min-delta-ms', type=float, default=5, help="Smallest absolute p95 / p99 increase reported as a regression.")
+
+connector = PostgresConnector(
+    host="localhost",
+    port=5432,
+    database="postgres",
+    user="postgres",
+    password="password",
+)
+
+# Month written (and removed again) by the generation scenario, away from the fleet's readings
+GENERATION_PERIOD = (datetime.date(2090, 1, 1), datetime.date(2090, 1, 31))
+
+
+# ===============================================================================================
+# [SCENARIOS] A scenario is what a page of the app requests, in order: (route, path, method, payload) steps.
+# Routes are the path templates, so the results of all the devices / consumptions of a route are aggregated
+#-----------------------------------------------------------------------------------------------
+def dashboard(user, rng):
+    return [("GET /data/getDashboardCounters", "/data/getDashboardCounters", "GET", None),
+            ("GET /data/getDevices", "/data/getDevices", "GET", None),
+            ("GET /data/getAlerts", "/data/getAlerts?unreadAlertsOnly=false&limit=20", "GET", None),
+            ("GET /data/getTotalPowerPerDevice", "/data/getTotalPowerPerDevice", "GET", None),
+            ("GET /data/getAveragePowerPerDevice", "/data/getAveragePowerPerDevice", "GET", None)]
+
+
+def device(user, rng):
+    device_id, consumption_ids = rng.choice(user["devices"])
+    steps = [("GET /data/getDevice/{device_id}", f"/data/getDevice/{device_id}", "GET", None),
+             ("GET /data/getDeviceConsumption/{device_id}", f"/data/getDeviceConsumption/{device_id}", "GET", None),
+             ("GET /data/getDevicePowerReadings/{device_id}", f"/data/getDevicePowerReadings/{device_id}?max_points=1000", "GET", None),
+             ("GET /data/getDeviceAlerts/{device_id}", f"/data/getDeviceAlerts/{device_id}?limit=20", "GET", None)]
+    if consumption_ids:
+        consumption_id = rng.choice(consumption_ids)
+        steps += [("GET /data/getConsumptionPowerReadings/{consumption_id}", f"/data/getConsumptionPowerReadings/{consumption_id}", "GET", None),
+                  ("GET /data/getPeakPowerAnalysis/{consumption_id}", f"/data/getPeakPowerAnalysis/{consumption_id}?readOnly=true", "GET", None)]
+    return steps
+
+
+def statistics_page(user, rng):
+    return [(f"GET /data/{name}", f"/data/{name}", "GET", None) for name in (
+        "getTopTenDevicesByPowerDraw", "getTotalPowerConsumptionByUser", "getUserUsageComparisonByCategory",
+        "getUserConsumptionComparisonByCategory", "getAverageEnergyConsumptionByAgeGroup",
+        "getAverageEnergyConsumptionByGender", "getAverageEnergyConsumptionByCountry")]
+
+
+# A month of readings for one of the user's devices; the client removes the consumption afterwards (untimed),
+# and purge_generated() its rows at the end of the run, so the data set stays the same from run to run
+def generation(user, rng):
+    device_id, _ = rng.choice(user["devices"])
+    start_date, end_date = GENERATION_PERIOD
+    return [("POST /data/addConsumptionPowerReadings", "/data/addConsumptionPowerReadings", "POST",
+             {"device_id": device_id, "start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+              "duration_days": (end_date - start_date).days, "seed": rng.randrange(1 << 30)})]
+
+
+SCENARIOS = {"dashboard": dashboard, "device": device, "statistics": statistics_page, "generation": generation}
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name.strip()}' (one of {', '.join(SCENARIOS)})")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+# ===============================================================================================
+# [SETUP] Fleet, server and users
+#-----------------------------------------------------------------------------------------------
+def seed_fleet(args):
+    print(f"-- Generating the fleet ({args.fleet_users} users x {args.fleet_devices_per_user} devices x {args.fleet_months} months)...")
+    subprocess.run([sys.executable, "-m", "server.database.fleet", "--users", str(args.fleet_users),
+                    "--devices-per-user", str(args.fleet_devices_per_user), "--months", str(args.fleet_months),
+                    "--prefix", args.prefix, "--password", args.password, "--seed", str(args.seed)], check=True)
+
+
+def boot_server(args):
+    env = dict(os.environ)
+    if not args.response_cache:
+        env["RESPONSE_CACHE"] = "off"
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "server.main:app", "--port", str(args.port), "--log-level", "warning"], env=env)
+
+    base_url = f"http://localhost:{args.port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"The API exited on startup (exit code {process.returncode})")
+        try:
+            with urllib.request.urlopen(f"{base_url}/", timeout=2):
+                return process, base_url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("The API did not start within 60s")
+
+
+# Token, devices and their consumptions of each user, through the API
+def fleet_users(base_url, args):
+    users = []
+    for index in range(1, args.users + 1):
+        username = f"{args.prefix}_{index:07d}"
+        try:
+            token = login(base_url, username, args.password)
+        except urllib.error.HTTPError:
+            break
+        session = HttpSession(base_url, token)
+        devices = []
+        for item in json.loads(session.request("/data/getDevices")[2]):
+            consumptions = json.loads(session.request(f"/data/getDeviceConsumption/{item['id']}")[2])
+            devices.append((item["id"], [consumption["consumption_id"] for consumption in consumptions]))
+        session.close()
+        if devices:
+            users.append({"username": username, "token": token, "devices": devices})
+    return users
+
+
+# ===============================================================================================
+# [RUN] Each client loops over scenarios drawn with the mix weights, as one of the users, until the end of the
+# run. A sample is (route, seconds, status, finished at); error statuses and failed requests are samples too
+#-----------------------------------------------------------------------------------------------
+def client_loop(base_url, user, weights, seed, stop, samples):
+    rng = random.Random(seed)
+    session = HttpSession(base_url, user["token"])
+    names, scenario_weights = list(weights), list(weights.values())
+    try:
+        while not stop.is_set():
+            scenario = SCENARIOS[rng.choices(names, scenario_weights)[0]]
+            for route, path, method, payload in scenario(user, rng):
+                if stop.is_set():
+                    break
+                try:
+                    seconds, status, content = session.request(path, method, payload)
+                except Exception:
+                    seconds, status, content = 0.0, 0, b""
+                samples.append((route, seconds, status, time.perf_counter()))
+
+                # Remove the generated consumptions again
+                if method == "POST" and status == 200:
+                    for consumption_id in json.loads(content).get("consumption_ids") or []:
+                        session.request(f"/data/removeConsumption/{consumption_id}", "DELETE")
+    finally:
+        session.close()
+
+
+def route_statistics(samples, duration):
+    latencies = [seconds for _, seconds, status, _ in samples if 200 <= status < 300]
+    result = {"requests": len(samples), "errors": len(samples) - len(latencies), "throughput_rps": len(samples) / duration}
+    if latencies:
+        result.update({"mean_ms": statistics.mean(latencies) * 1000, "p50_ms": percentile(latencies, 50) * 1000,
+                       "p95_ms": percentile(latencies, 95) * 1000, "p99_ms": percentile(latencies, 99) * 1000,
+                       "max_ms": max(latencies) * 1000})
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(base_url, args, users, weights):
+    print(f"-- Running {args.concurrency} clients as {len(users)} users for {args.warmup:g}s warmup + {args.duration:g}s "
+          f"({', '.join(f'{name}={weight:g}' for name, weight in weights.items())})...")
+    stop = threading.Event()
+    samples = []
+    clients = [threading.Thread(target=client_loop, args=(base_url, users[index % len(users)], weights, args.seed * 1000 + index, stop, samples), daemon=True)
+               for index in range(args.concurrency)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    time.sleep(args.warmup)
+    measured_from = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    measured_until = time.perf_counter()
+    for client in clients:
+        client.join()
+
+    measured = [sample for sample in samples if measured_from <= sample[3] <= measured_until]
+    duration = measured_until - measured_from
+    routes = {}
+    for sample in measured:
+        routes.setdefault(sample[0], []).append(sample)
+
+    return {
+        "run": {"started_at": datetime.datetime.now().isoformat(timespec="seconds"), "revision": git_revision(),
+                "concurrency": args.concurrency, "users": len(users), "duration_s": duration, "warmup_s": measured_from - started,
+                "mix": weights, "response_cache": args.response_cache, "seed": args.seed},
+        "total": route_statistics(measured, duration),
+        "routes": {route: route_statistics(route_samples, duration) for route, route_samples in sorted(routes.items())},
+    }
+
+
+# removeConsumption unlinks a consumption from its device, and leaves its readings: delete those of the
+# unlinked consumptions of the generation period
+def purge_generated():
+    start_date, end_date = GENERATION_PERIOD
+    with connector.connection() as conn:
+        with conn.transaction():
+            orphans = """
+                SELECT c.id FROM p.consumption c
+                WHERE c.start_date >= %s AND c.start_date <= %s
+                AND NOT EXISTS (SELECT 1 FROM p.device_consumption dc WHERE dc.consumption_id = c.id)"""
+            for table in ("p.power_reading", "p.alert", "p.alert_evaluation"):
+                conn.execute(f"DELETE FROM {table} WHERE consumption_id IN ({orphans})", (start_date, end_date))
+            conn.execute(f"DELETE FROM p.consumption WHERE id IN ({orphans})", (start_date, end_date))
+    connector.close_pool()
+
+
+# ===============================================================================================
+# [REPORT] Table of the routes, and the comparison with a baseline run
+#-----------------------------------------------------------------------------------------------
+def report(results):
+    print(f"-- {'route':<58} {'requests':>8} {'errors':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for route, result in list(results["routes"].items()) + [("total", results["total"])]:
+        latencies = "".join(f" {result[key]:6.1f}ms" if key in result else f" {'-':>8}" for key in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"-- {route:<58} {result['requests']:8d} {result['errors']:6d} {result['throughput_rps']:7.1f}{latencies}")
+
+
+# Routes whose p95 or p99 grew by more than the tolerance (and min_delta_ms), or which started failing
+def regressions(results, baseline, tolerance, min_delta_ms):
+    found = []
+    for route, result in results["routes"].items():
+        previous = baseline["routes"].get(route)
+        if previous is None:
+            continue
+        if result["errors"] and not previous["errors"]:
+            found.append(f"{route}: {result['errors']} errors (none in the baseline)")
+        for key in ("p95_ms", "p99_ms"):
+            if key in result and key in previous and result[key] > previous[key] * (1 + tolerance) and result[key] - previous[key] > min_delta_ms:
+                found.append(f"{route}: {key[:3]} {previous[key]:.1f}ms -> {result[key]:.1f}ms (+{(result[key] / previous[key] - 1) * 100:.0f}%)")
+    return found
+
+
+def main(args):
+    weights = parse_mix(args.mix)
+    if args.seed_fleet:
+        seed_fleet(args)
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = boot_server(args)
+    try:
+        users = fleet_users(base_url, args)
+        if not users:
+            print(f"-- No fleet users '{args.prefix}_*' with devices found, generate them with --seed-fleet")
+            return 1
+        results = run(base_url, args, users, weights)
+        if weights.get("generation"):
+            purge_generated()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report(results)
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.tolerance, args.min_delta_ms)
+        print(f"-- Compared with {args.baseline} (revision {baseline['run'].get('revision')}): {len(found)} regressions")
+        for regression in found:
+            print(f"---- {regression}")
+        results["baseline"] = {"file": args.baseline, "revision": baseline["run"].get("revision"),
+                               "tolerance": args.tolerance, "min_delta_ms": args.min_delta_ms}
+        results["regressions"] = found
+        status = 1 if found else 0
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"-- Results written to {args.output}")
+    return status
+
+if __name__ == "__main__":
+    raise SystemExit(main(parser.parse_args()))
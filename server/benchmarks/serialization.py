@@ -0,0 +1,67 @@
+import json
+import time
+import argparse
+import datetime
+import collections
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from ..model.serialization import rows_to_json
+
+# Compares the previous convert_to_json path (json.dumps with a custom encoder, json.loads, then FastAPI's
+# own jsonable_encoder + json.dumps of the result) with the single-pass orjson encoder, over synthetic
+# getDevicePowerReadings-shaped rows. No database needed:
+#   python -m server.benchmarks.serialization --rows 100000
+
+parser = argparse.ArgumentParser(description="JSON serialization microbenchmark.")
+parser.add_argument('--rows', type=int, default=100000, help="Rows per result set.")
+parser.add_argument('--repeat', type=int, default=5, help="Repetitions per method (best time is reported).")
+
+KEYS = ["power_reading_id", "consumption_id", "reading_timestamp", "power", "start_date", "end_date"]
+
+
+class ExtendedEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def make_rows(count):
+    start = datetime.datetime(2023, 1, 1)
+    end = start + datetime.timedelta(days=30)
+    return [(i, 1 + i // 720, start + datetime.timedelta(hours=i), Decimal(f"{(i * 37) % 2000}.25"), start, end)
+            for i in range(count)]
+
+
+def triple_pass(result):
+    data = [collections.OrderedDict(zip(KEYS, row)) for row in result]
+    json_data = json.loads(json.dumps(data, cls=ExtendedEncoder))
+    return json.dumps(jsonable_encoder(json_data)).encode()
+
+
+def single_pass(result):
+    return rows_to_json(result, KEYS)
+
+
+def best_time(method, result, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = method(result)
+        timings.append(time.perf_counter() - started)
+    return min(timings), len(payload)
+
+
+def main(args):
+    result = make_rows(args.rows)
+    baseline, baseline_size = best_time(triple_pass, result, args.repeat)
+    optimized, optimized_size = best_time(single_pass, result, args.repeat)
+    print(f"-- convert_to_json + FastAPI: {baseline * 1000:8.1f}ms  ({baseline_size:,} bytes)")
+    print(f"-- orjson single pass:        {optimized * 1000:8.1f}ms  ({optimized_size:,} bytes)")
+    print(f"-- Speedup: {baseline / optimized:.1f}x")
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
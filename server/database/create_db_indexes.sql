@@ -0,0 +1,72 @@
+-- Indexes and constraints of the p schema --
+-- Applied by init.py after the data is loaded (building an index once over the loaded table is much cheaper
+-- than maintaining it row by row during the load). Every statement is idempotent, so the script can be
+-- re-applied to an existing database. Keep in sync with the queries in routers/data/api.py, and check
+-- their plans with: python -m server.database.explain_check
+
+-- Power readings --
+-- Readings of a consumption, in time order (getConsumptionPowerReadings, getDevicePowerReadings and their pages,
+-- downloads, getPeakPowerAnalysis, per-device statistics). INCLUDE (power) makes these index-only scans, and the
+-- uniqueness rejects a reading written twice for the same hour.
+CREATE UNIQUE INDEX IF NOT EXISTS power_reading_consumption_timestamp_idx
+    ON p.power_reading (consumption_id, reading_timestamp) INCLUDE (power);
+
+-- Device - consumption links --
+-- Consumptions of a device (getDeviceConsumption, getDevices counts, removeAllDeviceConsumption, statistics joins)
+CREATE UNIQUE INDEX IF NOT EXISTS device_consumption_device_consumption_idx
+    ON p.device_consumption (device_id, consumption_id);
+-- Device of a consumption (ownership checks, removeConsumption, alert generation)
+CREATE INDEX IF NOT EXISTS device_consumption_consumption_idx
+    ON p.device_consumption (consumption_id) INCLUDE (device_id);
+
+-- Devices --
+-- Devices of a user (getDevices, ownership checks, per-user statistics)
+CREATE INDEX IF NOT EXISTS device_user_username_idx
+    ON p.device (user_username, id) INCLUDE (device_category, device_name);
+-- Foreign key to p.device_type (device type updates / deletes)
+CREATE INDEX IF NOT EXISTS device_device_type_idx
+    ON p.device (device_type);
+
+-- Device types --
+CREATE INDEX IF NOT EXISTS device_type_device_category_idx
+    ON p.device_type (device_category);
+
+-- Alerts --
+-- Alerts of a user, unread first / newest first (getAlerts, removeAlerts, getDashboardCounters). The id is the
+-- tie-breaker of the getAlerts pages, which seek to their (date, id) cursor; replaces the index without it
+DROP INDEX IF EXISTS p.alert_username_read_status_date_idx;
+CREATE INDEX IF NOT EXISTS alert_username_read_status_date_id_idx
+    ON p.alert (username, read_status, date DESC, id DESC);
+-- Pages of all the alerts of a user, newest first (getAlerts with limit)
+CREATE INDEX IF NOT EXISTS alert_username_date_idx
+    ON p.alert (username, date DESC, id DESC);
+-- Alerts of a device, by level (getDevices alert level and counts, removeDeviceAlerts)
+CREATE INDEX IF NOT EXISTS alert_device_type_idx
+    ON p.alert (device_id, type) INCLUDE (read_status);
+-- Alerts of a device, newest first (getDeviceAlerts, and its pages)
+CREATE INDEX IF NOT EXISTS alert_device_date_idx
+    ON p.alert (device_id, date DESC, id DESC);
+-- Alerts of a consumption (removeConsumption, removeAllDeviceConsumption, removeAllUserConsumptions)
+CREATE INDEX IF NOT EXISTS alert_consumption_idx
+    ON p.alert (consumption_id) WHERE consumption_id IS NOT NULL;
+
+-- Jobs --
+-- Claim / lease columns of the job runner, on databases created before them
+ALTER TABLE p.job ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(100);
+ALTER TABLE p.job ADD COLUMN IF NOT EXISTS heartbeat TIMESTAMP WITHOUT TIME ZONE;
+-- Jobs left queued / running, picked up on startup
+CREATE INDEX IF NOT EXISTS job_pending_idx
+    ON p.job (id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS job_username_idx
+    ON p.job (username);
+
+-- Constraints --
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'alert_read_status_check') THEN
+        ALTER TABLE p.alert ADD CONSTRAINT alert_read_status_check CHECK (read_status IN ('Y', 'N'));
+    END IF;
+END $$;
+
+-- Refresh planner statistics --
+ANALYZE p.consumption, p.device, p.device_type, p.device_consumption, p.power_reading, p.alert, p.job;
@@ -58,12 +58,15 @@ CREATE TABLE p.device_consumption (
     consumption_id INT NOT NULL REFERENCES p.consumption(id)
 );
 
+-- Range-partitioned by calendar month of reading_timestamp (partitions p.power_reading_yYYYYmMM),
+-- created on demand by p.ensure_power_reading_partitions() before readings of a new month are written
 CREATE TABLE p.power_reading (
-    id SERIAL PRIMARY KEY NOT NULL,
+    id SERIAL NOT NULL,
     consumption_id INT NOT NULL REFERENCES p.consumption(id),
     reading_timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
-    power NUMERIC(10, 2) NOT NULL
-);
+    power NUMERIC(10, 2) NOT NULL,
+    PRIMARY KEY (id, reading_timestamp)
+) PARTITION BY RANGE (reading_timestamp);
 
 CREATE TABLE p.alert (
     id SERIAL PRIMARY KEY NOT NULL,
@@ -75,11 +78,222 @@ CREATE TABLE p.alert (
     suggestion VARCHAR (512),
     date TIMESTAMP WITHOUT TIME ZONE,
     type CHAR(1),
-    read_status CHAR(1)
+    read_status CHAR(1),
+    alert_rule VARCHAR(20) NULL
+);
+
+-- Alerts of the consumption analysis are upserted, one per (consumption, rule) - see routers/data/alerts.py
+CREATE UNIQUE INDEX alert_consumption_rule_idx ON p.alert (consumption_id, alert_rule) WHERE alert_rule IS NOT NULL;
+
+-- Alert evaluation watermarks: per consumption, the readings evaluated so far (up to evaluated_until) and
+-- their running aggregates, for the device thresholds they were evaluated against. A later analysis only
+-- reads the newer readings, or all of them again when the thresholds have changed
+CREATE TABLE p.alert_evaluation (
+    consumption_id INT PRIMARY KEY NOT NULL REFERENCES p.consumption(id) ON DELETE CASCADE,
+    device_id INT NOT NULL REFERENCES p.device(id) ON DELETE CASCADE,
+    custom_power_min NUMERIC(10, 2),
+    custom_power_max NUMERIC(10, 2),
+    power_alert_threshold NUMERIC(10, 2),
+    energy_alert_threshold NUMERIC(10, 2),
+    evaluated_until TIMESTAMP WITHOUT TIME ZONE,
+    reading_count INT NOT NULL DEFAULT 0,
+    power_sum NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    exceeded_timestamp TIMESTAMP WITHOUT TIME ZONE,
+    exceeded_power NUMERIC(10, 2),
+    warning_timestamp TIMESTAMP WITHOUT TIME ZONE,
+    warning_power NUMERIC(10, 2),
+    evaluated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Per device rollups of power readings, by day and by month, maintained by p.refresh_device_usage() on
+-- ingestion and removal of consumptions. Readings are hourly, so the energy (kWh) is the power sum / 1000.
+-- active_* cover the readings with power > 0 (the average draw while the device is on)
+CREATE TABLE p.device_daily_usage (
+    device_id INT NOT NULL REFERENCES p.device(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    reading_count INT NOT NULL,
+    power_sum NUMERIC(18, 2) NOT NULL,
+    power_max NUMERIC(10, 2) NOT NULL,
+    active_count INT NOT NULL,
+    active_sum NUMERIC(18, 2) NOT NULL,
+    energy_kwh NUMERIC GENERATED ALWAYS AS (power_sum / 1000) STORED,
+    power_avg NUMERIC GENERATED ALWAYS AS (power_sum / NULLIF(reading_count, 0)) STORED,
+    PRIMARY KEY (device_id, day)
+);
+
+CREATE TABLE p.device_monthly_usage (
+    device_id INT NOT NULL REFERENCES p.device(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    reading_count INT NOT NULL,
+    power_sum NUMERIC(18, 2) NOT NULL,
+    power_max NUMERIC(10, 2) NOT NULL,
+    active_count INT NOT NULL,
+    active_sum NUMERIC(18, 2) NOT NULL,
+    energy_kwh NUMERIC GENERATED ALWAYS AS (power_sum / 1000) STORED,
+    power_avg NUMERIC GENERATED ALWAYS AS (power_sum / NULLIF(reading_count, 0)) STORED,
+    PRIMARY KEY (device_id, month)
 );
 
+CREATE TABLE p.job (
+    id SERIAL PRIMARY KEY NOT NULL,
+    username VARCHAR(100) NOT NULL REFERENCES p.user(username) ON DELETE CASCADE,
+    device_id INT NULL REFERENCES p.device(id) ON DELETE CASCADE,
+    kind VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    params JSONB NOT NULL,
+    state JSONB,
+    months_total INT DEFAULT 0,
+    months_done INT DEFAULT 0,
+    readings_written BIGINT DEFAULT 0,
+    consumption_ids INT[] DEFAULT '{}',
+    cancel_requested BOOLEAN DEFAULT FALSE,
+    error VARCHAR(512),
+    claimed_by VARCHAR(100),                        -- runner (host:pid:id) running the job
+    heartbeat TIMESTAMP WITHOUT TIME ZONE,          -- last sign of life of that runner, for its lease
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+);
+
+-- Site-wide statistics --
+-- Materialized from the device usage rollups, and refreshed concurrently (on a schedule and after bulk
+-- ingestion) by the statistics refresher of the API, which records the refresh time in p.statistics_refresh
+CREATE TABLE p.statistics_refresh (
+    view_name VARCHAR(100) PRIMARY KEY NOT NULL,
+    refreshed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+CREATE MATERIALIZED VIEW p.device_power_draw_statistics AS
+    SELECT p.device.device_name, SUM(p.device_monthly_usage.active_sum) / SUM(p.device_monthly_usage.active_count) AS average_power_draw
+    FROM p.device_monthly_usage
+    JOIN p.device ON p.device_monthly_usage.device_id = p.device.id
+    GROUP BY p.device.device_name
+    HAVING SUM(p.device_monthly_usage.active_count) > 0;
+CREATE UNIQUE INDEX device_power_draw_statistics_idx ON p.device_power_draw_statistics (device_name);
+
+CREATE MATERIALIZED VIEW p.user_power_statistics AS
+    SELECT p.user.username, SUM(p.device_monthly_usage.power_sum) AS total_power_consumption
+    FROM p.user
+    JOIN p.device ON p.user.username = p.device.user_username
+    JOIN p.device_monthly_usage ON p.device.id = p.device_monthly_usage.device_id
+    WHERE p.user.visibility = 'public'
+    GROUP BY p.user.username;
+CREATE UNIQUE INDEX user_power_statistics_idx ON p.user_power_statistics (username);
+
+CREATE MATERIALIZED VIEW p.age_group_energy_statistics AS
+    SELECT 
+        CASE
+            WHEN CAST(p.user.age AS INTEGER) BETWEEN 18 AND 25 THEN '18-25'
+            WHEN CAST(p.user.age AS INTEGER) BETWEEN 26 AND 35 THEN '26-35'
+            WHEN CAST(p.user.age AS INTEGER) BETWEEN 36 AND 45 THEN '36-45'
+            WHEN CAST(p.user.age AS INTEGER) BETWEEN 46 AND 55 THEN '46-55'
+            WHEN CAST(p.user.age AS INTEGER) > 55 THEN '55+'
+            ELSE 'Other'
+        END AS age_group,
+        SUM(p.device_monthly_usage.power_sum) / COUNT(DISTINCT p.user.username) / 1000 AS average_total_power_consumption
+    FROM p.user
+    JOIN p.device ON p.user.username = p.device.user_username
+    JOIN p.device_monthly_usage ON p.device.id = p.device_monthly_usage.device_id
+    WHERE p.user.visibility = 'public' AND p.user.age <> ''
+    GROUP BY age_group;
+CREATE UNIQUE INDEX age_group_energy_statistics_idx ON p.age_group_energy_statistics (age_group);
+
+CREATE MATERIALIZED VIEW p.gender_energy_statistics AS
+    SELECT p.user.gender, SUM(p.device_monthly_usage.power_sum) / COUNT(DISTINCT p.user.username) / 1000 AS average_total_power_consumption
+    FROM p.user
+    JOIN p.device ON p.user.username = p.device.user_username
+    JOIN p.device_monthly_usage ON p.device.id = p.device_monthly_usage.device_id
+    WHERE p.user.visibility = 'public' AND p.user.gender <> ''
+    GROUP BY p.user.gender;
+CREATE UNIQUE INDEX gender_energy_statistics_idx ON p.gender_energy_statistics (gender);
+
+CREATE MATERIALIZED VIEW p.country_energy_statistics AS
+    SELECT p.user.country, SUM(p.device_monthly_usage.power_sum) / COUNT(DISTINCT p.user.username) / 1000 AS average_total_power_consumption
+    FROM p.user
+    JOIN p.device ON p.user.username = p.device.user_username
+    JOIN p.device_monthly_usage ON p.device.id = p.device_monthly_usage.device_id
+    WHERE p.user.visibility = 'public' AND p.user.country <> ''
+    GROUP BY p.user.country;
+CREATE UNIQUE INDEX country_energy_statistics_idx ON p.country_energy_statistics (country);
+
+-- Power reading partitions --
+-- Create the missing monthly partitions covering [range_start, range_end], returns the number created.
+-- The advisory lock serializes concurrent writers that reach the same new month
+CREATE FUNCTION p.ensure_power_reading_partitions(range_start TIMESTAMP, range_end TIMESTAMP) RETURNS INT AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', range_start);
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    WHILE month_start <= range_end LOOP
+        partition_name := 'power_reading_' || to_char(month_start, '"y"YYYY"m"MM');
+        IF to_regclass('p.' || partition_name) IS NULL THEN
+            PERFORM pg_advisory_xact_lock(hashtext('p.power_reading'));
+            IF to_regclass('p.' || partition_name) IS NULL THEN
+                EXECUTE format('CREATE TABLE p.%I PARTITION OF p.power_reading FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, month_start, month_start + INTERVAL '1 month');
+                created := created + 1;
+            END IF;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retention: drop the monthly partitions that end on or before the cutoff, returns the dropped partitions
+CREATE FUNCTION p.drop_power_reading_partitions(cutoff TIMESTAMP) RETURNS SETOF TEXT AS $$
+DECLARE
+    partition_name TEXT;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'p.power_reading'::regclass AND c.relname ~ '^power_reading_y\d{4}m\d{2}$'
+            AND to_date(substring(c.relname FROM 'y(\d{4}m\d{2})$'), 'YYYY"m"MM') + INTERVAL '1 month' <= cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('DROP TABLE p.%I', partition_name);
+        RETURN NEXT partition_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Device usage rollups --
+-- Recompute the daily and monthly rollups of a device for the whole months of [range_start, range_end], from
+-- the readings of its consumptions. Idempotent, so the same call serves ingestion and removal; the advisory
+-- lock serializes concurrent refreshes of the same device
+CREATE FUNCTION p.refresh_device_usage(usage_device_id INT, range_start TIMESTAMP, range_end TIMESTAMP) RETURNS VOID AS $$
+DECLARE
+    first_month DATE := date_trunc('month', range_start);
+    end_month DATE := date_trunc('month', range_end) + INTERVAL '1 month';
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('p.device_usage'), usage_device_id);
+
+    DELETE FROM p.device_daily_usage
+    WHERE device_id = usage_device_id AND day >= first_month AND day < end_month;
+
+    INSERT INTO p.device_daily_usage (device_id, day, reading_count, power_sum, power_max, active_count, active_sum)
+    SELECT usage_device_id, p.power_reading.reading_timestamp::date, COUNT(*), SUM(p.power_reading.power), MAX(p.power_reading.power),
+           COUNT(*) FILTER (WHERE p.power_reading.power > 0), COALESCE(SUM(p.power_reading.power) FILTER (WHERE p.power_reading.power > 0), 0)
+    FROM p.device_consumption
+    JOIN p.power_reading ON p.power_reading.consumption_id = p.device_consumption.consumption_id
+    WHERE p.device_consumption.device_id = usage_device_id
+        AND p.power_reading.reading_timestamp >= first_month AND p.power_reading.reading_timestamp < end_month
+    GROUP BY p.power_reading.reading_timestamp::date;
+
+    DELETE FROM p.device_monthly_usage
+    WHERE device_id = usage_device_id AND month >= first_month AND month < end_month;
+
+    INSERT INTO p.device_monthly_usage (device_id, month, reading_count, power_sum, power_max, active_count, active_sum)
+    SELECT usage_device_id, date_trunc('month', day)::date, SUM(reading_count), SUM(power_sum), MAX(power_max), SUM(active_count), SUM(active_sum)
+    FROM p.device_daily_usage
+    WHERE device_id = usage_device_id AND day >= first_month AND day < end_month
+    GROUP BY date_trunc('month', day);
+END;
+$$ LANGUAGE plpgsql;
+
 -- Reset Sequences --
 ALTER SEQUENCE p.device_id_seq RESTART WITH 1;
 ALTER SEQUENCE p.device_consumption_id_seq RESTART WITH 1;
 ALTER SEQUENCE p.power_reading_id_seq RESTART WITH 1;
-ALTER SEQUENCE p.alert_id_seq RESTART WITH 1;
\ No newline at end of file
+ALTER SEQUENCE p.alert_id_seq RESTART WITH 1;
+ALTER SEQUENCE p.job_id_seq RESTART WITH 1;
\ No newline at end of file
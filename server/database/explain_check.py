@@ -0,0 +1,308 @@
+import sys
+import json
+import argparse
+from ..model.dbconnector import PostgresConnector
+from ..routers.data.alerts import ALERT_EVALUATION_QUERY
+
+# Plan regression check for the endpoint queries of routers/data/api.py, against a seeded local database
+# (python -m server.database.init). Every query is run through EXPLAIN with sample parameters of the given
+# user, and the check fails (exit code 1) if a query plans a Seq Scan on one of the big tables, i.e. it is
+# not served by the indexes of create_db_indexes.sql:
+#   python -m server.database.explain_check --username athtech
+#
+# Queries that aggregate over whole tables by design are marked `full_scan` and only reported.
+# Keep the queries in sync with api.py when changing an endpoint (queries shared with api.py, such as
+# ALERT_EVALUATION_QUERY, are imported).
+
+parser = argparse.ArgumentParser(description="Fail if an endpoint query plans a sequential scan on a big table.")
+parser.add_argument('--username', default="athtech", help="User whose devices / consumptions are used as query parameters.")
+parser.add_argument('--min-rows', type=int, default=10000, help="Tables / partitions with at least this many (estimated) rows count as big.")
+parser.add_argument('--device-id', type=int, default=None, help="Device used as query parameter (default: a median-sized device of the user).")
+parser.add_argument('--consumption-id', type=int, default=None, help="Consumption used as query parameter (default: the device's first consumption).")
+parser.add_argument('--verbose', action='store_true', help="Print the plan of every query.")
+
+# define the connector
+connector = PostgresConnector(
+    host="localhost",
+    port=5432,
+    database="postgres",
+    user="postgres",
+    password="password",
+)
+
+# (endpoint, query, parameter names, full_scan)
+QUERIES = [
+    ("getAlerts (unread)", """
+        SELECT p.alert.id, p.alert.title, p.alert.username, p.alert.device_id, p.device.device_type, p.device.device_name, p.alert.description, p.alert.suggestion, p.alert.date, p.alert.type, p.alert.read_status
+        FROM p.alert
+        LEFT JOIN p.device ON p.alert.device_id = p.device.id
+        WHERE p.alert.username = %s AND p.alert.read_status = 'N' ORDER BY (p.alert.read_status = 'N') DESC, p.alert.date DESC""", ["username"], False),
+    ("getAlerts", """
+        SELECT p.alert.id, p.alert.title, p.alert.username, p.alert.device_id, p.device.device_type, p.device.device_name, p.alert.description, p.alert.suggestion, p.alert.date, p.alert.type, p.alert.read_status
+        FROM p.alert
+        LEFT JOIN p.device ON p.alert.device_id = p.device.id
+        WHERE p.alert.username = %s ORDER BY (p.alert.read_status = 'N') DESC, p.alert.date DESC""", ["username"], False),
+    ("getAlerts (page)", """
+        SELECT p.alert.id, p.alert.title, p.alert.username, p.alert.device_id, p.device.device_type, p.device.device_name, p.alert.description, p.alert.suggestion, p.alert.date, p.alert.type, p.alert.read_status
+        FROM p.alert
+        LEFT JOIN p.device ON p.alert.device_id = p.device.id
+        WHERE p.alert.username = %(username)s AND p.alert.date <= %(after_timestamp)s AND (p.alert.date, p.alert.id) < (%(after_timestamp)s, %(after_id)s)
+        ORDER BY p.alert.date DESC, p.alert.id DESC LIMIT %(page_limit)s""", ["username", "after_timestamp", "after_id", "page_limit"], False),
+    ("getAlerts (unread page)", """
+        SELECT p.alert.id, p.alert.title, p.alert.username, p.alert.device_id, p.device.device_type, p.device.device_name, p.alert.description, p.alert.suggestion, p.alert.date, p.alert.type, p.alert.read_status
+        FROM p.alert
+        LEFT JOIN p.device ON p.alert.device_id = p.device.id
+        WHERE p.alert.username = %(username)s AND p.alert.read_status = 'N' AND p.alert.date <= %(after_timestamp)s AND (p.alert.date, p.alert.id) < (%(after_timestamp)s, %(after_id)s)
+        ORDER BY p.alert.date DESC, p.alert.id DESC LIMIT %(page_limit)s""", ["username", "after_timestamp", "after_id", "page_limit"], False),
+    ("getDevices", """
+        SELECT p.device.id, COALESCE(sub_consumption.consumption_count, 0), COALESCE(sub_alerts.unread_alerts_count, 0), COALESCE(sub_alerts.total_alerts_count, 0),
+            CASE
+                WHEN EXISTS (SELECT 1 FROM p.alert WHERE device_id = p.device.id AND p.alert.type = 'C') THEN 'critical'
+                WHEN EXISTS (SELECT 1 FROM p.alert WHERE device_id = p.device.id AND p.alert.type = 'W') THEN 'warning'
+                WHEN EXISTS (SELECT 1 FROM p.alert WHERE device_id = p.device.id AND p.alert.type = 'I') THEN 'info'
+                ELSE 'normal'
+            END AS alert_level
+        FROM p.device
+        LEFT JOIN LATERAL (SELECT COUNT(*) AS consumption_count FROM p.device_consumption
+            WHERE p.device_consumption.device_id = p.device.id) AS sub_consumption ON TRUE
+        LEFT JOIN LATERAL (SELECT COUNT(*) AS total_alerts_count, COUNT(*) FILTER (WHERE read_status = 'N') AS unread_alerts_count
+            FROM p.alert
+            WHERE p.alert.device_id = p.device.id) AS sub_alerts ON TRUE
+        WHERE p.device.user_username = %s""", ["username"], False),
+    ("getDevice", """
+        SELECT p.device.id FROM p.device
+        WHERE p.device.id = %s AND p.device.user_username = %s""", ["device_id", "username"], False),
+    ("getDeviceConsumption", """
+        SELECT p.consumption.id, p.consumption.start_date, p.consumption.end_date
+        FROM p.device
+        JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+        JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+        WHERE p.device.id = %s AND p.device.user_username = %s
+        ORDER BY p.consumption.start_date""", ["device_id", "username"], False),
+    ("getDeviceAlerts", """
+        SELECT p.alert.id, p.device.device_name
+        FROM p.alert
+        JOIN p.device ON p.alert.device_id = p.device.id
+        WHERE p.alert.device_id = %s AND p.device.user_username = %s""", ["device_id", "username"], False),
+    ("getDeviceAlerts (page)", """
+        SELECT p.alert.id, p.device.device_name
+        FROM p.alert
+        JOIN p.device ON p.alert.device_id = p.device.id
+        WHERE p.alert.device_id = %(device_id)s AND p.device.user_username = %(username)s
+            AND p.alert.date <= %(after_timestamp)s AND (p.alert.date, p.alert.id) < (%(after_timestamp)s, %(after_id)s)
+        ORDER BY p.alert.date DESC, p.alert.id DESC LIMIT %(page_limit)s""", ["device_id", "username", "after_timestamp", "after_id", "page_limit"], False),
+    ("getDevicePowerReadings", """
+        SELECT p.power_reading.id, p.power_reading.consumption_id, p.power_reading.reading_timestamp, p.power_reading.power, p.consumption.start_date, p.consumption.end_date
+        FROM p.device
+        JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+        JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+        JOIN p.power_reading ON p.consumption.id = p.power_reading.consumption_id
+            AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+            AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
+        WHERE p.device.id = %s AND p.device.user_username = %s
+        ORDER BY p.power_reading.reading_timestamp""", ["device_id", "username"], False),
+    ("getDevicePowerReadings (page)", """
+        SELECT readings.id, readings.consumption_id, readings.reading_timestamp, readings.power, p.consumption.start_date, p.consumption.end_date
+        FROM p.device
+        JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+        JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+        CROSS JOIN LATERAL (
+            SELECT p.power_reading.id, p.power_reading.consumption_id, p.power_reading.reading_timestamp, p.power_reading.power
+            FROM p.power_reading
+            WHERE p.power_reading.consumption_id = p.consumption.id
+                AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+                AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
+                AND p.power_reading.reading_timestamp >= %(after_timestamp)s
+                AND (p.power_reading.reading_timestamp, p.power_reading.id) > (%(after_timestamp)s, %(after_id)s)
+            ORDER BY p.power_reading.reading_timestamp
+            LIMIT %(page_limit)s
+        ) readings
+        WHERE p.device.id = %(device_id)s AND p.device.user_username = %(username)s
+        ORDER BY readings.reading_timestamp, readings.id
+        LIMIT %(page_limit)s""", ["device_id", "username", "after_timestamp", "after_id", "page_limit"], False),
+    ("downloadAllConsumptionPowerReadings", """
+        SELECT p.power_reading.reading_timestamp, p.power_reading.power
+        FROM p.device
+        JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+        JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+        JOIN p.power_reading ON p.consumption.id = p.power_reading.consumption_id
+            AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+            AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
+        WHERE p.device.id = %s AND p.device.user_username = %s
+        ORDER BY p.power_reading.reading_timestamp""", ["device_id", "username"], False),
+    ("downloadConsumptionPowerReadings", """
+        SELECT p.power_reading.reading_timestamp, p.power_reading.power
+        FROM p.consumption
+        JOIN p.power_reading ON p.consumption.id = p.power_reading.consumption_id
+            AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+            AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
+        WHERE p.consumption.id = %s
+        ORDER BY p.power_reading.reading_timestamp""", ["consumption_id"], False),
+    ("getConsumptionPowerReadings (ownership)", """
+        SELECT date_trunc('month', p.consumption.start_date), date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
+        FROM p.consumption
+        JOIN p.device_consumption ON p.consumption.id = p.device_consumption.consumption_id
+        JOIN p.device ON p.device_consumption.device_id = p.device.id
+        WHERE p.consumption.id = %s AND p.device.user_username = %s""", ["consumption_id", "username"], False),
+    ("getConsumptionPowerReadings", """
+        SELECT p.power_reading.reading_timestamp, p.power_reading.power
+        FROM p.power_reading
+        WHERE p.power_reading.consumption_id = %s
+            AND p.power_reading.reading_timestamp >= %s AND p.power_reading.reading_timestamp < %s
+        ORDER BY p.power_reading.reading_timestamp ASC""", ["consumption_id", "first_month", "end_month"], False),
+    ("getConsumptionPowerReadings (page)", """
+        SELECT p.power_reading.reading_timestamp, p.power_reading.power
+        FROM p.power_reading
+        WHERE p.power_reading.consumption_id = %(consumption_id)s
+            AND p.power_reading.reading_timestamp >= %(first_month)s AND p.power_reading.reading_timestamp < %(end_month)s
+            AND p.power_reading.reading_timestamp > %(after_timestamp)s
+        ORDER BY p.power_reading.reading_timestamp ASC
+        LIMIT %(page_limit)s""", ["consumption_id", "first_month", "end_month", "after_timestamp", "page_limit"], False),
+    ("getPeakPowerAnalysis", ALERT_EVALUATION_QUERY, ["consumption_id", "username"], False),
+    ("removeConsumption (alerts)", """
+        SELECT p.alert.id FROM p.alert
+        WHERE consumption_id IN (
+            SELECT id FROM p.consumption WHERE id = %s AND EXISTS (
+                SELECT 1 FROM p.device
+                JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+                WHERE p.device_consumption.consumption_id = %s AND p.device.user_username = %s))""",
+        ["consumption_id", "consumption_id", "username"], False),
+    ("getDashboardCounters", """
+        SELECT COUNT(DISTINCT device.id), COUNT(DISTINCT consumption.id) , COUNT(DISTINCT alert.id)
+        FROM p.user
+        LEFT JOIN p.device ON p.user.username = p.device.user_username
+        LEFT JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+        LEFT JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+        LEFT JOIN p.alert ON p.user.username = p.alert.username
+        WHERE p.user.username = %s""", ["username"], False),
+
+    # Statistics, from the device usage rollups
+    ("getTotalPowerPerDevice", """
+        SELECT p.device.id, COALESCE(SUM(p.device_monthly_usage.power_sum), 0) / 1000 AS total_power
+        FROM p.device
+        LEFT JOIN p.device_monthly_usage ON p.device.id = p.device_monthly_usage.device_id
+        WHERE p.device.user_username = %s
+        GROUP BY p.device.id, p.device.device_name""", ["username"], False),
+    ("getAveragePowerPerDevice", """
+        SELECT p.device.id, SUM(p.device_monthly_usage.active_sum) / SUM(p.device_monthly_usage.active_count) AS average_power
+        FROM p.device
+        JOIN p.device_monthly_usage ON p.device.id = p.device_monthly_usage.device_id
+        WHERE p.device.user_username = %s
+        GROUP BY p.device.id, p.device.device_name
+        HAVING SUM(p.device_monthly_usage.active_count) > 0""", ["username"], False),
+
+    # Site-wide statistics, from their materialized views
+    ("getTopTenDevicesByPowerDraw", """
+        SELECT device_name, average_power_draw,
+            (SELECT refreshed_at FROM p.statistics_refresh WHERE view_name = 'p.device_power_draw_statistics') AS as_of
+        FROM p.device_power_draw_statistics
+        ORDER BY average_power_draw DESC
+        LIMIT 10""", [], True),
+    ("getTotalPowerConsumptionByUser", """
+        SELECT username, total_power_consumption,
+            (SELECT refreshed_at FROM p.statistics_refresh WHERE view_name = 'p.user_power_statistics') AS as_of
+        FROM p.user_power_statistics
+        ORDER BY total_power_consumption DESC""", [], True),
+]
+
+
+# Sample parameters: the user's device with the median number of consumptions (a device holding most of
+# the table's readings is legitimately read with a Seq Scan), its first consumption, the consumption's months
+# and a page cursor
+def sample_parameters(conn, username, device_id=None, consumption_id=None):
+    result = conn.execute("""
+        WITH devices AS (
+            SELECT p.device.id, MIN(p.device_consumption.consumption_id) AS consumption_id,
+                   ROW_NUMBER() OVER (ORDER BY COUNT(*), p.device.id) AS position, COUNT(*) OVER () AS total
+            FROM p.device
+            JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+            WHERE p.device.user_username = %s AND (%s IS NULL OR p.device.id = %s)
+                AND EXISTS (SELECT 1 FROM p.power_reading WHERE p.power_reading.consumption_id = p.device_consumption.consumption_id)
+            GROUP BY p.device.id
+        )
+        SELECT id, consumption_id FROM devices WHERE position = (total + 1) / 2""", (username, device_id, device_id))
+    if not result:
+        return None
+    params = {"username": username, "device_id": result[0][0], "consumption_id": consumption_id or result[0][1]}
+    months = conn.execute("""
+        SELECT date_trunc('month', start_date), date_trunc('month', end_date) + INTERVAL '1 month'
+        FROM p.consumption WHERE id = %s""", (params["consumption_id"],))
+    params["first_month"], params["end_month"] = months[0]
+    # Cursor of a page in the middle of the consumption, for the paginated queries
+    params["after_timestamp"] = params["first_month"] + (params["end_month"] - params["first_month"]) / 2
+    params["after_id"], params["page_limit"] = 0, 101
+    return params
+
+
+# Big relations, as {relation: table} - a partition (e.g. power_reading_y2024m01) maps to its partitioned
+# table. The size is that of the relation itself, as a Seq Scan reads only the partitions left after pruning:
+# scanning a small partition (e.g. the 49 readings of a month of one consumption) is the right plan
+def big_tables(conn, min_rows):
+    result = conn.execute("""
+        SELECT c.relname, COALESCE(parent.relname, c.relname) AS table_name
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        LEFT JOIN pg_class parent ON parent.oid = i.inhparent
+        WHERE n.nspname = 'p' AND c.relkind = 'r' AND c.reltuples >= %s""", (min_rows,))
+    return {relname: table_name for relname, table_name in result or []}
+
+
+# Walk the plan tree and collect the relations read by sequential scans
+def seq_scans(plan):
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+# Big relations read by sequential scans -> table names, with the partitions scanned
+def scanned_tables(relations, tables):
+    partitions = {}
+    for relation in relations:
+        if relation in tables:
+            partitions.setdefault(tables[relation], set()).add(relation)
+    return [table if partitions[table] == {table} else f"{table} ({', '.join(sorted(partitions[table] - {table}))})"
+            for table in sorted(partitions)]
+
+
+def main(args):
+    failures = 0
+    with connector.connection() as conn:
+        params = sample_parameters(conn, args.username, args.device_id, args.consumption_id)
+        if params is None:
+            print(f"-- No device with power readings found for user '{args.username}', seed the database first.")
+            return 1
+
+        tables = big_tables(conn, args.min_rows)
+        print(f"-- Big tables: {', '.join(sorted(set(tables.values()))) or '(none)'} ({len(tables)} relations)  parameters: {params}")
+
+        for name, query, param_names, full_scan in QUERIES:
+            # Queries with named placeholders (%(name)s) take the parameters by name
+            query_params = {p: params[p] for p in param_names} if "%(" in query else tuple(params[p] for p in param_names)
+            result = conn.execute("EXPLAIN (FORMAT JSON) " + query, query_params)
+            plan = result[0][0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            scanned = scanned_tables(seq_scans(plan[0]["Plan"]), tables)
+
+            if not scanned:
+                status = "ok"
+            elif full_scan:
+                status = f"full scan (allowed): {', '.join(scanned)}"
+            else:
+                status = f"FAIL seq scan on {', '.join(scanned)}"
+                failures += 1
+
+            print(f"---- {name}: {status}")
+            if args.verbose:
+                print(json.dumps(plan[0]["Plan"], indent=2))
+    connector.close_pool()
+
+    print(f"-- {failures} queries fall back to sequential scans" if failures else "-- All endpoint queries use indexes")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parser.parse_args()))
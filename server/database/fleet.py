@@ -0,0 +1,324 @@
+import io
+import time
+import calendar
+import datetime
+import argparse
+import bcrypt
+import psycopg2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from ..model.dbconnector import PostgresConnector, TransactionAbortedError
+from ..model.generator import PowerReadingGenerator
+from ..routers.data.alerts import AlertEvaluator, AlertBatch
+from .init import PhaseTimer, refresh_statistics
+
+# Synthetic fleet for scale testing: N users with random demographics, M devices each drawn from the
+# p.device_type catalog, and K months of hourly readings per device, written as monthly consumptions (as the
+# addConsumptionPowerReadings generator does). Run it on an initialized database (python -m server.database.init):
+#   python -m server.database.fleet --users 100 --devices-per-user 2 --months 6                      # ~10^6 readings
+#   python -m server.database.fleet --users 100000 --devices-per-user 5 --months 24 --workers 8      # ~10^9 readings
+#
+# The fleet is a function of --seed (and --start): a user's demographics, a device's type and its readings do
+# not depend on the number of workers. Only the ids depend on the database, as they are taken from its sequences
+
+def year_month(value):
+    return datetime.datetime.strptime(value, "%Y-%m")
+
+parser = argparse.ArgumentParser(description="Generate a synthetic fleet of users, devices and hourly power readings.")
+parser.add_argument('--users', type=int, default=100, help="Number of users.")
+parser.add_argument('--devices-per-user', type=int, default=3, help="Devices of each user, of distinct types while the catalog allows it.")
+parser.add_argument('--months', type=int, default=12, help="Months of hourly readings per device.")
+parser.add_argument('--start', type=year_month, default=None, help="First month of readings (YYYY-MM); by default the readings end with the last full month.")
+parser.add_argument('--seed', type=int, default=0, help="Seed of the fleet.")
+parser.add_argument('--workers', type=int, default=1, help="Processes generating and loading the readings in parallel.")
+parser.add_argument('--prefix', default="fleet", help="Username prefix of the generated users (<prefix>_0000001, ...).")
+parser.add_argument('--password', default="fleet", help="Password of the generated users.")
+
+# define the connector
+connector = PostgresConnector(
+    host="localhost",
+    port=5432,
+    database="postgres",
+    user="postgres",
+    password="password",
+)
+
+# Readings generated and loaded per task (one transaction), in whole devices
+FLEET_TASK_READINGS = 500000
+
+
+# ===============================================================================================
+# [USERS] Demographics, drawn with the fleet's seed
+#-----------------------------------------------------------------------------------------------
+FIRST_NAMES = ["Maria", "Giorgos", "Eleni", "Nikos", "Anna", "Dimitris", "Sofia", "Kostas", "Emma", "Lucas",
+               "Olivia", "Noah", "Laura", "Marco", "Julia", "Pierre", "Clara", "Jan", "Ana", "David"]
+LAST_NAMES = ["Papadopoulos", "Georgiou", "Nikolaou", "Smith", "Jones", "Muller", "Schmidt", "Rossi", "Bianchi",
+              "Martin", "Bernard", "Garcia", "Fernandez", "de Jong", "Jansen", "Novak", "Kowalski", "Silva", "Brown", "Wilson"]
+GENDERS = (["Male", "Female", "Other"], [0.49, 0.49, 0.02])
+COUNTRIES = (["Greece", "Cyprus", "United Kingdom", "Germany", "France", "Italy", "Spain", "Netherlands", "Poland",
+              "Portugal", "Ireland", "United States"],
+             [0.30, 0.05, 0.10, 0.12, 0.09, 0.08, 0.07, 0.05, 0.04, 0.03, 0.02, 0.05])
+VISIBILITIES = (["public", "private"], [0.7, 0.3])
+NOTIFICATIONS = (["on", "off"], [0.6, 0.4])
+
+USER_COLUMNS = ("username", "email", "password", "first_name", "last_name", "age", "gender", "country", "visibility", "notifications")
+
+def draw(rng, choices, size):
+    values, weights = choices
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size, p=weights)]
+
+# Users as rows of USER_COLUMNS. Ages are adults, centered on 45
+def fleet_users(rng, users, prefix, password_hash):
+    usernames = [f"{prefix}_{index:07d}" for index in range(1, users + 1)]
+    ages = np.clip(np.rint(rng.normal(45, 15, users)), 18, 90).astype(int)
+    columns = (draw(rng, (FIRST_NAMES, None), users), draw(rng, (LAST_NAMES, None), users), ages,
+               draw(rng, GENDERS, users), draw(rng, COUNTRIES, users), draw(rng, VISIBILITIES, users), draw(rng, NOTIFICATIONS, users))
+    return [(username, f"{username}@example.com", password_hash, *values) for username, *values in zip(usernames, *columns)]
+
+
+# ===============================================================================================
+# [DEVICES] Catalog draws. Each user gets devices_per_user distinct types (all of them again, reshuffled, once
+# the catalog is exhausted); the device takes the power range and category of its type, as the dataset devices do
+#-----------------------------------------------------------------------------------------------
+DEVICE_COLUMNS = ("id", "user_username", "device_type", "device_category", "device_name", "custom_power_min", "custom_power_max")
+
+# Catalog index of every device, user by user, as an array (users, devices_per_user)
+def fleet_device_types(rng, users, devices_per_user, catalog_size):
+    rounds = -(-devices_per_user // catalog_size)
+    draws = np.concatenate([rng.random((users, catalog_size)).argsort(axis=1) for _ in range(rounds)], axis=1)
+    return draws[:, :devices_per_user]
+
+
+# ===============================================================================================
+# [READINGS] Fixed-width COPY text of power readings, built with array operations
+#
+# Every reading becomes a 43-byte line: the consumption id zero-padded to 10 digits, the timestamp, and the power
+# with 8 integer digits and 2 decimals (leading zeros are valid input of INT and NUMERIC). A block of readings
+# is formatted in a few array operations, instead of one Python format per value
+#-----------------------------------------------------------------------------------------------
+READING_LINE = 43
+
+def digits(values, width):
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    return (values[:, None] // powers % 10 + 48).astype(np.uint8)
+
+# Hourly timestamps -> (hours, 19) bytes of "YYYY-MM-DD HH:MM:SS"
+def timestamp_bytes(timestamps):
+    text = np.frombuffer("".join(np.datetime_as_string(timestamps, unit='s')).encode(), dtype=np.uint8).reshape(-1, 19).copy()
+    text[:, 10] = ord(" ")
+    return text
+
+# Readings of a task as (consumption ids, timestamp bytes, power in hundredths of W) arrays -> COPY text
+def reading_copy_block(consumption_ids, timestamps, cents):
+    lines = np.empty((len(cents), READING_LINE), dtype=np.uint8)
+    lines[:, 0:10] = digits(consumption_ids, 10)
+    lines[:, 10] = ord("\t")
+    lines[:, 11:30] = timestamps
+    lines[:, 30] = ord("\t")
+    lines[:, 31:39] = digits(cents // 100, 8)
+    lines[:, 39] = ord(".")
+    lines[:, 40:42] = digits(cents % 100, 2)
+    lines[:, 42] = ord("\n")
+    return io.BytesIO(lines.tobytes())
+
+
+# Months of the fleet -> [(interval_start, interval_end)], whole calendar months as monthly_intervals() of the API yields them
+def fleet_months(start, months):
+    intervals = []
+    for index in range(months):
+        year, month = divmod(start.year * 12 + start.month - 1 + index, 12)
+        first = datetime.datetime(year, month + 1, 1)
+        intervals.append((first, first.replace(day=calendar.monthrange(first.year, first.month)[1], hour=23, minute=59, second=59)))
+    return intervals
+
+
+# ===============================================================================================
+# [TASK] Generate and load the readings of a range of devices, in one transaction: their monthly consumptions
+# and links, a single COPY of the readings, their alerts and their usage rollups. Runs in the worker processes
+#-----------------------------------------------------------------------------------------------
+CONSUMPTION_COLUMNS = ("id", "start_date", "end_date", "duration_days", "device_type", "device_category", "device_name", "files_names", "power_max", "energy_max")
+
+def load_fleet_task(task):
+    timer = PhaseTimer()
+    started = time.perf_counter()
+    seed, intervals, devices, first_consumption_id = task
+    consumption_rows, link_rows, evaluators = [], [], []
+    consumption_ids, timestamps, cents = [], [], []
+
+    with timer.phase("generation"):
+        month_timestamps = [None] * len(intervals)
+        consumption_id = first_consumption_id
+        for device_index, device_id, username, (type_name, category, power_min, power_max, pattern) in devices:
+            # Each device has its own random stream, so its readings do not depend on how devices are split into tasks
+            generator = PowerReadingGenerator(power_min, power_max, pattern, np.random.default_rng([seed, 2, device_index]))
+            file_prefix = type_name.lower().replace(" ", "_")
+            for month_index, (interval_start, interval_end) in enumerate(intervals):
+                hour_timestamps, power = generator.generate(interval_start, interval_end)
+                if month_timestamps[month_index] is None:
+                    month_timestamps[month_index] = timestamp_bytes(hour_timestamps)
+                power_cents = np.rint(power * 100).astype(np.int64)
+
+                consumption_rows.append((consumption_id, interval_start, interval_end, (interval_end - interval_start).days + 1, type_name, category, type_name,
+                                         f"{file_prefix}_{interval_start:%d%m%Y}_{interval_end:%d%m%Y}.csv",
+                                         f"{int(power_cents.max()) / 100:.2f}", f"{int(power_cents.sum()) / 100000:.2f}"))
+                link_rows.append((device_id, consumption_id))
+                consumption_ids.append(np.full(power.size, consumption_id, dtype=np.int64))
+                timestamps.append(month_timestamps[month_index])
+                cents.append(power_cents)
+
+                evaluator = AlertEvaluator(username, consumption_id, device_id, power_min, power_max, 0, 0)
+                evaluator.update(hour_timestamps, power)
+                evaluators.append(evaluator)
+                consumption_id += 1
+
+    with timer.phase("formatting"):
+        block = reading_copy_block(np.concatenate(consumption_ids), np.concatenate(timestamps), np.concatenate(cents))
+        readings = sum(len(values) for values in cents)
+        del consumption_ids, timestamps, cents
+
+    alert_batch = AlertBatch()
+    try:
+        connector.connect()
+        with connector.transaction(synchronous_commit=False):
+            with timer.phase("copy consumptions"):
+                connector.copy_rows("p.consumption", CONSUMPTION_COLUMNS, consumption_rows)
+                connector.copy_rows("p.device_consumption", ("device_id", "consumption_id"), link_rows)
+
+            with timer.phase("copy readings"):
+                connector.copy_rows("p.power_reading", ("consumption_id", "reading_timestamp", "power"), block, buffer_size=1 << 20)
+
+            with timer.phase("alerts"):
+                for evaluator in evaluators:
+                    alert_batch.add(evaluator.result())
+                    if alert_batch.full():
+                        alert_batch.flush(connector)
+                alert_batch.flush(connector)
+
+            # Rollups of the task's devices, which are new: one set-based INSERT per table, with the aggregates of
+            # p.refresh_device_usage()
+            with timer.phase("usage rollups"):
+                params = {"first_device": devices[0][1], "last_device": devices[-1][1], "first_consumption": first_consumption_id,
+                          "last_consumption": consumption_id - 1, "start": intervals[0][0], "end": intervals[-1][1]}
+                connector.execute("""
+                    INSERT INTO p.device_daily_usage (device_id, day, reading_count, power_sum, power_max, active_count, active_sum)
+                    SELECT p.device_consumption.device_id, p.power_reading.reading_timestamp::date, COUNT(*), SUM(p.power_reading.power), MAX(p.power_reading.power),
+                           COUNT(*) FILTER (WHERE p.power_reading.power > 0), COALESCE(SUM(p.power_reading.power) FILTER (WHERE p.power_reading.power > 0), 0)
+                    FROM p.device_consumption
+                    JOIN p.power_reading ON p.power_reading.consumption_id = p.device_consumption.consumption_id
+                    WHERE p.device_consumption.consumption_id BETWEEN %(first_consumption)s AND %(last_consumption)s
+                        AND p.power_reading.reading_timestamp >= %(start)s AND p.power_reading.reading_timestamp <= %(end)s
+                    GROUP BY p.device_consumption.device_id, p.power_reading.reading_timestamp::date""", params)
+                connector.execute("""
+                    INSERT INTO p.device_monthly_usage (device_id, month, reading_count, power_sum, power_max, active_count, active_sum)
+                    SELECT device_id, date_trunc('month', day)::date, SUM(reading_count), SUM(power_sum), MAX(power_max), SUM(active_count), SUM(active_sum)
+                    FROM p.device_daily_usage
+                    WHERE device_id BETWEEN %(first_device)s AND %(last_device)s
+                    GROUP BY device_id, date_trunc('month', day)""", params)
+        error = None
+    except (psycopg2.Error, TransactionAbortedError) as e:
+        error, readings = f"Error loading devices {devices[0][1]}-{devices[-1][1]}: {e}", 0
+    finally:
+        connector.disconnect()
+
+    return len(devices), readings, alert_batch.alerts_written if error is None else 0, error, timer.seconds, time.perf_counter() - started
+
+
+# ===============================================================================================
+# [FLEET] Users and devices in one transaction, then the tasks, on a pool of `workers` processes (or inline)
+#-----------------------------------------------------------------------------------------------
+def main(args):
+    timer = PhaseTimer()
+    started = time.perf_counter()
+    if args.start is None:
+        today = datetime.date.today()
+        year, month = divmod(today.year * 12 + today.month - 1 - args.months, 12)
+        args.start = datetime.datetime(year, month + 1, 1)
+    intervals = fleet_months(args.start, args.months)
+    hours_per_device = sum((end - start).days + 1 for start, end in intervals) * 24
+    devices_total = args.users * args.devices_per_user
+    print(f"-- Generating {args.users} users, {devices_total} devices and {devices_total * hours_per_device} hourly readings "
+          f"({intervals[0][0]:%Y-%m} to {intervals[-1][0]:%Y-%m}), with {args.workers} worker(s)...")
+
+    try:
+        connector.connect()
+        with timer.phase("users and devices"):
+            catalog = connector.execute("SELECT type_name, device_category, power_min, power_max, power_draw_pattern FROM p.device_type ORDER BY type_name")
+            if not catalog:
+                print("-- The device type catalog is empty, initialize the database first (python -m server.database.init --no-data)")
+                return
+
+            password_hash = bcrypt.hashpw(args.password.encode(), bcrypt.gensalt()).decode()
+            users = fleet_users(np.random.default_rng([args.seed, 0]), args.users, args.prefix, password_hash)
+            device_types = fleet_device_types(np.random.default_rng([args.seed, 1]), args.users, args.devices_per_user, len(catalog))
+
+            with connector.transaction():
+                connector.copy_rows("p.user", USER_COLUMNS, users)
+
+                # Reserve the ids of the devices and consumptions, so the tasks can write them without a round trip
+                first_device_id = connector.execute("SELECT setval('p.device_id_seq', nextval('p.device_id_seq') + %s - 1) - %s + 1",
+                                                    (devices_total, devices_total))[0][0]
+                first_consumption_id = connector.execute("SELECT setval('p.consumption_id_seq', nextval('p.consumption_id_seq') + %s - 1) - %s + 1",
+                                                         (devices_total * args.months, devices_total * args.months))[0][0]
+
+                devices = [(index, first_device_id + index, users[index // args.devices_per_user][0], catalog[type_index])
+                           for index, type_index in enumerate(device_types.ravel().tolist())]
+                connector.copy_rows("p.device", DEVICE_COLUMNS, [(device_id, username, type_name, category, type_name, power_min, power_max)
+                                                                 for _, device_id, username, (type_name, category, power_min, power_max, _) in devices])
+                connector.ensure_power_reading_partitions(intervals[0][0], intervals[-1][1])
+            print(f"---- Created {len(users)} users and {len(devices)} devices")
+    except (psycopg2.Error, TransactionAbortedError) as e:
+        print(f"Database error: {e}")
+        return
+    finally:
+        connector.disconnect()
+
+    # Tasks of whole devices, about FLEET_TASK_READINGS readings each
+    devices_per_task = max(1, FLEET_TASK_READINGS // hours_per_device)
+    tasks = [(args.seed, intervals, devices[start:start + devices_per_task], first_consumption_id + start * args.months)
+             for start in range(0, len(devices), devices_per_task)]
+
+    devices_loaded, readings_loaded, alerts_written = 0, 0, 0
+    load_started = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        results = executor.map(load_fleet_task, tasks) if executor else map(load_fleet_task, tasks)
+        for devices_done, readings, alerts, error, seconds, task_seconds in results:
+            for phase, phase_seconds in seconds.items():
+                timer.add(f"{phase} (worker time)", phase_seconds)
+            if error:
+                print(error)
+                continue
+            devices_loaded += devices_done
+            readings_loaded += readings
+            alerts_written += alerts
+            elapsed = time.perf_counter() - load_started
+            print(f"-- Progress: {devices_loaded}/{len(devices)} devices, {readings_loaded} readings ({readings_loaded / elapsed:.0f} readings/sec)", end='\r')
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    print()
+    timer.add("generation and load", time.perf_counter() - load_started)
+
+    try:
+        connector.connect()
+        with timer.phase("analyze"):
+            connector.execute("ANALYZE p.user, p.device, p.consumption, p.device_consumption, p.power_reading, p.device_daily_usage, p.device_monthly_usage")
+            connector.commit()
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        connector.disconnect()
+
+    with timer.phase("statistics"):
+        refresh_statistics(connector)
+
+    elapsed = time.perf_counter() - started
+    print(f"-- Loaded {readings_loaded} hourly readings of {devices_loaded} devices ({alerts_written} alerts) in {elapsed:.2f}s "
+          f"({readings_loaded / elapsed if elapsed else 0:.0f} readings/sec)")
+    timer.report()
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+    main(args)
@@ -3,9 +3,15 @@ import random
 import bcrypt
 import psycopg2
 import os
-import pandas as pd
-from psycopg2 import extras
-from ..model.dbconnector import PostgresConnector
+import time
+import itertools
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from ..model.dbconnector import PostgresConnector, TransactionAbortedError
+from ..routers.data.statistics import STATISTICS_VIEWS
+from ..routers.data.alerts import AlertEvaluator, AlertBatch
+from ..model.resampling import RESAMPLE_CHUNK_SIZE, resample_csv_chunks
 
 # define the connector
 connector = PostgresConnector(
@@ -18,10 +24,10 @@ connector = PostgresConnector(
 
 parser = argparse.ArgumentParser(description="Initialize the database with optional data loading.")
 parser.add_argument('--no-data', action='store_true', help="Skip loading data into the database.")
-args = parser.parse_args()
+parser.add_argument('--workers', type=int, default=1, help="Processes resampling the power reading files in parallel.")
 
 # Initialization
-def init(no_data: bool):
+def init(no_data: bool, workers: int = 1):
 
     create_database_schema('create_db_schema.sql', connector)
     create_device_type_table(connector)
@@ -31,12 +37,11 @@ def init(no_data: bool):
     else:
         try:
             create_test_user(connector)
-            populate_consumption_table('consumption.csv', connector)
-            populate_device_table('consumption.csv', connector)
-            populate_device_consumption_table('consumption.csv', connector)
-            populate_power_reading_table(connector)
+            load_seed_data('consumption.csv', connector)
+            populate_power_reading_table(connector, workers)
             #generate_alert_table(connector, 'athtech')
             update_device_power_limits(connector)
+            evaluate_seeded_alerts(connector)
             print("-- Data loaded successfully!")
             print("-- Database initialization finished!\n")
         except Exception as e:
@@ -45,6 +50,12 @@ def init(no_data: bool):
     # Alter the consumption table to use SERIAL for the id column regardless of data loading
     alter_consumption_table_to_serial(connector)
 
+    # Create the indexes and constraints once the data is in place
+    create_database_indexes('create_db_indexes.sql', connector)
+
+    # Materialize the site-wide statistics of the loaded data
+    refresh_statistics(connector)
+
 # [SCHEMA] Create the db schema
 def create_database_schema(sql_file, conn):
 
@@ -58,6 +69,7 @@ def create_database_schema(sql_file, conn):
             sql_script = f.read()
 
         connector.execute(sql_script)
+        connector.commit()
 
         print(f"-- Creating database schema...")
     except psycopg2.Error as e:
@@ -66,6 +78,49 @@ def create_database_schema(sql_file, conn):
         connector.disconnect()
 
 
+# [INDEXES] Create the indexes and constraints of the db schema, and refresh planner statistics
+#-----------------------------------------------------------------------------------------------
+def create_database_indexes(sql_file, conn):
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sql_file = os.path.join(current_dir, sql_file)
+
+    try:
+        conn.connect()
+        print(f"-- Creating database indexes...")
+
+        with open(sql_file, 'r') as f:
+            sql_script = f.read()
+
+        conn.execute(sql_script)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error executing SQL script '{sql_file}': {e}")
+    finally:
+        conn.disconnect()
+
+
+# [STATISTICS] Refresh the site-wide statistics views (p.*_statistics)
+#-----------------------------------------------------------------------------------------------
+def refresh_statistics(conn):
+    try:
+        conn.connect()
+        print(f"-- Refreshing statistics...")
+
+        for view in STATISTICS_VIEWS:
+            conn.execute(f"REFRESH MATERIALIZED VIEW {view}")
+            conn.execute("""
+                INSERT INTO p.statistics_refresh (view_name, refreshed_at) VALUES (%s, clock_timestamp())
+                ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at""", (view,))
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error refreshing statistics: {e}")
+    finally:
+        conn.disconnect()
+
+
 # [TEST USER] Create a test user
 #-----------------------------------------------------------------------------------------------
 def create_test_user(conn):
@@ -89,48 +144,64 @@ def create_test_user(conn):
         conn.disconnect()
 
 
-# [CONSUMPTION] Populate the consumption table (p.consumption)
+# [SEED DATA] Load the consumptions of the dataset and their devices from consumption.csv
+#
+# The file is streamed with COPY into a staging table (consumption_seed, dropped on commit), then the
+# consumption, device and device_consumption tables are filled from it with one INSERT ... SELECT each, the
+# device types joined in SQL - three statements in a single transaction, whatever the number of lines.
+# Lines with an empty value are skipped
 #-----------------------------------------------------------------------------------------------
-def populate_consumption_table(data_file, conn):
-    try:
-        conn.connect()
-
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        data_file_path = os.path.join(current_dir, data_file)
-
-        with open(data_file_path, 'r') as data_file:
-            data_file.readline()
-            
-            lines = data_file.readlines()
-            total_lines = len(lines)
-            completed_lines = 0
-
-            print("-- Populating consumption table...")
-            for line in lines:
-                values = line.strip().split(',')
-                if '' in values:
-                    continue
-                conn.execute("""
-                    INSERT INTO p.consumption (id,start_date,end_date,duration_days,device_type,device_category,device_name,files_names,power_max)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
-                """, values)
+SEED_COLUMNS = ("id", "start_date", "end_date", "duration_days", "device_type", "device_category", "device_name", "files_names", "power_max")
+
+def seed_rows(data_file_path):
+    with open(data_file_path, 'r') as data_file:
+        data_file.readline()  # Skip the header line
+        for line in data_file:
+            values = line.strip().split(',')
+            if '' in values:
+                continue
+            yield values
 
-                completed_lines += 1
-                percentage = (completed_lines / total_lines) * 100
-                print(f"-- Progress: {percentage:.2f}%", end='\r')
-                if completed_lines == total_lines:
-                    print()
 
-            conn.commit()
+def load_seed_data(data_file, conn):
+    started = time.perf_counter()
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    data_file_path = os.path.join(current_dir, data_file)
 
+    try:
+        conn.connect()
+        with conn.transaction(synchronous_commit=False):
+            conn.execute("""
+                CREATE TEMPORARY TABLE consumption_seed (
+                    id INT, start_date TIMESTAMP, end_date TIMESTAMP, duration_days NUMERIC(3, 1), device_type VARCHAR(255),
+                    device_category VARCHAR(255), device_name TEXT, files_names VARCHAR(255), power_max NUMERIC(10, 2)
+                ) ON COMMIT DROP""")
+            staged = conn.copy_rows("consumption_seed", SEED_COLUMNS, seed_rows(data_file_path))
+            conn.execute("ANALYZE consumption_seed")
+            print(f"-- Staged {staged} consumptions from '{data_file}'...")
+
+            populate_consumption_table(conn)
+            populate_device_table(conn)
+            populate_device_consumption_table(conn)
+
+        print(f"-- Seed data loaded in {time.perf_counter() - started:.2f}s")
     except FileNotFoundError:
         print(f"File not found: '{data_file_path}'. Please make sure the file exists in the specified location.")
-    except psycopg2.Error as e:
-        conn.rollback()
+    except (psycopg2.Error, TransactionAbortedError) as e:
         print(f"Error executing query: {e}")
     finally:
         conn.disconnect()
 
+
+# [CONSUMPTION] Populate the consumption table (p.consumption) from the staged lines
+#-----------------------------------------------------------------------------------------------
+def populate_consumption_table(conn):
+    print("-- Populating consumption table...")
+    conn.execute("""
+        INSERT INTO p.consumption (id, start_date, end_date, duration_days, device_type, device_category, device_name, files_names, power_max)
+        SELECT id, start_date, end_date, duration_days, device_type, device_category, device_name, files_names, power_max
+        FROM consumption_seed""")
+
 def alter_consumption_table_to_serial(conn):
     try:
         conn.connect()
@@ -190,190 +261,208 @@ def create_device_type_table(conn):
             ('Electric Water Heater (Tankless)', 'Other', 6600, 8800, 'Continuous'),
             ('Humidifier', 'Other', 175, 300, 'Occasional');
             """)
+        conn.commit()
     except psycopg2.Error as e:
         conn.rollback()
         print(f"Error executing query: {e}")
     finally:
         conn.disconnect()
 
-# [DEVICES] Populate the devices table (p.device)
+# [DEVICES] Populate the devices table (p.device), one device of the test user per distinct (type, category,
+# name) of the staged lines, with the power limits of its type. Types missing from p.device_type are skipped
 #-----------------------------------------------------------------------------------------------
-def populate_device_table(data_file, conn):
-    try:
-        conn.connect()
-
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        data_file_path = os.path.join(current_dir, data_file)
-
-        with open(data_file_path, 'r') as data_file:
-            data_file.readline()  # Skip the header line
-            
-            unique_devices = set()
-            for line in data_file:
-                values = line.strip().split(',')
-                if '' in values:
-                    continue
-                device_name = values[6]
-                device_category = values[5]
-                device_type_text = values[4]
-                unique_devices.add((device_type_text, device_category, device_name))
-
-            print("-- Populating device table...")
-            for device in unique_devices:
-                type_name_query = "SELECT p.device_type.type_name, p.device_type.power_min, p.device_type.power_max FROM p.device_type WHERE p.device_type.type_name = %s"
-                type_name_results = connector.execute(type_name_query, (device[0],))
-                
-                 # Initialize default values
-                type_name = None
-                power_min = None
-                power_max = None
-
-                if type_name_results:
-                    type_name, power_min, power_max = type_name_results[0]
-
-                insert_query = """
-                    INSERT INTO p.device (user_username, device_type, device_category, device_name, custom_power_min, custom_power_max)
-                    VALUES (%s, %s, %s, %s, %s, %s);
-                    """
-                insert_values = ('athtech', type_name, device[1], device[2], power_min, power_max)
-                conn.execute(insert_query, insert_values)
-        
-            conn.commit()
-
-    except FileNotFoundError:
-        print(f"File not found: '{data_file_path}'. Please make sure the file exists in the specified location.")
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error executing query: {e}")
-    finally:
-        conn.disconnect()
-
-
-# [DEVICE - CONSUMPTION] Populate the device-consumption linking table (p.device_consumption)
+def populate_device_table(conn):
+    print("-- Populating device table...")
+    conn.execute("""
+        INSERT INTO p.device (user_username, device_type, device_category, device_name, custom_power_min, custom_power_max)
+        SELECT 'athtech', p.device_type.type_name, seed.device_category, seed.device_name, p.device_type.power_min, p.device_type.power_max
+        FROM (SELECT DISTINCT device_type, device_category, device_name FROM consumption_seed) AS seed
+        JOIN p.device_type ON p.device_type.type_name = seed.device_type
+        ORDER BY seed.device_name, seed.device_category, seed.device_type""")
+
+    skipped = conn.execute("""
+        SELECT DISTINCT device_type FROM consumption_seed
+        WHERE NOT EXISTS (SELECT 1 FROM p.device_type WHERE p.device_type.type_name = consumption_seed.device_type)""")
+    for (device_type,) in skipped or []:
+        print(f"---- Unknown device type '{device_type}', its devices were skipped")
+
+
+# [DEVICE - CONSUMPTION] Populate the device-consumption linking table (p.device_consumption), linking each
+# staged consumption to the device created for its line
 #-----------------------------------------------------------------------------------------------
-def populate_device_consumption_table(data_file, conn):
-    try:
-        conn.connect()
-
-        # Fetch the device IDs from the database
-        device_ids = conn.execute("SELECT id, device_name FROM p.device;")
-        device_name_to_id = {name: id for id, name in device_ids}
-
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        data_file_path = os.path.join(current_dir, data_file)
-
-        with open(data_file_path, 'r') as data_file:
-            data_file.readline() 
-            
-            print("-- Populating device consumption table...")
-            for line in data_file:
-                values = line.strip().split(',')
-                if '' in values:
-                    continue
-                device_name = values[6] 
-                consumption_id = values[0]
-                device_id = device_name_to_id.get(device_name)
-                if device_id:
-                    conn.execute("""
-                        INSERT INTO p.device_consumption (device_id, consumption_id)
-                        VALUES (%s, %s);
-                    """, (device_id, consumption_id))
-
-            conn.commit()
-
-    except FileNotFoundError:
-        print(f"File not found: '{data_file_path}'. Please make sure the file exists in the specified location.")
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error executing query: {e}")
-    finally:
-        conn.disconnect()
+def populate_device_consumption_table(conn):
+    print("-- Populating device consumption table...")
+    conn.execute("""
+        INSERT INTO p.device_consumption (device_id, consumption_id)
+        SELECT p.device.id, consumption_seed.id
+        FROM consumption_seed
+        JOIN p.device ON p.device.user_username = 'athtech' AND p.device.device_type = consumption_seed.device_type
+            AND p.device.device_category = consumption_seed.device_category AND p.device.device_name = consumption_seed.device_name
+        ORDER BY consumption_seed.id""")
 
 # [RE-SAMPLING] Resample the readings per second to readings per day, due to data size for performance reasons
 #-----------------------------------------------------------------------------------------------
-def process_csv_file(file_path):
-    df = pd.read_csv(file_path)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df.set_index('timestamp', inplace=True)
-
-    # Remove zero values
-    #df_non_zero = df[df['power'] != 0]
+# Per-second plug csv file -> hourly mean power, hours without readings taking the previous hour's value, as
+# (timestamps datetime64[s] UTC, power float64) arrays, one pair per chunk read. The file is read chunk_size
+# rows at a time, the partial hour at the end of a chunk carried into the next one, so memory does not grow with
+# the length of the file. Same parsing and resampler as the importReadings endpoint (see model/resampling.py,
+# and server/tests/test_resampling.py for the comparison with a whole-file pandas resample)
+def process_csv_file(file_path, chunk_size=RESAMPLE_CHUNK_SIZE):
+    return resample_csv_chunks(file_path, chunk_size)
+
+
+# Phase timings of the loader - wall time per phase, summed over the files / batches
+class PhaseTimer:
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
 
-    # Outlier detection for low outliers only
-    #q1 = df_non_zero['power'].quantile(0.25)
-    #lower_bound = q1 - 1.5 * (q1 - df_non_zero['power'].quantile(0.05))
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
 
-    # Filter out low outliers
-    #filtered_df = df_non_zero[df_non_zero['power'] >= lower_bound]
+    def report(self):
+        for name, seconds in self.seconds.items():
+            print(f"---- {name:<28} {seconds:9.2f}s")
 
-    # Resample and calculate the mean
-    resampled_df = df.resample('1H').mean().fillna(method='ffill')  # Forward fill for NaN values
 
-    resampled_df.reset_index(inplace=True)
-    readings = resampled_df.values.tolist()
-    return readings
+# Worker of the loader (runs in the process pool with --workers > 1): resample a consumption file and reduce it
+# to what the writer needs - hourly timestamps and power as arrays, the maximum power and the total energy.
+# Returns (consumption_id, readings, error, seconds), readings being None if the file could not be read
+def resample_consumption_file(task):
+    consumption_id, data_file_path = task
+    started = time.perf_counter()
+    try:
+        chunks = list(process_csv_file(data_file_path))
+    except FileNotFoundError:
+        return consumption_id, None, f"File not found: '{data_file_path}'. Skipping.", time.perf_counter() - started
+
+    # Hourly arrays are small (24 readings a day) - only the per-second rows had to be streamed
+    timestamps = np.concatenate([chunk[0] for chunk in chunks]) if chunks else np.empty(0, dtype='datetime64[s]')
+    power = np.concatenate([chunk[1] for chunk in chunks]) if chunks else np.empty(0)
+
+    # Energy (kWh) of the hourly readings accumulates over the file, and the maximum power / energy start at 0
+    max_power = max(float(power.max()), 0.0) if power.size else 0.0
+    max_energy = max(float(np.cumsum(power).max()) / 1000, 0.0) if power.size else 0.0
+    return consumption_id, (timestamps, power, max_power, max_energy), None, time.perf_counter() - started
+
+
+# Write a batch of resampled files in one transaction: a single COPY of all their readings, one UPDATE of the
+# consumptions' max values and one rollup refresh per device
+def write_power_reading_batch(connector, batch, timer):
+    with connector.transaction(synchronous_commit=False):
+        with timer.phase("partitions"):
+            connector.ensure_power_reading_partitions(min(item["timestamps"][0] for item in batch).item(),
+                                                      max(item["timestamps"][-1] for item in batch).item())
+
+        with timer.phase("copy"):
+            connector.copy_power_readings(itertools.chain.from_iterable(
+                zip(itertools.repeat(item["consumption_id"]), item["timestamps"].tolist(), item["power"].tolist()) for item in batch))
+
+        with timer.phase("consumption max values"):
+            connector.execute(f"""
+                UPDATE p.consumption SET energy_max = v.energy_max, power_max = v.power_max
+                FROM (VALUES {", ".join(["(%s, %s, %s)"] * len(batch))}) AS v (id, energy_max, power_max)
+                WHERE p.consumption.id = v.id""",
+                [value for item in batch for value in (item["consumption_id"], item["max_energy"], item["max_power"])])
+
+        # Fold the batch's readings into the daily / monthly usage rollups of its devices
+        with timer.phase("usage rollups"):
+            device_ranges = {}
+            for item in batch:
+                if item["device_id"] is not None:
+                    start, end = device_ranges.get(item["device_id"], (item["timestamps"][0], item["timestamps"][-1]))
+                    device_ranges[item["device_id"]] = (min(start, item["timestamps"][0]), max(end, item["timestamps"][-1]))
+            for device_id, (start, end) in device_ranges.items():
+                connector.refresh_device_usage(device_id, start.item(), end.item())
 
 
 # [POWER READINGS] Populate the power_reading table from csv files (p.power_reading)
+#
+# The files are resampled by resample_consumption_file(), in a pool of `workers` processes (or inline with a
+# single worker), while this process writes their readings in batches of about LOAD_BATCH_READINGS readings
+# and finally analyzes the loaded tables. A timing report per phase is printed at the end. Alerts are evaluated
+# afterwards, once update_device_power_limits() has set the limits they are checked against
 #-----------------------------------------------------------------------------------------------
-def populate_power_reading_table(connector):
+LOAD_BATCH_READINGS = 100000
+
+def populate_power_reading_table(connector, workers=1):
+    timer = PhaseTimer()
+    load_started = time.perf_counter()
     try:
         connector.connect()
         current_dir = os.path.dirname(os.path.abspath(__file__))
 
-        # Fetch consumption data with file names
-        consumption_data = connector.execute("SELECT id, files_names FROM p.consumption")
+        # Fetch consumption data with file names, and the device of each consumption
+        consumption_data = connector.execute("""
+            SELECT p.consumption.id, p.consumption.files_names, p.device_consumption.device_id
+            FROM p.consumption
+            LEFT JOIN p.device_consumption ON p.consumption.id = p.device_consumption.consumption_id""")
 
-        print("-- Populating power_reading table...")
+        consumptions = {row[0]: row for row in consumption_data if row[1]}
+        tasks = [(consumption_id, os.path.join(current_dir, row[1])) for consumption_id, row in consumptions.items()]
 
-        for consumption_id, file_name in consumption_data:
-            if not file_name:
-                continue
+        print(f"-- Populating power_reading table from {len(tasks)} files, with {workers} worker(s)...")
 
-            data_file_path = os.path.join(current_dir, file_name)
-            max_energy_for_consumption = 0 # Track the total energy consumption
-            max_power_for_consumption = 0  # Track the maximum power
+        batch, batch_readings, files_loaded, readings_loaded = [], 0, 0, 0
 
+        def write_batch():
+            nonlocal batch, batch_readings, files_loaded, readings_loaded
             try:
-                # Process the CSV file and get aggregated readings
-                readings = process_csv_file(data_file_path)             
-
-                # Prepare data for insertion
-                insert_data = []
-                total_energy = 0
-
-                # Loop through readings
-                for reading in readings:
-                    timestamp, power = reading[0], reading[1]
-                    insert_data.append((consumption_id, timestamp, power))
-                    energy = power / 1000  # Convert power to kWh for this reading
-                    total_energy += energy
-                    max_energy_for_consumption = max(max_energy_for_consumption, total_energy)
-                    max_power_for_consumption = max(max_power_for_consumption, power)  # Update max power
-
-                # Batch insert into power_reading table
-                query = "INSERT INTO p.power_reading (consumption_id, reading_timestamp, power) VALUES %s"
-                with connector.conn.cursor() as cur:
-                    extras.execute_values(cur, query, insert_data, page_size=1000)
-                connector.commit()
-
-                # Update energy_max and power_max in p.consumption table
-                update_query = """
-                UPDATE p.consumption SET energy_max = %s, power_max = %s WHERE id = %s
-                """
-                connector.execute(update_query, (max_energy_for_consumption, max_power_for_consumption, consumption_id))
-                connector.commit()
-
-                print(f"---- Inserted hourly power readings and updated max values for consumption ID {consumption_id}")
-
-            except FileNotFoundError:
-                print(f"File not found: '{data_file_path}'. Skipping.")
-                continue
-            except psycopg2.Error as e:
-                connector.conn.rollback()
+                write_power_reading_batch(connector, batch, timer)
+                files_loaded += len(batch)
+                readings_loaded += batch_readings
+                print(f"---- Inserted {batch_readings} hourly power readings of {len(batch)} files and updated their max values")
+            except (psycopg2.Error, TransactionAbortedError) as e:
                 print(f"Error executing query: {e}")
+            batch, batch_readings = [], 0
 
-    except psycopg2.Error as e:
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            results = executor.map(resample_consumption_file, tasks, chunksize=4) if executor else map(resample_consumption_file, tasks)
+            while True:
+                # Time spent waiting for the next resampled file (all of the resampling with a single worker)
+                with timer.phase("waiting for resampling"):
+                    result = next(results, None)
+                if result is None:
+                    break
+
+                consumption_id, readings, error, seconds = result
+                timer.add("resampling (worker time)", seconds)
+                if readings is None:
+                    print(error)
+                    continue
+                timestamps, power, max_power, max_energy = readings
+                if not power.size:
+                    continue
+
+                _, _, device_id = consumptions[consumption_id]
+                batch.append({"consumption_id": consumption_id, "device_id": device_id, "timestamps": timestamps, "power": power, "max_power": max_power, "max_energy": max_energy})
+                batch_readings += power.size
+                if batch_readings >= LOAD_BATCH_READINGS:
+                    write_batch()
+            if batch:
+                write_batch()
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+        # Planner statistics of the loaded tables
+        with timer.phase("analyze"):
+            connector.execute("ANALYZE p.power_reading, p.consumption")
+            connector.commit()
+
+        elapsed = time.perf_counter() - load_started
+        print(f"-- Loaded {readings_loaded} hourly readings of {files_loaded} files in {elapsed:.2f}s ({files_loaded / elapsed if elapsed else 0:.1f} files/sec)")
+        timer.report()
+
+    except (psycopg2.Error, TransactionAbortedError) as e:
         print(f"Database error: {e}")
     finally:
         connector.disconnect()
@@ -425,14 +514,19 @@ def update_device_power_limits(connector):
         connector.connect()
         print("-- Updating device power limits...")
 
+        # 10% above the highest power of the device's consumptions
         update_query = """
         UPDATE p.device
         SET custom_power_min = 0,
-            custom_power_max = (p.consumption.power_max * 1.1)
-        FROM p.consumption
-        JOIN p.device_consumption
-        ON p.consumption.id = p.device_consumption.consumption_id
-        WHERE p.device_consumption.device_id = p.device.id;
+            custom_power_max = (device_power.power_max * 1.1)
+        FROM (
+            SELECT p.device_consumption.device_id, MAX(p.consumption.power_max) AS power_max
+            FROM p.consumption
+            JOIN p.device_consumption
+            ON p.consumption.id = p.device_consumption.consumption_id
+            GROUP BY p.device_consumption.device_id
+        ) AS device_power
+        WHERE device_power.device_id = p.device.id;
         """
         connector.execute(update_query)
         connector.commit()
@@ -445,5 +539,65 @@ def update_device_power_limits(connector):
     finally:
         connector.disconnect()
 
-# Call initialization
-init(args.no_data)
+# [ALERTS] Evaluate the alert rules over the loaded readings, with the final device limits
+#
+# Runs after update_device_power_limits(), so the alerts and the watermarks (p.alert_evaluation) are those of
+# the limits the devices keep: getPeakPowerAnalysis finds them up to date. The readings are read back in one
+# pass, consumption by consumption, and the alerts written in batches
+#-----------------------------------------------------------------------------------------------
+def evaluate_seeded_alerts(connector):
+    started = time.perf_counter()
+    try:
+        connector.connect()
+        print("-- Evaluating the alerts of the loaded readings...")
+
+        devices = connector.execute("""
+            SELECT p.device_consumption.consumption_id, p.device.id, p.device.user_username, p.device.custom_power_min,
+                p.device.custom_power_max, p.device.power_alert_threshold, p.device.energy_alert_threshold
+            FROM p.device_consumption
+            JOIN p.device ON p.device_consumption.device_id = p.device.id""")
+        devices = {row[0]: row[1:] for row in devices or []}
+
+        alert_batch = AlertBatch()
+        alert_evaluator, evaluated = None, 0
+
+        def finish():
+            nonlocal evaluated
+            alert_batch.add(alert_evaluator.result())
+            evaluated += 1
+            if alert_batch.full():
+                alert_batch.flush(connector)
+
+        with connector.transaction():
+            readings = connector.iter_arrays("""
+                SELECT consumption_id, reading_timestamp, power FROM p.power_reading
+                ORDER BY consumption_id, reading_timestamp""")
+            for chunk in readings:
+                # A chunk holds the readings of one or more consumptions, in order
+                consumption_ids = chunk["consumption_id"]
+                bounds = np.flatnonzero(np.diff(consumption_ids)) + 1
+                for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(consumption_ids)]):
+                    consumption_id = int(consumption_ids[start])
+                    if consumption_id not in devices:
+                        continue
+                    if alert_evaluator is None or alert_evaluator.evaluation["consumption_id"] != consumption_id:
+                        if alert_evaluator is not None:
+                            finish()
+                        device_id, username, *device_limits = devices[consumption_id]
+                        alert_evaluator = AlertEvaluator(username, consumption_id, device_id, *device_limits)
+                    alert_evaluator.update(chunk["reading_timestamp"][start:end], chunk["power"][start:end])
+            if alert_evaluator is not None:
+                finish()
+            alert_batch.flush(connector)
+
+        print(f"-- Evaluated {evaluated} consumptions: {alert_batch.alerts_written} alerts, in {time.perf_counter() - started:.2f}s")
+
+    except (psycopg2.Error, TransactionAbortedError) as e:
+        print(f"Database error: {e}")
+    finally:
+        connector.disconnect()
+
+# Call initialization (guarded: the loader's worker processes import this module)
+if __name__ == "__main__":
+    args = parser.parse_args()
+    init(args.no_data, max(1, args.workers))
@@ -0,0 +1,62 @@
+import datetime
+import argparse
+import psycopg2
+from ..model.dbconnector import PostgresConnector
+
+# Power reading retention: drops the monthly partitions of p.power_reading older than the kept period,
+# which frees their storage at once, instead of a DELETE over millions of rows (and the vacuum after it):
+#   python -m server.database.retention --keep-months 24
+#   python -m server.database.retention --before 2022-01-01 --dry-run
+
+parser = argparse.ArgumentParser(description="Drop power reading partitions older than the retention period.")
+parser.add_argument('--keep-months', type=int, default=24, help="Number of past months to keep, besides the current one.")
+parser.add_argument('--before', type=datetime.date.fromisoformat, default=None, help="Drop the months ending on or before this date instead (YYYY-MM-DD).")
+parser.add_argument('--dry-run', action='store_true', help="Only list the partitions that would be dropped.")
+
+# define the connector
+connector = PostgresConnector(
+    host="localhost",
+    port=5432,
+    database="postgres",
+    user="postgres",
+    password="password",
+)
+
+
+def retention_cutoff(keep_months, today=None):
+    today = today or datetime.date.today()
+    months = today.year * 12 + today.month - 1 - keep_months
+    return datetime.date(months // 12, months % 12 + 1, 1)
+
+
+def main(args):
+    cutoff = args.before or retention_cutoff(args.keep_months)
+    print(f"-- Dropping power reading partitions ending on or before {cutoff}...")
+
+    try:
+        with connector.connection() as conn:
+            if args.dry_run:
+                result = conn.execute("""
+                    SELECT c.relname, pg_size_pretty(pg_total_relation_size(c.oid))
+                    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'p.power_reading'::regclass AND c.relname ~ '^power_reading_y\\d{4}m\\d{2}$'
+                        AND to_date(substring(c.relname FROM 'y(\\d{4}m\\d{2})$'), 'YYYY"m"MM') + INTERVAL '1 month' <= %s
+                    ORDER BY c.relname""", (cutoff,))
+                for partition_name, size in result or []:
+                    print(f"---- Would drop p.{partition_name} ({size})")
+                conn.rollback()
+            else:
+                with conn.transaction():
+                    result = conn.execute("SELECT p.drop_power_reading_partitions(%s)", (cutoff,))
+                for (partition_name,) in result or []:
+                    print(f"---- Dropped p.{partition_name}")
+
+        print(f"-- {len(result or [])} partitions {'to drop' if args.dry_run else 'dropped'}")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        connector.close_pool()
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
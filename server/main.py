@@ -1,8 +1,9 @@
+import asyncio
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from .routers.data.api import router as api_router
-from .routers.users.authentication import router as auth_router
-from .routers.users.user import router as user_router
+from .routers.data.api import router as api_router, connector as api_connector, async_connector as api_async_connector, job_runner, statistics_refresher, response_cache
+from .routers.users.authentication import router as auth_router, connector as auth_connector
+from .routers.users.user import router as user_router, connector as user_connector
 
 app = FastAPI()
 
@@ -22,4 +23,50 @@ app.include_router(user_router, prefix="/user")
 
 @app.get("/")
 def get_data():
-    return {"result": "API is ok !"}
\ No newline at end of file
+    return {"result": "API is ok !"}
+
+# Connection pool sizes and checkout wait times, per router
+@app.get("/poolStats")
+def get_pool_stats():
+    return {
+        "data": api_connector.pool_stats(),
+        "data_async": api_async_connector.pool_stats(),
+        "auth": auth_connector.pool_stats(),
+        "user": user_connector.pool_stats(),
+    }
+
+# Response cache hit / miss / eviction counters
+@app.get("/cacheStats")
+def get_cache_stats():
+    return response_cache.stats()
+
+# Open the minimum number of pooled connections up front, so the first requests skip the connection handshake
+@app.on_event("startup")
+async def open_database_pools():
+    await asyncio.to_thread(api_connector.open_pool)
+    await api_async_connector.open_pool()
+    await auth_connector.open_pool()
+    await user_connector.open_pool()
+
+# Resume background jobs interrupted by the previous shutdown
+@app.on_event("startup")
+def resume_jobs():
+    try:
+        job_runner.resume()
+    except Exception as e:
+        print(f"Could not resume background jobs: {e}")
+
+# Start the scheduled refresh of the site-wide statistics
+@app.on_event("startup")
+def start_statistics_refresh():
+    statistics_refresher.start()
+
+# Stop the job workers and close pooled connections on shutdown
+@app.on_event("shutdown")
+async def close_database_pools():
+    job_runner.shutdown()
+    statistics_refresher.shutdown()
+    api_connector.close_pool()
+    await api_async_connector.close_pool()
+    await auth_connector.close_pool()
+    await user_connector.close_pool()
\ No newline at end of file
@@ -0,0 +1,275 @@
+import time
+import asyncio
+import collections
+from contextlib import asynccontextmanager
+import psycopg
+from .dbconnector import PoolMetrics, PoolTimeoutError, TransactionAbortedError
+
+
+# ===============================================================================================
+# A connection borrowed from the async pool, for the duration of a single request
+class AsyncPooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.transaction_depth = 0
+
+    # Statements run inside the connection's current transaction; nothing is committed until
+    # commit() is called or the enclosing transaction() block exits
+    async def execute(self, query, params=None):
+        try:
+            async with self.conn.cursor() as cur:
+                await cur.execute(query, params)
+                return await cur.fetchall() if cur.description is not None else None
+        except psycopg.Error as e:
+            print("Error executing query:", e)
+
+    # [TRANSACTION] Unit of work, same semantics as PooledConnection.transaction()
+    #-----------------------------------------------------------------------------------------------
+    @asynccontextmanager
+    async def transaction(self, synchronous_commit=True):
+        savepoint = f"unit_of_work_{self.transaction_depth}" if self.transaction_depth else None
+        if savepoint:
+            await self.conn.execute(f"SAVEPOINT {savepoint}")
+        if not synchronous_commit:
+            await self.conn.execute("SET LOCAL synchronous_commit = off")
+
+        self.transaction_depth += 1
+        try:
+            yield self
+            if self.conn.info.transaction_status == psycopg.pq.TransactionStatus.INERROR:
+                raise TransactionAbortedError("A statement failed inside the transaction, changes were rolled back")
+        except BaseException:
+            self.transaction_depth -= 1
+            if savepoint:
+                await self.conn.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            else:
+                await self.conn.rollback()
+            raise
+
+        self.transaction_depth -= 1
+        if savepoint:
+            await self.conn.execute(f"RELEASE SAVEPOINT {savepoint}")
+        else:
+            await self.conn.commit()
+
+    async def rollback(self):
+        await self.conn.rollback()
+
+    async def commit(self):
+        await self.conn.commit()
+
+
+# ===============================================================================================
+# Async counterpart of PostgresConnector, used by the async def endpoints so that
+# database round trips are awaited instead of blocking the event loop
+class AsyncPostgresConnector:
+    def __init__(self, host, port, database, user, password,
+                 min_size=1, max_size=10, max_idle=300, checkout_timeout=30, health_check_interval=30,
+                 health_check_timeout=5):
+        self.host = host
+        self.port = port
+        self.database = database
+        self.user = user
+        self.password = password
+
+        # Pool configuration (same semantics as PostgresConnector)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout    # seconds a health check ping may take
+
+        self._idle = collections.deque()
+        self._size = 0
+        self._available = None  # created lazily, inside the running event loop
+        self.metrics = PoolMetrics()
+
+    def _condition(self):
+        if self._available is None:
+            self._available = asyncio.Condition()
+        return self._available
+
+    async def _open(self):
+        return await psycopg.AsyncConnection.connect(
+            host=self.host,
+            port=self.port,
+            dbname=self.database,
+            user=self.user,
+            password=self.password,
+        )
+
+    # [POOL] Borrow a connection for the duration of the async with-block
+    #-----------------------------------------------------------------------------------------------
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self._checkout()
+        try:
+            yield AsyncPooledConnection(conn)
+        finally:
+            await self._checkin(conn)
+
+    # Open connections until min_size are open (see PostgresConnector.open_pool)
+    async def open_pool(self):
+        available = self._condition()
+        async with available:
+            missing = self.min_size - self._size
+            if missing <= 0:
+                return
+            self._size += missing
+
+        for opened in range(missing):
+            try:
+                conn = await self._open()
+            except psycopg.Error as e:
+                print("Error opening pooled connections:", e)
+                async with available:
+                    self._size -= missing - opened
+                    available.notify()
+                return
+            async with available:
+                self.metrics.created += 1
+                self._idle.append((conn, time.monotonic()))
+                available.notify()
+
+    # The pool lock only guards the pool's bookkeeping: health checks, connects and closes are awaited outside
+    # of it, so a slow or hung connection never holds up the checkouts / checkins of the other requests
+    async def _checkout(self):
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        available = self._condition()
+        if self._size < self.min_size:
+            await self.open_pool()
+
+        while True:
+            conn = None
+            async with available:
+                expired = self._reap_idle()
+                while True:
+                    # Reuse the most recently used idle connection (checked below)
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+
+                    # Open a new connection if the pool has not reached its maximum size
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.metrics.timeouts += 1
+                        await self._close(expired)
+                        raise PoolTimeoutError(f"Timed out after {self.checkout_timeout}s waiting for a database connection")
+                    try:
+                        await asyncio.wait_for(available.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            await self._close(expired)
+
+            if conn is None:
+                break
+            if await self._is_healthy(conn, last_used):
+                self.metrics.record_wait(time.monotonic() - started)
+                return conn
+            await self._discard(conn)
+
+        try:
+            conn = await self._open()
+        except Exception:
+            async with available:
+                self._size -= 1
+                available.notify()
+            raise
+
+        self.metrics.created += 1
+        self.metrics.record_wait(time.monotonic() - started)
+        return conn
+
+    async def _checkin(self, conn):
+        # Never hand a connection with an open or failed transaction to the next request
+        try:
+            if not conn.closed and conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                await conn.rollback()
+        except psycopg.Error:
+            pass
+
+        if conn.closed:
+            await self._discard(conn)
+            return
+
+        available = self._condition()
+        async with available:
+            self._idle.append((conn, time.monotonic()))
+            expired = self._reap_idle()
+            available.notify()
+        await self._close(expired)
+
+    # Ping a connection idle for longer than health_check_interval; a ping that does not answer within
+    # health_check_timeout fails the check
+    async def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(self._ping(conn), self.health_check_timeout)
+            return True
+        except (psycopg.Error, asyncio.TimeoutError):
+            return False
+
+    @staticmethod
+    async def _ping(conn):
+        await conn.execute("SELECT 1")
+        await conn.rollback()
+
+    # Remove a connection from the pool and close it
+    async def _discard(self, conn):
+        available = self._condition()
+        async with available:
+            self._size -= 1
+            self.metrics.discarded += 1
+            available.notify()
+        await self._close([conn])
+
+    @staticmethod
+    async def _close(conns):
+        for conn in conns:
+            try:
+                await conn.close()
+            except psycopg.Error:
+                pass
+
+    # Take the connections idle for longer than max_idle out of the pool, keeping at least min_size open, and
+    # return them, to be closed once the lock is released. Must be called with the pool lock held
+    def _reap_idle(self):
+        now = time.monotonic()
+        expired = []
+        while self._idle and self._size > self.min_size:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self.metrics.reaped += 1
+            expired.append(conn)
+        return expired
+
+    def pool_stats(self):
+        stats = self.metrics.as_dict()
+        stats.update({
+            "size": self._size,
+            "idle": len(self._idle),
+            "in_use": self._size - len(self._idle),
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+        })
+        return stats
+
+    async def close_pool(self):
+        async with self._condition():
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self.metrics.discarded += len(idle)
+        await self._close(idle)
@@ -0,0 +1,203 @@
+import time
+import asyncio
+import threading
+import functools
+from urllib.parse import quote
+from collections import OrderedDict
+from fastapi.responses import Response
+
+# Namespace of cached responses that do not depend on the user (e.g. device types)
+SHARED = "*"
+
+
+# ===============================================================================================
+# [BACKENDS] Storage of the cached response bodies. Keys are "<namespace>:<endpoint>:<argument>", and
+# invalidate() takes either a full key or a key prefix ending in ':'
+#-----------------------------------------------------------------------------------------------
+
+# In-process LRU with TTL, bounded to max_entries - one cache per server process
+class MemoryCacheBackend:
+    blocking = False
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, body)
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, body, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            if not key.endswith(":"):
+                return 1 if self.entries.pop(key, None) is not None else 0
+            keys = [k for k in self.entries if k.startswith(key)]
+            for k in keys:
+                del self.entries[k]
+            return len(keys)
+
+    def stats(self):
+        with self.lock:
+            return {"backend": "memory", "size": len(self.entries), "max_entries": self.max_entries,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+
+# Redis, shared by all server processes (pip install redis). Configure the server with
+# maxmemory + maxmemory-policy allkeys-lru for the size bound; expiry is per key.
+# The keys of every "<namespace>:<endpoint>:" prefix are indexed in a set, so that invalidating a prefix reads
+# that set instead of scanning the keyspace. An index set expires with its newest entry; should Redis evict one
+# under memory pressure, its entries are at most ttl seconds stale. Calls block (up to timeout seconds), so
+# ResponseCache runs them outside the event loop
+class RedisCacheBackend:
+    blocking = True
+
+    def __init__(self, url, prefix="energy-tracker:", timeout=0.5):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.prefix = prefix
+
+    def index(self, key):
+        return f"{self.prefix}index:{key[:key.index(':', key.index(':') + 1) + 1]}"
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, body, ttl):
+        ttl = max(1, int(ttl))
+        with self.client.pipeline() as pipeline:
+            pipeline.set(self.prefix + key, body, ex=ttl)
+            pipeline.sadd(self.index(key), self.prefix + key)
+            pipeline.expire(self.index(key), ttl)
+            pipeline.execute()
+
+    def invalidate(self, key):
+        if not key.endswith(":"):
+            return self.client.delete(self.prefix + key)
+        with self.client.pipeline() as pipeline:
+            pipeline.smembers(self.index(key))
+            pipeline.delete(self.index(key))
+            keys, _ = pipeline.execute()
+        return self.client.delete(*keys) if keys else 0
+
+    # Evictions and expirations are those of the whole Redis server, which may hold other data
+    def stats(self):
+        info = self.client.info("stats")
+        return {"backend": "redis", "server_evictions": info.get("evicted_keys", 0),
+                "server_expirations": info.get("expired_keys", 0)}
+
+
+# "" / None -> in-process cache, redis://... -> shared Redis cache
+def create_cache_backend(url=None, max_entries=2048):
+    if url:
+        return RedisCacheBackend(url)
+    return MemoryCacheBackend(max_entries)
+
+
+# ===============================================================================================
+# [RESPONSE CACHE] Per-user cache of JSON read endpoints.
+#
+# @response_cache.cached("getDevices") under the route decorator serves the endpoint's response from the cache
+# while it is fresh (ttl seconds), keyed by the user and the endpoint's other arguments. Write endpoints call
+# await invalidate(username, "getDevices", ("getDevice", device_id), ...) with the entries they change (or
+# invalidate_sync() from a worker thread): an endpoint name drops all of its cached variants for the user, an
+# (endpoint, argument) pair only that one.
+#
+# The cache never fails a request: a backend error is a miss, or a skipped invalidation (the entries are then at
+# most ttl seconds stale), and the backend is left alone for retry_after seconds
+class ResponseCache:
+    def __init__(self, backend, ttl=60, enabled=True, retry_after=5):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.retry_after = retry_after
+        self.unavailable_until = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(namespace, endpoint, argument=""):
+        return f"{quote(str(namespace), safe='')}:{endpoint}:{quote(str(argument), safe='')}"
+
+    # Backend call -> its result, or None if the backend failed or is left alone after a failure
+    def call_backend(self, method, *args):
+        if time.monotonic() < self.unavailable_until:
+            return None
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            self.unavailable_until = time.monotonic() + self.retry_after
+            print(f"Response cache {method} failed, bypassing the cache for {self.retry_after}s: {e}")
+            return None
+
+    # Same, from the event loop: blocking backends run in a worker thread
+    async def call_backend_async(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.call_backend, method, *args)
+        return self.call_backend(method, *args)
+
+    def cached(self, endpoint, shared=False):
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await handler(*args, **kwargs)
+
+                namespace = SHARED if shared else kwargs["username"]
+                argument = ",".join(str(value) for name, value in sorted(kwargs.items()) if name != "username")
+                key = self.key(namespace, endpoint, argument)
+
+                body = await self.call_backend_async("get", key)
+                if body is not None:
+                    self.hits += 1
+                    return Response(content=body, media_type="application/json")
+
+                self.misses += 1
+                response = await handler(*args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200:
+                    await self.call_backend_async("set", key, response.body, self.ttl)
+                return response
+            return wrapper
+        return decorator
+
+    def keys(self, username, entries):
+        return [self.key(username, *entry) if isinstance(entry, tuple) else self.key(username, entry) for entry in entries]
+
+    async def invalidate(self, username, *entries):
+        for key in self.keys(username, entries):
+            self.invalidations += await self.call_backend_async("invalidate", key) or 0
+
+    def invalidate_sync(self, username, *entries):
+        for key in self.keys(username, entries):
+            self.invalidations += self.call_backend("invalidate", key) or 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            backend_stats = self.backend.stats()
+        except Exception as e:
+            backend_stats = {"backend_error": str(e)}
+        return {"enabled": self.enabled, "ttl": self.ttl, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0, "invalidations": self.invalidations,
+                "errors": self.errors, **backend_stats}
@@ -1,23 +1,269 @@
+import io
+import time
+import decimal
+import datetime
+import itertools
+import threading
+import collections
+from contextlib import contextmanager
+import numpy as np
 import psycopg2
 
+
+# ===============================================================================================
+# Pool metrics, exposed through PostgresConnector.pool_stats()
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.reaped = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def record_wait(self, wait_time):
+        self.checkouts += 1
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def as_dict(self):
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "created": self.created,
+            "discarded": self.discarded,
+            "reaped": self.reaped,
+            "total_wait_time": self.total_wait_time,
+            "max_wait_time": self.max_wait_time,
+            "average_wait_time": self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+        }
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class TransactionAbortedError(Exception):
+    pass
+
+
+# ===============================================================================================
+# COPY support - rows are rendered lazily into the COPY text format while psycopg2 reads them,
+# so a generator of rows is streamed to the server without being materialized first
+POWER_READING_COPY_COLUMNS = ("consumption_id", "reading_timestamp", "power")
+
+def format_copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, float):
+        return float.__repr__(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    return (str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+class CopyRowStream(io.RawIOBase):
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        size = len(target)
+        parts, length = [self.buffer], len(self.buffer)
+        while length < size:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                break
+            line = ("\t".join(format_copy_value(value) for value in row) + "\n").encode()
+            parts.append(line)
+            length += len(line)
+        data = b"".join(parts)
+        chunk, self.buffer = data[:size], data[size:]
+        target[:len(chunk)] = chunk
+        return len(chunk)
+
+
+# ===============================================================================================
+# Server-side cursors - a named cursor keeps the result on the server, which sends it chunk_size rows per
+# fetch, so a result of any size is read with one chunk in memory at a time
+DEFAULT_CHUNK_SIZE = 10000
+cursor_names = itertools.count()
+
+# Column of a chunk -> numpy array. NUMERIC (Decimal) columns become float64 and timestamps datetime64[us],
+# unless dtype is given; NULLs need a dtype that can hold them (e.g. object)
+def column_array(values, dtype=None):
+    if dtype is not None:
+        return np.array(values, dtype=dtype)
+    first = values[0]
+    if isinstance(first, decimal.Decimal):
+        return np.array(values, dtype=np.float64)
+    if isinstance(first, datetime.datetime):
+        return np.array(values, dtype="datetime64[us]")
+    return np.array(values)
+
+
+# ===============================================================================================
+# A connection borrowed from the pool, for the duration of a single request
+class PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.transaction_depth = 0
+
+    # Statements run inside the connection's current transaction; nothing is committed until
+    # commit() is called or the enclosing transaction() block exits
+    def execute(self, query, params=None):
+        try:
+            cur = self.conn.cursor()
+            cur.execute(query, params)
+            if cur.description is not None:
+                return cur.fetchall()
+            else:
+                return None
+        except psycopg2.Error as e:
+            print("Error executing query:", e)
+
+    # [ITERATION] Result of a query as chunks (lists) of at most chunk_size rows, from a named cursor; itersize
+    # (rows per round trip) is chunk_size. Like execute(), the cursor runs inside the connection's current
+    # transaction, which is left open - the cursor is closed when the iteration ends or the generator is closed.
+    # Unlike execute(), errors are raised: a stream cut short must not pass for a complete result
+    #-----------------------------------------------------------------------------------------------
+    @contextmanager
+    def named_cursor(self, query, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        with self.conn.cursor(name=f"iter_cursor_{next(cursor_names)}") as cur:
+            cur.itersize = chunk_size
+            cur.execute(query, params)
+            yield cur
+
+    def iter_query(self, query, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        with self.named_cursor(query, params, chunk_size) as cur:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+    # Same, as a {column name: numpy array} dict per chunk. dtypes ({column name: dtype}) overrides the
+    # conversion of column_array()
+    def iter_arrays(self, query, params=None, chunk_size=DEFAULT_CHUNK_SIZE, dtypes=None):
+        dtypes = dtypes or {}
+        with self.named_cursor(query, params, chunk_size) as cur:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                names = [column.name for column in cur.description]
+                yield {name: column_array(values, dtypes.get(name)) for name, values in zip(names, zip(*rows))}
+
+    # Stream rows into a table with COPY ... FROM STDIN. Rows can be any iterable (e.g. a generator),
+    # or a file-like buffer already in COPY text format
+    def copy_rows(self, table, columns, rows, buffer_size=1 << 16):
+        source = rows if hasattr(rows, "read") else io.BufferedReader(CopyRowStream(rows), buffer_size)
+        with self.conn.cursor() as cur:
+            cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", source, size=buffer_size)
+            return cur.rowcount
+
+    def copy_power_readings(self, rows):
+        return self.copy_rows("p.power_reading", POWER_READING_COPY_COLUMNS, rows)
+
+    # p.power_reading is partitioned by month - create the partitions a write to [start, end] needs first.
+    # The bounds are cast to TIMESTAMP, as timezone-aware datetimes (e.g. parsed from csv files) are
+    # passed as TIMESTAMPTZ
+    def ensure_power_reading_partitions(self, start, end):
+        return self.execute("SELECT p.ensure_power_reading_partitions(%s::timestamp, %s::timestamp)", (start, end))
+
+    # Bring the daily / monthly usage rollups of a device up to date for the months of [start, end]
+    def refresh_device_usage(self, device_id, start, end):
+        return self.execute("SELECT p.refresh_device_usage(%s, %s::timestamp, %s::timestamp)", (device_id, start, end))
+
+    # [TRANSACTION] Unit of work - every statement in the block commits together, with a single WAL flush.
+    # The outermost block commits on success and rolls back on any exception (or if a statement
+    # inside it failed); nested blocks become savepoints, so they can fail without losing the outer work.
+    # synchronous_commit=False skips waiting for the WAL flush on commit, for bulk paths where losing the
+    # last few hundred milliseconds of work on a server crash is acceptable
+    #-----------------------------------------------------------------------------------------------
+    @contextmanager
+    def transaction(self, synchronous_commit=True):
+        savepoint = f"unit_of_work_{self.transaction_depth}" if self.transaction_depth else None
+        with self.conn.cursor() as cur:
+            if savepoint:
+                cur.execute(f"SAVEPOINT {savepoint}")
+            if not synchronous_commit:
+                cur.execute("SET LOCAL synchronous_commit = off")
+
+        self.transaction_depth += 1
+        try:
+            yield self
+            if self.conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+                raise TransactionAbortedError("A statement failed inside the transaction, changes were rolled back")
+        except BaseException:
+            self.transaction_depth -= 1
+            if savepoint:
+                with self.conn.cursor() as cur:
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            else:
+                self.conn.rollback()
+            raise
+
+        self.transaction_depth -= 1
+        if savepoint:
+            with self.conn.cursor() as cur:
+                cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+        else:
+            self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def commit(self):
+        self.conn.commit()
+
+
 class PostgresConnector:
-    def __init__(self, host, port, database, user, password):
+    def __init__(self, host, port, database, user, password,
+                 min_size=1, max_size=10, max_idle=300, checkout_timeout=30, health_check_interval=30,
+                 health_check_timeout=5):
         self.host = host
         self.port = port
         self.database = database
         self.user = user
         self.password = password
         self.conn = None
+        self.session = None  # PooledConnection wrapper around self.conn, for connect() / disconnect() use
+
+        # Pool configuration
+        self.min_size = min_size                            # connections kept open, opened up front by open_pool()
+        self.max_size = max_size
+        self.max_idle = max_idle                            # seconds before an idle connection above min_size is closed
+        self.checkout_timeout = checkout_timeout            # seconds to wait for a free connection
+        self.health_check_interval = health_check_interval  # idle seconds after which a connection is pinged on checkout
+        self.health_check_timeout = health_check_timeout    # seconds a health check ping may take
+
+        self._idle = collections.deque()                    # (connection, last_used) pairs, most recently used on the right
+        self._size = 0                                      # open connections, idle and checked out
+        self._available = threading.Condition(threading.Lock())
+        self.metrics = PoolMetrics()
+
+    def _open(self):
+        return psycopg2.connect(
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            user=self.user,
+            password=self.password,
+        )
 
     def connect(self):
         try:
-            self.conn = psycopg2.connect(
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-            )
+            self.conn = self._open()
+            self.session = PooledConnection(self.conn)
         except psycopg2.Error as e:
             print("Error connecting to PostgreSQL database:", e)
 
@@ -26,19 +272,208 @@ class PostgresConnector:
             self.conn.close()
 
     def execute(self, query, params=None):
-        try:
-            cur = self.conn.cursor()
-            cur.execute(query, params)
-            self.conn.commit()
-            if cur.description is not None:
-                return cur.fetchall()
-            else:
-                return None
-        except psycopg2.Error as e:
-            print("Error executing query:", e)
+        return self.session.execute(query, params)
+
+    def iter_query(self, query, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        return self.session.iter_query(query, params, chunk_size)
+
+    def iter_arrays(self, query, params=None, chunk_size=DEFAULT_CHUNK_SIZE, dtypes=None):
+        return self.session.iter_arrays(query, params, chunk_size, dtypes)
+
+    def copy_rows(self, table, columns, rows, buffer_size=1 << 16):
+        return self.session.copy_rows(table, columns, rows, buffer_size)
+
+    def copy_power_readings(self, rows):
+        return self.session.copy_power_readings(rows)
+
+    def ensure_power_reading_partitions(self, start, end):
+        return self.session.ensure_power_reading_partitions(start, end)
+
+    def refresh_device_usage(self, device_id, start, end):
+        return self.session.refresh_device_usage(device_id, start, end)
+
+    def transaction(self, synchronous_commit=True):
+        return self.session.transaction(synchronous_commit)
 
     def rollback(self):
         self.conn.rollback()
-    
+
     def commit(self):
-        self.conn.commit()
\ No newline at end of file
+        self.conn.commit()
+
+    # [POOL] Borrow a connection for the duration of the with-block
+    #-----------------------------------------------------------------------------------------------
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            yield PooledConnection(conn)
+        finally:
+            self._checkin(conn)
+
+    # Open connections until min_size are open, so that requests after startup (or after connections were
+    # discarded) find one idle instead of paying the connection handshake. Called on startup, and by every
+    # checkout while the pool is below min_size
+    def open_pool(self):
+        with self._available:
+            missing = self.min_size - self._size
+            if missing <= 0:
+                return
+            self._size += missing
+
+        # Connect outside the lock, like _checkout()
+        for opened in range(missing):
+            try:
+                conn = self._open()
+            except psycopg2.Error as e:
+                print("Error opening pooled connections:", e)
+                with self._available:
+                    self._size -= missing - opened
+                    self._available.notify()
+                return
+            with self._available:
+                self.metrics.created += 1
+                self._idle.append((conn, time.monotonic()))
+                self._available.notify()
+
+    # The pool lock only guards the pool's bookkeeping: health checks, connects and closes run outside of it,
+    # so a slow or hung connection never holds up the checkouts / checkins of the other threads
+    def _checkout(self):
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        if self._size < self.min_size:
+            self.open_pool()
+
+        while True:
+            conn = None
+            with self._available:
+                expired = self._reap_idle()
+                while True:
+                    # Reuse the most recently used idle connection (checked below)
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+
+                    # Open a new connection if the pool has not reached its maximum size
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.metrics.timeouts += 1
+                        self._close(expired)
+                        raise PoolTimeoutError(f"Timed out after {self.checkout_timeout}s waiting for a database connection")
+                    self._available.wait(remaining)
+            self._close(expired)
+
+            if conn is None:
+                break
+            if self._is_healthy(conn, last_used):
+                with self._available:
+                    self.metrics.record_wait(time.monotonic() - started)
+                return conn
+            self._discard(conn)
+
+        # Connect outside the lock, so other threads can keep checking in / out
+        try:
+            conn = self._open()
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+
+        with self._available:
+            self.metrics.created += 1
+            self.metrics.record_wait(time.monotonic() - started)
+        return conn
+
+    def _checkin(self, conn):
+        # Never hand a connection with an open or failed transaction to the next request
+        try:
+            if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            pass
+
+        if conn.closed:
+            self._discard(conn)
+            return
+
+        with self._available:
+            self._idle.append((conn, time.monotonic()))
+            expired = self._reap_idle()
+            self._available.notify()
+        self._close(expired)
+
+    # Ping a connection idle for longer than health_check_interval; a ping that does not answer within
+    # health_check_timeout is cancelled and fails the check
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        timer = threading.Timer(self.health_check_timeout, conn.cancel)
+        timer.start()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+        finally:
+            timer.cancel()
+
+    # Remove a connection from the pool and close it
+    def _discard(self, conn):
+        with self._available:
+            self._size -= 1
+            self.metrics.discarded += 1
+            self._available.notify()
+        self._close([conn])
+
+    @staticmethod
+    def _close(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    # Take the connections idle for longer than max_idle out of the pool, keeping at least min_size open, and
+    # return them, to be closed once the lock is released. Must be called with the pool lock held; the oldest
+    # idle connections sit on the left
+    def _reap_idle(self):
+        now = time.monotonic()
+        expired = []
+        while self._idle and self._size > self.min_size:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self.metrics.reaped += 1
+            expired.append(conn)
+        return expired
+
+    def pool_stats(self):
+        with self._available:
+            stats = self.metrics.as_dict()
+            stats.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+            return stats
+
+    def close_pool(self):
+        with self._available:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self.metrics.discarded += len(idle)
+        self._close(idle)
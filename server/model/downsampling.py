@@ -0,0 +1,80 @@
+import datetime
+import numpy as np
+
+# Time buckets of the min / max downsampling (date_trunc fields), for the `resolution` of the reading endpoints
+RESOLUTIONS = ("hour", "day", "week", "month")
+
+
+# ===============================================================================================
+# Largest-Triangle-Three-Buckets downsampling of a time series to `max_points` points.
+#
+# The first and last points are kept, and the points in between are split into max_points - 2 equal buckets.
+# From each bucket, LTTB keeps the point forming the largest triangle with the point kept from the previous
+# bucket and the average of the next bucket - the point that changes the shape of the line the most, so
+# spikes and drops survive where an average would flatten them. Selected points are actual readings.
+#
+# The bucket averages are computed for all buckets at once; the selection walks the buckets, since each
+# depends on the previous one, with the areas of a whole bucket computed in one numpy operation.
+# x: timestamps as numbers (e.g. epoch seconds), y: values. Returns the indexes of the kept points, in order
+def lttb_indices(x, y, max_points):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    # Bucket i covers [edges[i], edges[i + 1]) of the points between the first and the last
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    average_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    average_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+
+    # The "next bucket" of the last bucket is the last point
+    next_x = np.append(average_x[1:], x[n - 1])
+    next_y = np.append(average_y[1:], y[n - 1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        areas = np.abs((x[previous] - next_x[bucket]) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y[bucket] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+# Naive datetimes (as returned by the database driver) -> epoch seconds, for lttb_indices()
+def timestamps_to_seconds(timestamps):
+    return np.fromiter(((timestamp - EPOCH).total_seconds() for timestamp in timestamps), dtype=np.float64, count=len(timestamps))
+
+
+# Rows of readings -> the rows kept by LTTB, using the row fields at timestamp_index / value_index
+def downsample_rows(rows, max_points, timestamp_index, value_index):
+    if not rows or max_points is None or max_points >= len(rows):
+        return rows
+    x = timestamps_to_seconds([row[timestamp_index] for row in rows])
+    y = np.fromiter((row[value_index] for row in rows), dtype=np.float64, count=len(rows))
+    return [rows[i] for i in lttb_indices(x, y, max_points)]
+
+
+# ===============================================================================================
+# Min / max downsampling in SQL: wraps a readings query (with reading_timestamp and power columns) to keep only
+# the highest and the lowest reading of every `resolution` bucket (%(resolution)s parameter, one of RESOLUTIONS),
+# so a day / week / month keeps its spike and its trough. `columns` are the output columns of the readings query
+def min_max_buckets_query(readings_query, columns):
+    return f"""
+        SELECT {', '.join(columns)} FROM (
+            SELECT readings.*,
+                ROW_NUMBER() OVER (PARTITION BY date_trunc(%(resolution)s, readings.reading_timestamp)
+                                   ORDER BY readings.power DESC, readings.reading_timestamp) AS highest,
+                ROW_NUMBER() OVER (PARTITION BY date_trunc(%(resolution)s, readings.reading_timestamp)
+                                   ORDER BY readings.power, readings.reading_timestamp) AS lowest
+            FROM ({readings_query}) readings
+        ) buckets
+        WHERE buckets.highest = 1 OR buckets.lowest = 1
+        ORDER BY buckets.reading_timestamp"""
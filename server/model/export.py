@@ -0,0 +1,92 @@
+import io
+import csv
+import zlib
+
+# Streaming export formats: format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Rows fetched from the server-side cursor per round trip, and written per CSV write / Parquet row group
+EXPORT_CHUNK_SIZE = 50000
+
+
+# ===============================================================================================
+# [ENCODERS] Chunks of rows (e.g. PooledConnection.iter_query()) -> chunks of bytes of the file, for a
+# StreamingResponse. Each encoder holds one chunk (and its encoding) at a time, whatever the size of the export
+#-----------------------------------------------------------------------------------------------
+
+# CSV with a header line; timestamps as "YYYY-MM-DD HH:MM:SS", like the pandas export it replaces
+def encode_csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+# The CSV, gzip-compressed on the fly (a single gzip member, readable by gunzip / pandas)
+def encode_csv_gzip(chunks, columns):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for data in encode_csv(chunks, columns):
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+# File-like sink of the Parquet writer: collects what was written since the last take()
+class ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+# Parquet, one row group per chunk (pip install pyarrow). `schema` is a list of (column, pyarrow type)
+def encode_parquet(chunks, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(schema)
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="snappy") as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.table([pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+            data = sink.take()
+            if data:
+                yield data
+    yield sink.take()
+
+
+# Power readings (reading_timestamp, power NUMERIC(10, 2)) rows -> bytes of the export in `export_format` (see EXPORT_FORMATS)
+def encode_power_readings(chunks, export_format):
+    if export_format == "parquet":
+        import pyarrow as pa
+        return encode_parquet(chunks, [("reading_timestamp", pa.timestamp("ms")), ("power", pa.decimal128(10, 2))])
+    if export_format == "csv.gz":
+        return encode_csv_gzip(chunks, ["reading_timestamp", "power"])
+    return encode_csv(chunks, ["reading_timestamp", "power"])
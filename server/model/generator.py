@@ -0,0 +1,152 @@
+import numpy as np
+
+# Chance of a power spike (above the device maximum) on any active hour
+SPIKE_PROBABILITY = 0.0008
+
+# Chance that an active hour starts a period of inactivity, and the inactivity length in hours, per draw pattern
+INACTIVITY_PATTERNS = {
+    'Occasional': (0.35, 6, 10),
+    'Rare': (0.75, 12, 24),
+}
+
+# Normal readings move by 1% - 3% of the device power range per hour
+FLUCTUATION_RANGE = (0.01, 0.03)
+
+SLOT_NORMAL, SLOT_SPIKE, SLOT_INACTIVE = 0, 1, 2
+
+
+# ===============================================================================================
+# Vectorized hourly power reading generator.
+#
+# Produces the same kind of series as the original per-hour loop: rare spikes between power_max
+# and 1.2 * power_max, runs of zero readings for 'Occasional' / 'Rare' devices, and a bounded random
+# walk of 1% - 3% steps between power_min and power_max otherwise, which restarts from a random level
+# after every spike or inactivity period. A whole interval is generated with array operations; the
+# walk is kept in bounds by reflecting it at power_min / power_max.
+#
+# State (last power level, pending inactivity hours) carries over between consecutive generate()
+# calls, so a request split into monthly intervals yields one continuous series.
+class PowerReadingGenerator:
+    def __init__(self, power_min, power_max, power_draw_pattern, rng=None):
+        self.power_min = float(power_min)
+        self.power_max = float(power_max)
+        self.power_draw_pattern = power_draw_pattern
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        self.previous_power = self.rng.uniform(self.power_min, self.power_max)
+        self.restart_walk = False     # True if the last reading was a spike or inactive
+        self.inactivity_remaining = 0  # zero readings still owed from an inactivity period
+
+    # JSON-serializable snapshot of the walk and random generator, to resume generation later
+    def get_state(self):
+        return {
+            "previous_power": float(self.previous_power),
+            "restart_walk": bool(self.restart_walk),
+            "inactivity_remaining": int(self.inactivity_remaining),
+            "rng": self.rng.bit_generator.state,
+        }
+
+    def set_state(self, state):
+        self.previous_power = state["previous_power"]
+        self.restart_walk = state["restart_walk"]
+        self.inactivity_remaining = state["inactivity_remaining"]
+        self.rng.bit_generator.state = state["rng"]
+
+    # Generate hourly readings from interval_start up to and including interval_end.
+    # Returns (timestamps as datetime64[s], power as float64)
+    def generate(self, interval_start, interval_end):
+        start = np.datetime64(interval_start, 's')
+        hours = int((np.datetime64(interval_end, 's') - start) // np.timedelta64(1, 'h')) + 1
+        if hours <= 0:
+            return np.empty(0, dtype='datetime64[s]'), np.empty(0, dtype=np.float64)
+
+        timestamps = start + np.arange(hours) * np.timedelta64(1, 'h')
+        power = np.zeros(hours, dtype=np.float64)
+
+        # Inactivity carried over from the previous interval
+        carried = min(self.inactivity_remaining, hours)
+        self.inactivity_remaining -= carried
+        if carried == hours:
+            self.restart_walk = True
+            return timestamps, power
+
+        slot_types, slot_lengths, owed = self._draw_slots(hours - carried)
+        hour_types = np.repeat(slot_types, slot_lengths)
+        active = np.empty(hours, dtype=np.int8)
+        active[:carried] = SLOT_INACTIVE
+        active[carried:] = hour_types
+
+        # Spikes
+        spikes = active == SLOT_SPIKE
+        power[spikes] = self.rng.uniform(self.power_max, self.power_max * 1.2, spikes.sum())
+
+        # Normal readings - bounded random walk, restarted after every spike / inactivity run
+        normal = active == SLOT_NORMAL
+        if normal.any():
+            power[normal] = self._random_walk(active, normal)
+            self.previous_power = power[normal][-1]
+
+        self.restart_walk = active[-1] != SLOT_NORMAL
+        self.inactivity_remaining = owed
+        return timestamps, power
+
+    # Draw spike / inactive / normal slots until `hours` hours are covered.
+    # An inactivity slot covers its starting hour plus the inactivity duration
+    def _draw_slots(self, hours):
+        rng = self.rng
+        draws = rng.random(hours)
+        slot_types = np.full(hours, SLOT_NORMAL, dtype=np.int8)
+        slot_lengths = np.ones(hours, dtype=np.int64)
+
+        spike = draws < SPIKE_PROBABILITY
+        slot_types[spike] = SLOT_SPIKE
+
+        pattern = INACTIVITY_PATTERNS.get(self.power_draw_pattern)
+        if pattern is not None:
+            probability, min_duration, max_duration = pattern
+            inactive = ~spike & (rng.random(hours) < probability)
+            slot_types[inactive] = SLOT_INACTIVE
+            slot_lengths[inactive] += rng.integers(min_duration, max_duration + 1, inactive.sum())
+
+        # Keep only the slots needed to cover the interval; the last one may spill into the next interval
+        ends = np.cumsum(slot_lengths)
+        used = int(np.searchsorted(ends, hours)) + 1
+        slot_types, slot_lengths = slot_types[:used], slot_lengths[:used].copy()
+        owed = int(ends[used - 1] - hours)
+        slot_lengths[-1] -= owed
+        return slot_types, slot_lengths, owed
+
+    def _random_walk(self, active, normal):
+        rng = self.rng
+        count = int(normal.sum())
+        power_range = self.power_max - self.power_min
+        if power_range <= 0:
+            return np.full(count, self.power_min)
+
+        max_change = power_range * rng.uniform(*FLUCTUATION_RANGE, count)
+        steps = rng.uniform(-1.0, 1.0, count) * max_change
+
+        # A run of normal readings starts after any spike / inactive hour. The first hour of the
+        # interval continues the previous interval's walk, unless that ended on a spike / inactivity
+        previous = np.empty_like(active)
+        previous[0] = SLOT_SPIKE if self.restart_walk else SLOT_NORMAL
+        previous[1:] = active[:-1]
+        run_starts = (previous != SLOT_NORMAL)[normal]
+        continues = bool(normal[0]) and not self.restart_walk
+        if continues:
+            run_starts[0] = True
+
+        run_ids = np.cumsum(run_starts) - 1
+        start_levels = rng.uniform(self.power_min, self.power_max, int(run_starts.sum()))
+        if continues:
+            start_levels[0] = self.previous_power
+
+        # Segmented cumulative sum of steps, per run
+        cumulative = np.cumsum(steps)
+        run_offsets = (cumulative - steps)[run_starts]
+        walk = start_levels[run_ids] + cumulative - run_offsets[run_ids]
+
+        # Reflect into [power_min, power_max]
+        folded = np.mod(walk - self.power_min, 2 * power_range)
+        folded = np.where(folded > power_range, 2 * power_range - folded, folded)
+        return self.power_min + folded
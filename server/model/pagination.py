@@ -0,0 +1,67 @@
+import datetime
+
+# Largest page of the paginated endpoints (`limit`)
+MAX_PAGE_SIZE = 10000
+
+
+# ===============================================================================================
+# Keyset pagination of the list endpoints (readings, alerts).
+#
+# A page is requested with `limit`, and the next page with the `next_cursor` of the previous response: the
+# (after_timestamp, after_id) of its last row. The cursor becomes a range condition on the (timestamp, id)
+# ordering of the query, served by an index in that order, so the database seeks straight to the first row of
+# the page instead of skipping the rows of the previous pages (as OFFSET would) - deep pages cost the same as
+# the first one. `from` (inclusive) and `to` (exclusive) restrict the timestamp range of the whole listing.
+#-----------------------------------------------------------------------------------------------
+
+# Timestamps are stored without time zone (UTC): aware query parameters are converted, naive ones are kept
+def as_naive_utc(timestamp):
+    if timestamp is None or timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+# Query parameters -> named query parameters of the conditions below, or ValueError for an invalid combination
+def page_parameters(from_, to, after_timestamp, after_id, limit):
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if after_id is not None and after_timestamp is None:
+        raise ValueError("after_id requires after_timestamp")
+    from_, to = as_naive_utc(from_), as_naive_utc(to)
+    if from_ is not None and to is not None and from_ >= to:
+        raise ValueError("from must be earlier than to")
+    return {"from": from_, "to": to, "after_timestamp": as_naive_utc(after_timestamp), "after_id": after_id,
+            "page_limit": limit + 1 if limit is not None else None}
+
+
+# SQL conditions (to AND into the WHERE clause) for the range and the cursor, on `timestamp_column` and
+# `id_column`. The pages run in ascending (timestamp, id) order, or descending (newest first).
+# The cursor condition is written twice: the plain timestamp bound is what the index scan starts from, the
+# row comparison skips the rows of the previous page sharing its last timestamp
+def range_conditions(params, timestamp_column, id_column, descending=False):
+    conditions = []
+    if params["from"] is not None:
+        conditions.append(f"{timestamp_column} >= %(from)s")
+    if params["to"] is not None:
+        conditions.append(f"{timestamp_column} < %(to)s")
+    if params["after_timestamp"] is not None:
+        operator = "<" if descending else ">"
+        if params["after_id"] is not None:
+            conditions.append(f"{timestamp_column} {operator}= %(after_timestamp)s")
+            conditions.append(f"({timestamp_column}, {id_column}) {operator} (%(after_timestamp)s, %(after_id)s)")
+        else:
+            conditions.append(f"{timestamp_column} {operator} %(after_timestamp)s")
+    return "".join(f" AND {condition}" for condition in conditions)
+
+
+# Rows fetched with LIMIT limit + 1 -> (rows of the page, cursor of the next page or None on the last page).
+# The cursor is taken from the last row of the page, at timestamp_index / id_index (None: timestamp only)
+def page_rows(rows, limit, timestamp_index, id_index=None):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    next_cursor = {"after_timestamp": last[timestamp_index]}
+    if id_index is not None:
+        next_cursor["after_id"] = last[id_index]
+    return rows, next_cursor
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+# Columns of an imported meter file: one row per measurement, at any rate (e.g. per second), as in the
+# per-device files of the dataset loaded by database/init.py
+IMPORT_COLUMNS = ["timestamp", "power"]
+
+# File extension -> import format
+IMPORT_FORMATS = {".csv": "csv", ".csv.gz": "csv.gz", ".parquet": "parquet"}
+
+# Rows parsed at a time - bounds the memory of an import, whatever the size of the file
+IMPORT_CHUNK_SIZE = 500000
+
+
+# ===============================================================================================
+# [READING] Meter file -> DataFrames of at most chunk_size rows, with the IMPORT_COLUMNS, to be parsed and
+# resampled by model/resampling.py's HourlyResampler
+#-----------------------------------------------------------------------------------------------
+
+# Format of an uploaded file from its name, None if it is not supported
+def import_format(file_name):
+    name = (file_name or "").lower()
+    for extension, file_format in IMPORT_FORMATS.items():
+        if name.endswith(extension):
+            return file_format
+    return None
+
+
+# `file` is a binary file object (e.g. the spooled upload). Raises ValueError if a column is missing
+def read_chunks(file, file_format, chunk_size=IMPORT_CHUNK_SIZE):
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(file)
+        missing = set(IMPORT_COLUMNS) - set(parquet_file.schema_arrow.names)
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=IMPORT_COLUMNS):
+            yield batch.to_pandas()
+        return
+
+    compression = "gzip" if file_format == "csv.gz" else None
+    with pd.read_csv(file, usecols=IMPORT_COLUMNS, dtype={"timestamp": str}, compression=compression, chunksize=chunk_size, low_memory=False) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+# Hourly readings -> (start, end) index ranges of their calendar months, the unit of a consumption record
+def month_ranges(timestamps):
+    months = timestamps.astype("datetime64[M]")
+    boundaries = np.flatnonzero(months[1:] != months[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(timestamps)]))
+    return list(zip(starts.tolist(), ends.tolist()))
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+# Rows of a per-second plug file read at a time
+RESAMPLE_CHUNK_SIZE = 250000
+
+UTC_EPOCH = pd.Timestamp("1970-01-01", tz="UTC")
+HOUR = pd.Timedelta(hours=1)
+
+
+# ===============================================================================================
+# [PARSING] Rows of a meter file (a DataFrame chunk with timestamp and power columns, e.g. from read_csv) ->
+# (epoch hours int64, power float64, rows rejected) of its valid rows. Shared by the dataset loader
+# (database/init.py) and the importReadings endpoint. Rows with an unparseable timestamp, a missing /
+# non-numeric / infinite power or a negative power are rejected. Timestamps are ISO 8601, each row parsed on
+# its own (an inferred format would depend on the first row of the chunk, and reject the rows of another
+# form), those of any UTC offset converted to UTC, naive ones taken as UTC
+#-----------------------------------------------------------------------------------------------
+def parse_readings(chunk):
+    timestamps = pd.to_datetime(chunk["timestamp"], utc=True, errors="coerce", format="ISO8601")
+    power = pd.to_numeric(chunk["power"], errors="coerce").to_numpy(dtype=np.float64)
+    valid = timestamps.notna().to_numpy() & np.isfinite(power) & (power >= 0)
+
+    hours = ((timestamps[valid] - UTC_EPOCH) // HOUR).to_numpy(dtype=np.int64)
+    return hours, power[valid], int(len(chunk) - valid.sum())
+
+
+# ===============================================================================================
+# [RESAMPLING] Streaming hourly resampling of the parsed rows, with the output of pandas'
+# resample('1h').mean().ffill() over the valid rows of the whole file: the mean power of every hour from the
+# hour of the first valid row to the hour of the last one, an hour without valid rows taking the value of the
+# previous hour.
+#
+# Chunks are added one at a time. Every hour but the last one of a chunk is complete and emitted, and the rows
+# of the last one are carried into the next chunk, which may hold more of its readings. The means are those of
+# pandas (compensated sums over the rows of the hour, in file order), so the values are the same to the last
+# bit, and the state is one hour of rows and the last emitted value, whatever the length of the file.
+# Rows may come in any order within a chunk, but chunks must follow each other in time: a row of an hour
+# already emitted raises ValueError
+class HourlyResampler:
+    def __init__(self):
+        self.open_hours = np.empty(0, dtype=np.int64)   # rows of the last hour, carried to the next chunk
+        self.open_power = np.empty(0)
+        self.next_hour = None   # first hour not emitted yet
+        self.last_value = np.nan
+        self.rows_read = 0
+        self.rows_rejected = 0
+
+    # DataFrame chunk -> the completed hours, as (timestamps datetime64[s], mean power float64) arrays
+    def add(self, chunk):
+        hours, power, rejected = parse_readings(chunk)
+        self.rows_read += len(chunk)
+        self.rows_rejected += rejected
+        return self.add_hours(hours, power)
+
+    # Same, from already parsed epoch hours (int64) and power (float64)
+    def add_hours(self, hours, power):
+        if not len(hours):
+            return self._emit(np.empty(0, dtype=np.int64), np.empty(0))
+        if len(self.open_hours) and hours.min() < self.open_hours[0]:
+            raise ValueError("Readings are not in time order")
+
+        hours = np.concatenate((self.open_hours, hours))
+        power = np.concatenate((self.open_power, power))
+        last = hours == hours.max()
+        self.open_hours, self.open_power = hours[last], power[last]
+        return self._emit(*self._means(hours[~last], power[~last]))
+
+    # The open hour, once the file has ended
+    def finish(self):
+        hours, power = self.open_hours, self.open_power
+        self.open_hours, self.open_power = np.empty(0, dtype=np.int64), np.empty(0)
+        return self._emit(*self._means(hours, power))
+
+    # DataFrame chunks of a whole file -> all its hourly readings, as one (timestamps, power) pair
+    def resample(self, chunks):
+        parts = [self.add(chunk) for chunk in chunks] + [self.finish()]
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+    # Rows -> (hours with rows, mean power of their rows)
+    @staticmethod
+    def _means(hours, power):
+        means = pd.Series(power).groupby(hours, sort=True).mean()
+        return means.index.to_numpy(dtype=np.int64), means.to_numpy(dtype=np.float64)
+
+    # Means of complete hours (in hour order) -> every hour from next_hour up to the last one, gaps forward filled
+    def _emit(self, hours, means):
+        if not len(hours):
+            return np.empty(0, dtype="datetime64[s]"), np.empty(0)
+        if self.next_hour is None:
+            self.next_hour = int(hours[0])
+
+        grid = np.arange(self.next_hour, int(hours[-1]) + 1, dtype=np.int64)
+        values = np.full(len(grid) + 1, np.nan)
+        values[0] = self.last_value
+        values[hours - self.next_hour + 1] = means
+
+        # Forward fill: every NaN takes the last value before it (the carried value for the leading ones)
+        known = ~np.isnan(values)
+        values = values[np.maximum.accumulate(np.where(known, np.arange(len(values)), 0))][1:]
+
+        self.next_hour = int(hours[-1]) + 1
+        self.last_value = values[-1]
+        return (grid * 3600).astype("datetime64[s]"), values
+
+
+# Per-second plug csv file (timestamp, power columns) -> hourly (timestamps, power) arrays, one pair per chunk
+# of chunk_size rows, without reading the whole file
+def resample_csv_chunks(file_path, chunk_size=RESAMPLE_CHUNK_SIZE):
+    resampler = HourlyResampler()
+    with pd.read_csv(file_path, usecols=["timestamp", "power"], dtype={"timestamp": str}, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            timestamps, power = resampler.add(chunk)
+            if len(timestamps):
+                yield timestamps, power
+    timestamps, power = resampler.finish()
+    if len(timestamps):
+        yield timestamps, power
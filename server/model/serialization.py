@@ -0,0 +1,39 @@
+from decimal import Decimal
+import orjson
+from fastapi.responses import Response
+
+# ===============================================================================================
+# Single-pass serialization of cursor rows into a JSON response.
+# orjson encodes datetime (ISO 8601) and numpy scalars natively; Decimal (NUMERIC columns) goes through
+# the default hook as float. The encoded bytes are returned as a raw Response, so FastAPI does not
+# validate or serialize the data a second time
+
+
+def encode_default(o):
+    if isinstance(o, Decimal):
+        return float(o)
+    raise TypeError
+
+
+def dumps(data):
+    return orjson.dumps(data, default=encode_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+# List of rows -> JSON array of objects keyed by `keys`
+def rows_to_json(result, keys):
+    return dumps([dict(zip(keys, row)) for row in result])
+
+
+def json_response(result, keys):
+    return Response(content=rows_to_json(result, keys), media_type="application/json")
+
+
+# Single row -> JSON object
+def json_object_response(row, keys):
+    return Response(content=dumps(dict(zip(keys, row))), media_type="application/json")
+
+
+# Page of rows -> {"items": [...], "next_cursor": {...} | null}, see model/pagination.py
+def json_page_response(result, keys, next_cursor):
+    return Response(content=dumps({"items": [dict(zip(keys, row)) for row in result], "next_cursor": next_cursor}),
+                    media_type="application/json")
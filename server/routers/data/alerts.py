@@ -0,0 +1,376 @@
+from decimal import Decimal
+import numpy as np
+
+# Rules of the consumption analysis - each keeps at most one alert per consumption in p.alert
+POWER_RULE, ENERGY_RULE = "power", "energy"
+
+
+# ===============================================================================================
+# [QUERIES] Incremental evaluation of a consumption.
+#
+# The device row carries the alert thresholds, the warning threshold (the user power alert threshold if set,
+# else the default system threshold - 2% of the power range below the maximum power rating, but not below the
+# minimum; devices without a power range get no warnings), and the consumption's watermark in
+# p.alert_evaluation - only if it was evaluated against the same thresholds, else the consumption is evaluated
+# from scratch. The readings after the watermark (only their months' partitions) are then aggregated in a
+# single pass: count, last timestamp, power sum, the highest reading above
+# the maximum power rating, and the highest reading between the warning threshold and the maximum
+#-----------------------------------------------------------------------------------------------
+ALERT_EVALUATION_QUERY = """
+    WITH device AS (
+        SELECT p.device_consumption.device_id, p.device.custom_power_min, p.device.custom_power_max,
+            p.device.power_alert_threshold, p.device.energy_alert_threshold,
+            CASE WHEN p.device.custom_power_max = p.device.custom_power_min THEN NULL
+                 WHEN COALESCE(p.device.power_alert_threshold, 0) <> 0 THEN p.device.power_alert_threshold
+                 ELSE GREATEST(p.device.custom_power_min, p.device.custom_power_max *
+                    (1 - 0.02 * (p.device.custom_power_max - p.device.custom_power_min) / NULLIF(p.device.custom_power_max, 0)))
+            END AS warning_threshold,
+            date_trunc('month', p.consumption.start_date) AS first_month,
+            date_trunc('month', p.consumption.end_date) + INTERVAL '1 month' AS end_month,
+            p.alert_evaluation.evaluated_until, p.alert_evaluation.reading_count, p.alert_evaluation.power_sum,
+            p.alert_evaluation.exceeded_timestamp, p.alert_evaluation.exceeded_power,
+            p.alert_evaluation.warning_timestamp, p.alert_evaluation.warning_power
+        FROM p.device_consumption
+        INNER JOIN p.device ON p.device_consumption.device_id = p.device.id
+        INNER JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+        LEFT JOIN p.alert_evaluation ON p.alert_evaluation.consumption_id = p.device_consumption.consumption_id
+            AND p.alert_evaluation.device_id = p.device.id
+            AND p.alert_evaluation.custom_power_min IS NOT DISTINCT FROM p.device.custom_power_min
+            AND p.alert_evaluation.custom_power_max IS NOT DISTINCT FROM p.device.custom_power_max
+            AND p.alert_evaluation.power_alert_threshold IS NOT DISTINCT FROM p.device.power_alert_threshold
+            AND p.alert_evaluation.energy_alert_threshold IS NOT DISTINCT FROM p.device.energy_alert_threshold
+        WHERE p.device_consumption.consumption_id = %(consumption_id)s AND p.device.user_username = %(username)s
+        LIMIT 1
+    ), readings AS (
+        SELECT p.power_reading.reading_timestamp, p.power_reading.power
+        FROM p.power_reading
+        WHERE p.power_reading.consumption_id = %(consumption_id)s
+            AND p.power_reading.reading_timestamp >= (SELECT GREATEST(first_month, date_trunc('month', evaluated_until)) FROM device)
+            AND p.power_reading.reading_timestamp < (SELECT end_month FROM device)
+            AND p.power_reading.reading_timestamp > (SELECT COALESCE(evaluated_until, '-infinity') FROM device)
+    )
+    SELECT device.device_id, device.custom_power_min, device.custom_power_max, device.power_alert_threshold,
+        device.energy_alert_threshold, device.warning_threshold,
+        device.evaluated_until, device.reading_count, device.power_sum, device.exceeded_timestamp,
+        device.exceeded_power, device.warning_timestamp, device.warning_power,
+        totals.last_timestamp, totals.reading_count, totals.power_sum,
+        exceeded.reading_timestamp, exceeded.power, warning.reading_timestamp, warning.power
+    FROM device
+    CROSS JOIN LATERAL (
+        SELECT MAX(readings.reading_timestamp) AS last_timestamp, COUNT(*) AS reading_count,
+            COALESCE(SUM(readings.power), 0) AS power_sum
+        FROM readings
+    ) totals
+    LEFT JOIN LATERAL (
+        SELECT readings.reading_timestamp, readings.power FROM readings
+        WHERE readings.power > device.custom_power_max
+        ORDER BY readings.power DESC, readings.reading_timestamp LIMIT 1
+    ) exceeded ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT readings.reading_timestamp, readings.power FROM readings
+        WHERE readings.power <= device.custom_power_max AND readings.power >= device.warning_threshold
+        ORDER BY readings.power DESC, readings.reading_timestamp LIMIT 1
+    ) warning ON TRUE
+"""
+
+# Watermark columns of p.alert_evaluation, as keys of an evaluation
+EVALUATION_COLUMNS = ["consumption_id", "device_id", "custom_power_min", "custom_power_max", "power_alert_threshold",
+                      "energy_alert_threshold", "evaluated_until", "reading_count", "power_sum", "exceeded_timestamp",
+                      "exceeded_power", "warning_timestamp", "warning_power"]
+
+# The write queries take a batch of rows ({values}: one VALUES tuple per row) - see evaluation_statements()
+SAVE_EVALUATION_QUERY = f"""
+    INSERT INTO p.alert_evaluation ({', '.join(EVALUATION_COLUMNS)}, evaluated_at)
+    VALUES {{values}}
+    ON CONFLICT (consumption_id) DO UPDATE SET
+        {', '.join(f"{column} = EXCLUDED.{column}" for column in EVALUATION_COLUMNS[1:])}, evaluated_at = NOW()
+"""
+
+# One alert per (consumption, rule): an unchanged alert is left as it is (read status and date included),
+# a changed one is rewritten and marked unread again
+UPSERT_ALERT_QUERY = """
+    INSERT INTO p.alert (username, device_id, consumption_id, alert_rule, title, description, suggestion, type, date, read_status)
+    VALUES {values}
+    ON CONFLICT (consumption_id, alert_rule) WHERE alert_rule IS NOT NULL DO UPDATE SET
+        username = EXCLUDED.username, device_id = EXCLUDED.device_id, title = EXCLUDED.title,
+        description = EXCLUDED.description, suggestion = EXCLUDED.suggestion, date = EXCLUDED.date,
+        type = EXCLUDED.type, read_status = 'N'
+    WHERE p.alert.description IS DISTINCT FROM EXCLUDED.description OR p.alert.type IS DISTINCT FROM EXCLUDED.type
+        OR p.alert.device_id IS DISTINCT FROM EXCLUDED.device_id
+"""
+
+# A rule that no longer fires (e.g. after a threshold change) drops its alert
+DELETE_ALERT_QUERY = """
+    DELETE FROM p.alert WHERE alert_rule IS NOT NULL AND (consumption_id, alert_rule) IN ({values})
+"""
+
+
+# ===============================================================================================
+# [EVALUATION] Merge of the watermark with the newer readings, and the resulting alerts
+#-----------------------------------------------------------------------------------------------
+
+# Row of ALERT_EVALUATION_QUERY -> (evaluation, changed). The evaluation holds the device thresholds and
+# the analysis state of all the readings evaluated so far (as in p.alert_evaluation); changed is False when the
+# watermark is current and there are no newer readings, i.e. the stored alerts are up to date
+def merge_evaluation(username, consumption_id, row):
+    (device_id, custom_power_min, custom_power_max, power_alert_threshold, energy_alert_threshold, warning_threshold,
+        evaluated_until, reading_count, power_sum, exceeded_timestamp, exceeded_power, warning_timestamp, warning_power,
+        new_last_timestamp, new_reading_count, new_power_sum, new_exceeded_timestamp, new_exceeded_power,
+        new_warning_timestamp, new_warning_power) = row
+
+    evaluation = {
+        "username": username, "consumption_id": consumption_id, "device_id": device_id,
+        "custom_power_min": custom_power_min, "custom_power_max": custom_power_max,
+        "power_alert_threshold": power_alert_threshold, "energy_alert_threshold": energy_alert_threshold,
+        "warning_threshold": warning_threshold,
+        "evaluated_until": evaluated_until, "reading_count": reading_count or 0,
+        "power_sum": power_sum or Decimal(0), "new_readings": new_reading_count,
+        "exceeded_timestamp": exceeded_timestamp, "exceeded_power": exceeded_power,
+        "warning_timestamp": warning_timestamp, "warning_power": warning_power,
+    }
+    # No watermark (first evaluation, or thresholds changed since)
+    changed = reading_count is None
+
+    if new_reading_count:
+        changed = True
+        evaluation["evaluated_until"] = new_last_timestamp
+        evaluation["reading_count"] += new_reading_count
+        evaluation["power_sum"] += new_power_sum
+
+        # Newer readings only replace a peak when strictly higher (ties keep the earliest reading)
+        if new_exceeded_timestamp and (exceeded_power is None or new_exceeded_power > exceeded_power):
+            evaluation["exceeded_timestamp"], evaluation["exceeded_power"] = new_exceeded_timestamp, new_exceeded_power
+        if new_warning_timestamp and (warning_power is None or new_warning_power > warning_power):
+            evaluation["warning_timestamp"], evaluation["warning_power"] = new_warning_timestamp, new_warning_power
+
+    # Readings are hourly, so the energy (kWh) is the power sum / 1000
+    evaluation["total_energy"] = float(evaluation["power_sum"]) / 1000.0
+    return evaluation, changed
+
+
+# Evaluation -> [(rule, alert message or None)], None meaning the rule does not fire
+def evaluation_alerts(evaluation):
+    consumption_id = evaluation["consumption_id"]
+    power_max = evaluation["custom_power_max"]
+    highest_exceeded_peak = None
+    highest_warning_peak = None
+    if evaluation["exceeded_timestamp"]:
+        highest_exceeded_peak = (evaluation["exceeded_timestamp"], evaluation["exceeded_power"], power_max)
+    if evaluation["warning_timestamp"]:
+        highest_warning_peak = (evaluation["warning_timestamp"], evaluation["warning_power"], power_max)
+
+    power_alert_threshold = evaluation["power_alert_threshold"] or 0
+    alerts = [(POWER_RULE, generate_alert_message(highest_exceeded_peak, highest_warning_peak, consumption_id,
+                                                  power_alert_threshold, evaluation["warning_threshold"]))]
+
+    # Zero energy threshold means 'disabled'
+    energy_threshold = evaluation["energy_alert_threshold"] or 0
+    energy_alert = None
+    if energy_threshold != 0 and evaluation["reading_count"]:
+        energy_alert = generate_energy_alert_message(evaluation["total_energy"], energy_threshold, consumption_id)
+    alerts.append((ENERGY_RULE, energy_alert))
+
+    return alerts
+
+
+# Statements that save the watermarks of the evaluations and upsert / drop their alerts, as (query, params),
+# three statements for the whole batch whatever its size. Run them in the caller's transaction
+def evaluation_statements(evaluations):
+    watermarks, alerts, dropped = [], [], []
+    for evaluation in evaluations:
+        watermarks.append([evaluation[column] for column in EVALUATION_COLUMNS])
+        for rule, alert_message in evaluation_alerts(evaluation):
+            if alert_message:
+                alerts.append([evaluation["username"], evaluation["device_id"], evaluation["consumption_id"], rule, *alert_message])
+            else:
+                dropped.append([evaluation["consumption_id"], rule])
+
+    statements = []
+    for query, rows, row_values in ((SAVE_EVALUATION_QUERY, watermarks, f"({', '.join(['%s'] * len(EVALUATION_COLUMNS))}, NOW())"),
+                                    (UPSERT_ALERT_QUERY, alerts, "(%s, %s, %s, %s, %s, %s, %s, %s, NOW(), 'N')"),
+                                    (DELETE_ALERT_QUERY, dropped, "(%s, %s)")):
+        if rows:
+            statements.append((query.format(values=", ".join([row_values] * len(rows))), [value for row in rows for value in row]))
+    return statements
+
+
+# ===============================================================================================
+# [STREAMING] Evaluation at ingest time.
+#
+# An AlertEvaluator follows the readings of a new consumption as they are written (update() per chunk, in
+# time order) with running accumulators - count, power sum, highest exceeded and highest warning peak - so
+# its evaluation is ready once the last chunk is in, without reading anything back. Evaluations are then
+# written in batches by an AlertBatch, together with their watermarks, so getPeakPowerAnalysis finds the
+# consumption already evaluated
+#-----------------------------------------------------------------------------------------------
+
+# Warning threshold of a device, as computed by ALERT_EVALUATION_QUERY
+def warning_threshold(custom_power_min, custom_power_max, power_alert_threshold):
+    if custom_power_min is None or custom_power_max is None or custom_power_min == custom_power_max:
+        return None
+    if power_alert_threshold:
+        return power_alert_threshold
+    if custom_power_max == 0:
+        return custom_power_min
+    return max(custom_power_min, custom_power_max * (1 - Decimal("0.02") * (custom_power_max - custom_power_min) / custom_power_max))
+
+
+# numpy.datetime64 / pandas.Timestamp / datetime -> naive datetime (as stored in the TIMESTAMP columns)
+def as_datetime(timestamp):
+    if isinstance(timestamp, np.datetime64):
+        timestamp = timestamp.astype("datetime64[us]").item()
+    elif hasattr(timestamp, "to_pydatetime"):
+        timestamp = timestamp.to_pydatetime()
+    return timestamp.replace(tzinfo=None)
+
+
+class AlertEvaluator:
+    def __init__(self, username, consumption_id, device_id, custom_power_min, custom_power_max, power_alert_threshold, energy_alert_threshold):
+        self.evaluation = {
+            "username": username, "consumption_id": consumption_id, "device_id": device_id,
+            "custom_power_min": custom_power_min, "custom_power_max": custom_power_max,
+            "power_alert_threshold": power_alert_threshold, "energy_alert_threshold": energy_alert_threshold,
+            "warning_threshold": warning_threshold(custom_power_min, custom_power_max, power_alert_threshold),
+            "evaluated_until": None, "reading_count": 0, "power_sum": Decimal(0), "new_readings": 0,
+            "exceeded_timestamp": None, "exceeded_power": None, "warning_timestamp": None, "warning_power": None,
+        }
+        self.power_sum_cents = 0  # Exact running power sum, in hundredths of W (power is NUMERIC(10, 2))
+
+    # Fold a chunk of readings into the accumulators (vectorized over the chunk)
+    def update(self, timestamps, power):
+        power = np.round(np.asarray(power, dtype=np.float64), 2)
+        if not power.size:
+            return
+        evaluation = self.evaluation
+        evaluation["reading_count"] += int(power.size)
+        evaluation["new_readings"] += int(power.size)
+        evaluation["evaluated_until"] = as_datetime(timestamps[-1])
+        self.power_sum_cents += int(np.rint(power * 100).sum())
+
+        power_max = evaluation["custom_power_max"]
+        if power_max is None:
+            return
+        self._update_peak("exceeded", timestamps, power, power > float(power_max))
+        if evaluation["warning_threshold"] is not None:
+            self._update_peak("warning", timestamps, power, (power <= float(power_max)) & (power >= float(evaluation["warning_threshold"])))
+
+    # Highest reading of the chunk within the mask; like the query, later readings only replace a peak
+    # when strictly higher (ties keep the earliest reading)
+    def _update_peak(self, peak, timestamps, power, mask):
+        if not mask.any():
+            return
+        index = np.flatnonzero(mask)[np.argmax(power[mask])]
+        peak_power = Decimal(f"{power[index]:.2f}")
+        if self.evaluation[f"{peak}_power"] is None or peak_power > self.evaluation[f"{peak}_power"]:
+            self.evaluation[f"{peak}_timestamp"] = as_datetime(timestamps[index])
+            self.evaluation[f"{peak}_power"] = peak_power
+
+    # Evaluation of the readings so far, as returned by merge_evaluation()
+    def result(self):
+        evaluation = dict(self.evaluation)
+        evaluation["power_sum"] = Decimal(self.power_sum_cents) / 100
+        evaluation["total_energy"] = float(evaluation["power_sum"]) / 1000.0
+        return evaluation
+
+
+# Evaluations waiting to be written. flush() writes them with evaluation_statements(), in the caller's
+# transaction; callers flush whenever the batch is full() and once at the end
+class AlertBatch:
+    def __init__(self, batch_size=200):
+        self.batch_size = batch_size
+        self.evaluations = []
+        self.alerts_written = 0
+
+    def add(self, evaluation):
+        self.evaluations.append(evaluation)
+
+    def full(self):
+        return len(self.evaluations) >= self.batch_size
+
+    def flush(self, conn):
+        for query, params in evaluation_statements(self.evaluations):
+            conn.execute(query, params)
+        self.alerts_written += sum(1 for evaluation in self.evaluations for _, alert_message in evaluation_alerts(evaluation) if alert_message)
+        self.evaluations = []
+
+
+# ===============================================================================================
+# [MESSAGES] Alert messages of the rules, as (title, description, suggestion, type)
+#-----------------------------------------------------------------------------------------------
+
+# Peaks are (timestamp, power, power_max) of the highest reading above the device maximum power rating, and
+# of the highest reading at or above the warning threshold, or None
+def generate_alert_message(highest_exceeded_peak, highest_warning_peak, consumption_id, power_alert_threshold, warning_threshold):
+
+    if highest_exceeded_peak:
+        timestamp, power, power_max = highest_exceeded_peak
+        timestamp = timestamp.strftime("%d/%m/%Y, %I:%M %p")
+        title = "Critical Power Draw"
+        type = 'C'
+        description = (
+            f"Critical Alert - [{timestamp}]: Power draw of {power:.1f} W has exceeded the "
+            f"device maximum power rating of {power_max:.1f} W, for Consumption ID {consumption_id}. This level of consumption "
+            "may indicate a potential issue with the device or abnormal operation."
+        )
+        suggestion = (
+            "Immediate investigation is advised. Check for any unusual activity or malfunctioning equipment. "
+            "Consider temporarily shutting down the device to mitigate risks."
+        )
+    elif highest_warning_peak:
+        timestamp, power, power_max = highest_warning_peak
+        timestamp = timestamp.strftime("%d/%m/%Y, %I:%M %p")
+        title = "Power Draw Warning"
+        type = 'W'
+        if power_alert_threshold != 0:
+            description = (
+                f"Warning Alert - [{timestamp}]: Power draw of {power:.1f} W has exceeded your set alert threshold "
+                f"of {warning_threshold:.1f} W, for Consumption ID {consumption_id}. This might lead to potential "
+                "capacity challenges if left unchecked, provided that your set alert threshold is accurate for your device."
+            )
+        else:
+            description = (
+                f"Warning Alert - [{timestamp}]: Power draw of {power:.1f} W has exceeded default system alert threshold "
+                f"of {warning_threshold:.1f} W, for Consumption ID {consumption_id}. This might lead to potential "
+                "capacity challenges if left unchecked, as it indicates poor operating efficiency."
+            )
+        suggestion = (
+            "Review your current power usage patterns and alert threshold. Consider rescheduling high-power activities "
+            "to off-peak hours, enabling 'Eco' mode, or distributing the load across different circuits."
+        )
+    else:
+        # No significant power draw - no alert needed
+        return None
+
+    return title, description, suggestion, type
+
+
+def generate_energy_alert_message(total_energy_consumption, energy_threshold, consumption_id):
+    if (total_energy_consumption > energy_threshold) and (total_energy_consumption <= (energy_threshold * 3)):
+        title = "High Energy Consumption"
+        type = 'I'
+        description = (
+            f"Energy Consumption Notice: Your energy consumption of {total_energy_consumption:.2f} kWh for Consumption ID {consumption_id} "
+            f"has surpassed the set threshold of {energy_threshold:.2f} kWh. "
+            "This indicates a higher than usual energy demand."
+        )
+        suggestion = (
+            "Consider identifying devices or activities contributing to high energy usage. "
+            "Regular maintenance, using energy-efficient appliances, and turning off unused devices "
+            "can help in reducing energy consumption."
+        )
+        return title, description, suggestion, type
+    elif (total_energy_consumption > (energy_threshold * 3)):
+        title = "Too High Energy Consumption"
+        type = 'W'
+        description = (
+            f"Energy Consumption Notice: Your energy consumption of {total_energy_consumption:.2f} kWh for Consumption ID {consumption_id} "
+            f"has surpassed (3x) the set threshold of {energy_threshold:.2f} kWh. "
+            "This indicates an exceptionally higher than usual energy demand."
+        )
+        suggestion = (
+            "Immediate action is required due to the exceptionally high energy consumption. "
+            "Consider conducting a comprehensive energy audit to identify the primary sources of excessive usage. "
+            "Replacing old, energy-inefficient equipment with high-efficiency alternatives. "
+            "You may also seek professional advice on implementing an energy management system for more sustainable usage."
+        )
+        return title, description, suggestion, type
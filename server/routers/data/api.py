@@ -1,19 +1,30 @@
 import os
 import io
-import json
-import collections
-import random
+import time
 import datetime
 import calendar
+import itertools
+import numpy as np
 import pandas as pd
 from datetime import date, timedelta
-from decimal import Decimal
 from typing import Optional
 from pydantic import BaseModel
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, File, Form, UploadFile
 from fastapi.responses import StreamingResponse
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 from ...model.dbconnector import PostgresConnector
+from ...model.async_dbconnector import AsyncPostgresConnector
+from ...model.generator import PowerReadingGenerator
+from ...model.serialization import json_response, json_object_response, json_page_response
+from ...model.cache import ResponseCache, create_cache_backend
+from ...model.downsampling import RESOLUTIONS, min_max_buckets_query, downsample_rows
+from ...model.pagination import page_parameters, range_conditions, page_rows
+from ...model.export import EXPORT_FORMATS, EXPORT_CHUNK_SIZE, encode_power_readings
+from ...model.readings_import import IMPORT_FORMATS, import_format, read_chunks, month_ranges
+from ...model.resampling import HourlyResampler
+from .jobs import JobRunner, COMPLETED
+from .statistics import StatisticsRefresher
+from .alerts import ALERT_EVALUATION_QUERY, AlertEvaluator, AlertBatch, merge_evaluation, evaluation_alerts, evaluation_statements
 from ..users.authentication import get_current_user
 
 router = APIRouter()
@@ -26,14 +37,34 @@ connector = PostgresConnector(
     password="password",
 )
 
-class ExtendedEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, Decimal):
-            return float(o)
-        if isinstance(o, datetime.datetime):
-            return o.isoformat()
-        return super().default(o)
-    
+# Background job runner (consumption generation), using the sync connection pool
+job_runner = JobRunner(connector)
+GENERATE_CONSUMPTION_JOB = "generate_consumption"
+
+# Per-user cache of the read endpoints the app calls on every page navigation, in process or shared through
+# Redis (RESPONSE_CACHE_URL=redis://...). Writes invalidate the entries they change, see the *_ENTRIES below
+response_cache = ResponseCache(
+    create_cache_backend(os.environ.get("RESPONSE_CACHE_URL"), max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 2048))),
+    ttl=int(os.environ.get("RESPONSE_CACHE_TTL", 60)),
+    enabled=os.environ.get("RESPONSE_CACHE", "on") != "off",
+)
+
+# Cached entries of a user changed by alert writes, device writes and consumption writes
+ALERT_ENTRIES = ("getDevices", "getDashboardCounters")
+DEVICE_ENTRIES = ("getDevices", "getDashboardCounters", "getTotalPowerPerDevice", "getAveragePowerPerDevice")
+CONSUMPTION_ENTRIES = ("getDevices", "getDashboardCounters", "getTotalPowerPerDevice", "getAveragePowerPerDevice")
+
+# Refresher of the site-wide statistics views, every STATISTICS_REFRESH_INTERVAL seconds and after ingestion
+statistics_refresher = StatisticsRefresher(connector, interval=int(os.environ.get("STATISTICS_REFRESH_INTERVAL", 300)))
+
+async_connector = AsyncPostgresConnector(
+    host="localhost",
+    port=5432,
+    database="postgres",
+    user="postgres",
+    password="password",
+)
+
 class AddAlert(BaseModel):
     device_id: Optional[int] = None
     consumption_id: Optional[int] = None
@@ -74,127 +105,49 @@ class AddConsumptionPowerReadings(BaseModel):
     start_date: date
     end_date: date
     duration_days: float
+    seed: Optional[int] = None
+    background: bool = False
+
+# Downsampling parameters of the reading endpoints: resolution keeps the lowest and highest reading of every
+# hour / day / week / month, max_points then caps the series with LTTB (see model/downsampling.py)
+def check_downsampling(resolution, max_points):
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid resolution, expected one of: {', '.join(RESOLUTIONS)}")
+    if max_points is not None and max_points < 3:
+        raise HTTPException(status_code=400, detail="max_points must be at least 3")
+
+# Streaming export format of the download endpoints, 400 on an unknown one
+def check_export_format(export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format, expected one of: {', '.join(EXPORT_FORMATS)}")
+
+# Export of a readings query as a file streamed from a server-side cursor, see model/export.py. The generator runs
+# in the threadpool (sync pool connection), one chunk at a time, and returns the connection when the download
+# ends or is aborted
+def power_readings_export(query, params, export_format, filename):
+    def stream():
+        with connector.connection() as conn:
+            yield from encode_power_readings(conn.iter_query(query, params, EXPORT_CHUNK_SIZE), export_format)
+
+    media_type, extension = EXPORT_FORMATS[export_format]
+    return StreamingResponse(stream(), media_type=media_type, headers={"Content-Disposition": f"attachment;filename={filename}.{extension}"})
+
+# from / to / cursor / limit query parameters of the paginated endpoints -> named query parameters, 400 on invalid input
+def check_page(from_, to, after_timestamp, after_id, limit):
+    try:
+        return page_parameters(from_, to, after_timestamp, after_id, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @contextmanager
 def database_connection():
-    try:
-        connector.connect()
-        yield
-    finally:
-        connector.disconnect()
-
-def convert_to_json(result, keys):
-    data = [collections.OrderedDict(zip(keys, row)) for row in result]
-    json_data = json.dumps(data, cls=ExtendedEncoder)
-    return json.loads(json_data)
-
-def generate_alert_message(exceeded_peaks, non_exceeded_peaks, consumption_id, power_alert_threshold):
-    
-    # Default warning threshold percentage (if no user power_alert_threshold is specified)
-    default_warning_threshold_percentage = Decimal('0.02')  # Default system - 2% before max power rating
-
-    highest_exceeded_peak = None
-    highest_warning_peak = None
-
-    # Find the highest exceeded peak
-    for peak in exceeded_peaks:
-        if highest_exceeded_peak is None or peak[2] > highest_exceeded_peak[2]:
-            highest_exceeded_peak = peak
+    with connector.connection() as conn:
+        yield conn
 
-    # Find the highest warning peak
-    for peak in non_exceeded_peaks:
-        custom_power_min = Decimal(peak[4])
-        custom_power_max = Decimal(peak[3])
-        power_range = custom_power_max - custom_power_min
-
-        if (power_range == 0):
-            continue
-        else:
-            # Adjust the threshold percentage based on the power range
-            adjusted_threshold_percentage = default_warning_threshold_percentage * (power_range / custom_power_max)
-            calculated_threshold = custom_power_max * (1 - adjusted_threshold_percentage)
-
-            if power_alert_threshold != 0:
-                warning_threshold = Decimal(power_alert_threshold)
-            else:
-                # Ensure warning threshold is not below the minimum power rating
-                warning_threshold = max(custom_power_min, calculated_threshold)
-
-            if Decimal(peak[2]) >= warning_threshold:
-                if highest_warning_peak is None or Decimal(peak[2]) > Decimal(highest_warning_peak[2]):
-                    highest_warning_peak = peak   
-
-    if highest_exceeded_peak:
-        timestamp, power, power_max = highest_exceeded_peak[1], highest_exceeded_peak[2], highest_exceeded_peak[3]
-        timestamp = timestamp.strftime("%d/%m/%Y, %I:%M %p")
-        title = "Critical Power Draw"
-        type = 'C'
-        description = (
-            f"Critical Alert - [{timestamp}]: Power draw of {power:.1f} W has exceeded the "
-            f"device maximum power rating of {power_max:.1f} W, for Consumption ID {consumption_id}. This level of consumption "
-            "may indicate a potential issue with the device or abnormal operation."
-        )
-        suggestion = (
-            "Immediate investigation is advised. Check for any unusual activity or malfunctioning equipment. "
-            "Consider temporarily shutting down the device to mitigate risks."
-        )
-    elif highest_warning_peak:
-        timestamp, power, power_max = highest_warning_peak[1], highest_warning_peak[2], highest_warning_peak[3]
-        timestamp = timestamp.strftime("%d/%m/%Y, %I:%M %p")
-        title = "Power Draw Warning"
-        type = 'W'
-        if power_alert_threshold != 0:
-            description = (
-                f"Warning Alert - [{timestamp}]: Power draw of {power:.1f} W has exceeded your set alert threshold "
-                f"of {warning_threshold:.1f} W, for Consumption ID {consumption_id}. This might lead to potential "
-                "capacity challenges if left unchecked, provided that your set alert threshold is accurate for your device."
-            )
-        else:
-            description = (
-                f"Warning Alert - [{timestamp}]: Power draw of {power:.1f} W has exceeded default system alert threshold "
-                f"of {warning_threshold:.1f} W, for Consumption ID {consumption_id}. This might lead to potential "
-                "capacity challenges if left unchecked, as it indicates poor operating efficiency."
-            )
-        suggestion = (
-            "Review your current power usage patterns and alert threshold. Consider rescheduling high-power activities "
-            "to off-peak hours, enabling 'Eco' mode, or distributing the load across different circuits."
-        )
-    else:
-        # No significant power draw - no alert needed
-        return None
-
-    return title, description, suggestion, type
-
-def generate_energy_alert_message(total_energy_consumption, energy_threshold, consumption_id):
-    if (total_energy_consumption > energy_threshold) and (total_energy_consumption <= (energy_threshold * 3)):
-        title = "High Energy Consumption"
-        type = 'I'
-        description = (
-            f"Energy Consumption Notice: Your energy consumption of {total_energy_consumption:.2f} kWh for Consumption ID {consumption_id} "
-            f"has surpassed the set threshold of {energy_threshold:.2f} kWh. "
-            "This indicates a higher than usual energy demand."
-        )
-        suggestion = (
-            "Consider identifying devices or activities contributing to high energy usage. "
-            "Regular maintenance, using energy-efficient appliances, and turning off unused devices "
-            "can help in reducing energy consumption."
-        )
-        return title, description, suggestion, type
-    elif (total_energy_consumption > (energy_threshold * 3)):
-        title = "Too High Energy Consumption"
-        type = 'W'
-        description = (
-            f"Energy Consumption Notice: Your energy consumption of {total_energy_consumption:.2f} kWh for Consumption ID {consumption_id} "
-            f"has surpassed (3x) the set threshold of {energy_threshold:.2f} kWh. "
-            "This indicates an exceptionally higher than usual energy demand."
-        )
-        suggestion = (
-            "Immediate action is required due to the exceptionally high energy consumption. "
-            "Consider conducting a comprehensive energy audit to identify the primary sources of excessive usage. "
-            "Replacing old, energy-inefficient equipment with high-efficiency alternatives. "
-            "You may also seek professional advice on implementing an energy management system for more sustainable usage."
-        )
-        return title, description, suggestion, type
+@asynccontextmanager
+async def async_database_connection():
+    async with async_connector.connection() as conn:
+        yield conn
 
 # **************************************************************************************************** #
 # ALERTS ENDPOINTS #
@@ -203,24 +156,35 @@ def generate_energy_alert_message(total_energy_consumption, energy_threshold, co
 # ===============================================================================================
 # Endpoint to get user's alerts, with basic info
 @router.get("/getAlerts")
-async def get_alerts(unreadAlertsOnly: bool, username: str = Depends(get_current_user)):
+async def get_alerts(unreadAlertsOnly: bool, from_: Optional[datetime.datetime] = Query(None, alias="from"), to: Optional[datetime.datetime] = None,
+                     after_timestamp: Optional[datetime.datetime] = None, after_id: Optional[int] = None, limit: Optional[int] = None,
+                     username: str = Depends(get_current_user)):
     try:
-        with database_connection():
-            keys = ["id", "title", "username", "device_id", "device_type", "device_name", "description", "suggestion", "date", "type", "read_status"]
-            if (unreadAlertsOnly):
-                result = connector.execute("""
-                SELECT p.alert.id, p.alert.title, p.alert.username, p.alert.device_id, p.alert.description, p.alert.suggestion, p.alert.date, p.alert.type, p.alert.read_status 
-                FROM p.alert
-                WHERE p.alert.username = %s AND p.alert.read_status = %s ORDER BY date DESC""", (username, 'N'))
-            else:
-                result = connector.execute("""
-                SELECT p.alert.id, p.alert.title, p.alert.username, p.alert.device_id, p.device.device_type, p.device.device_name, p.alert.description, p.alert.suggestion, p.alert.date, p.alert.type, p.alert.read_status 
-                FROM p.alert
-                LEFT JOIN p.device ON p.alert.device_id = p.device.id
-                WHERE p.alert.username = %s ORDER BY (read_status='N') DESC, date DESC""", (username,))
-            json_data = convert_to_json(result, keys)
-        
-        return json_data
+        params = check_page(from_, to, after_timestamp, after_id, limit)
+        params["username"] = username
+        keys = ["id", "title", "username", "device_id", "device_type", "device_name", "description", "suggestion", "date", "type", "read_status"]
+
+        query = f"""
+            SELECT p.alert.id, p.alert.title, p.alert.username, p.alert.device_id, p.device.device_type, p.device.device_name, p.alert.description, p.alert.suggestion, p.alert.date, p.alert.type, p.alert.read_status
+            FROM p.alert
+            LEFT JOIN p.device ON p.alert.device_id = p.device.id
+            WHERE p.alert.username = %(username)s{" AND p.alert.read_status = 'N'" if unreadAlertsOnly else ""}{range_conditions(params, "p.alert.date", "p.alert.id", descending=True)}"""
+        if limit is None:
+            # Whole list, unread first
+            query += " ORDER BY (p.alert.read_status = 'N') DESC, p.alert.date DESC"
+        else:
+            # Page, newest first (alert_username_date_idx / alert_username_read_status_date_id_idx)
+            query += " ORDER BY p.alert.date DESC, p.alert.id DESC LIMIT %(page_limit)s"
+
+        async with async_database_connection() as conn:
+            result = await conn.execute(query, params)
+
+        if limit is None:
+            return json_response(result, keys)
+        rows, next_cursor = page_rows(result, limit, 8, 0)
+        return json_page_response(rows, keys, next_cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -229,13 +193,14 @@ async def get_alerts(unreadAlertsOnly: bool, username: str = Depends(get_current
 @router.post("/addAlert")
 async def add_alert(data: AddAlert, username: str = Depends(get_current_user)):
     
-    with database_connection():
-        connector.execute(f"""
+    async with async_database_connection() as conn:
+        await conn.execute(f"""
             INSERT INTO p.alert (username, device_id, title, description, suggestion, date, type, read_status) 
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
             (username, data.device_id, data.title, data.description, data.suggestion, data.date, data.type, data.read_status)
         )
-        connector.commit()
+        await conn.commit()
+    await response_cache.invalidate(username, *ALERT_ENTRIES)
 
     return {"message": f"You have a new alert!"}
 
@@ -244,13 +209,14 @@ async def add_alert(data: AddAlert, username: str = Depends(get_current_user)):
 @router.post("/addRegistrationAlert")
 async def add_registration_alert(data: AddRegistrationAlert):
     
-    with database_connection():
-        connector.execute(f"""
+    async with async_database_connection() as conn:
+        await conn.execute(f"""
             INSERT INTO p.alert (username, device_id, title, description, suggestion, date, type, read_status) 
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
             (data.username, data.device_id, data.title, data.description, data.suggestion, data.date, data.type, data.read_status)
         )
-        connector.commit()
+        await conn.commit()
+    await response_cache.invalidate(data.username, *ALERT_ENTRIES)
 
     return {"message": f"You have a new alert!"}
 
@@ -259,14 +225,15 @@ async def add_registration_alert(data: AddRegistrationAlert):
 @router.patch("/updateAlert")
 async def update_alert(data: UpdateAlert, username: str = Depends(get_current_user)):
     
-    with database_connection():
-        connector.execute(f"""
+    async with async_database_connection() as conn:
+        await conn.execute(f"""
             UPDATE p.alert 
             SET read_status = %s
             WHERE id = %s""",
             (data.read_status, data.id)
         )
-        connector.commit()
+        await conn.commit()
+    await response_cache.invalidate(username, *ALERT_ENTRIES)
         
     return {"message": f"Alert updated!"}
 
@@ -274,25 +241,26 @@ async def update_alert(data: UpdateAlert, username: str = Depends(get_current_us
 # Endpoint remove a single alert
 @router.delete("/removeAlert/{alert_id}")
 async def remove_alert(alert_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            result = connector.execute(
+            result = await conn.execute(
                 """SELECT * FROM p.alert WHERE p.alert.id = %s AND p.alert.username = %s""", (alert_id, username)
             )
             if not result:
                 raise HTTPException(
                     status_code=404, detail=f"Alert with id {alert_id} does not exist."
                 )
-            connector.execute(
+            await conn.execute(
                 "DELETE FROM p.alert WHERE p.alert.id = %s", (alert_id,)
             )
-            connector.commit()
+            await conn.commit()
+            await response_cache.invalidate(username, *ALERT_ENTRIES)
             return {"message": "Alert removed successfully!"}
 
         except HTTPException as e:
             raise e
         except Exception as e:
-            connector.rollback()
+            await conn.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 # ===============================================================================================
@@ -300,19 +268,20 @@ async def remove_alert(alert_id: int, username: str = Depends(get_current_user))
 @router.delete("/removeAlerts")
 async def remove_alerts(username: str = Depends(get_current_user)):
     
-    with database_connection():
+    async with async_database_connection() as conn:
 
         # Case check - alerts exist for a user
-        result = connector.execute("""
+        result = await conn.execute("""
         SELECT p.alert.id, p.alert.username
         FROM p.alert
         WHERE p.alert.username = %s""", (username,))
 
         if (result):
-            connector.execute(f"""
+            await conn.execute(f"""
                 DELETE FROM p.alert WHERE p.alert.username = %s""", (
                     username,))
-            connector.commit()
+            await conn.commit()
+            await response_cache.invalidate(username, *ALERT_ENTRIES)
             return {"message": f"All alerts have been cleared!"}
         else:
             raise HTTPException(status_code=400, detail=f"There are no alerts to clear!")
@@ -327,16 +296,17 @@ async def remove_alerts(username: str = Depends(get_current_user)):
 # ===============================================================================================
 # Endpoint to get available device types
 @router.get("/getDeviceTypes/{device_category}")
+@response_cache.cached("getDeviceTypes", shared=True)
 async def get_device_types(device_category: str):
     try:
-        with database_connection():
+        async with async_database_connection() as conn:
             keys = ["type_name", "device_category", "power_min", "power_max", "power_draw_pattern"]
-            result = connector.execute("""
+            result = await conn.execute("""
             SELECT p.device_type.type_name, p.device_type.device_category, p.device_type.power_min, p.device_type.power_max, p.device_type.power_draw_pattern
             FROM p.device_type
             WHERE p.device_type.device_category = %s
             """, (device_category,))
-            json_data = convert_to_json(result, keys)
+            json_data = json_response(result, keys)
 
         return json_data
     except HTTPException:
@@ -354,11 +324,12 @@ async def get_device_types(device_category: str):
 # ===============================================================================================
 # Endpoint to get user's devices
 @router.get("/getDevices")
+@response_cache.cached("getDevices")
 async def get_devices(username: str = Depends(get_current_user)):
     try:
-        with database_connection():
+        async with async_database_connection() as conn:
             keys = ["id", "user_username", "device_type", "device_category", "device_name", "consumption_logs_count", "unread_alerts_count", "total_alerts_count", "custom_power_min", "custom_power_max", "energy_alert_threshold", "power_alert_threshold", "alert_level"]
-            result = connector.execute("""
+            result = await conn.execute("""
             SELECT p.device.id, p.device.user_username, p.device.device_type, p.device.device_category, p.device.device_name,
                 COALESCE(sub_consumption.consumption_count, 0) AS consumption_logs_count,
                 COALESCE(sub_alerts.unread_alerts_count, 0) AS unread_alerts_count,
@@ -371,16 +342,15 @@ async def get_devices(username: str = Depends(get_current_user)):
                     ELSE 'normal'
                 END AS alert_level
             FROM p.device
-            LEFT JOIN (SELECT device_id, COUNT(*) AS consumption_count FROM p.device_consumption GROUP BY device_id) AS sub_consumption
-                ON p.device.id = sub_consumption.device_id
-            LEFT JOIN (SELECT device_id, COUNT(*) AS total_alerts_count, COUNT(*) FILTER (WHERE read_status = 'N') AS unread_alerts_count 
+            LEFT JOIN LATERAL (SELECT COUNT(*) AS consumption_count FROM p.device_consumption
+                WHERE p.device_consumption.device_id = p.device.id) AS sub_consumption ON TRUE
+            LEFT JOIN LATERAL (SELECT COUNT(*) AS total_alerts_count, COUNT(*) FILTER (WHERE read_status = 'N') AS unread_alerts_count 
                 FROM p.alert 
-                GROUP BY device_id) AS sub_alerts
-                ON p.device.id = sub_alerts.device_id
+                WHERE p.alert.device_id = p.device.id) AS sub_alerts ON TRUE
             WHERE 
                 p.device.user_username = %s
             """, (username,))
-            json_data = convert_to_json(result, keys)
+            json_data = json_response(result, keys)
 
         return json_data
     except HTTPException as e:
@@ -389,14 +359,15 @@ async def get_devices(username: str = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/getDevice/{device_id}")
+@response_cache.cached("getDevice")
 async def get_device(device_id: int, username: str = Depends(get_current_user)):
     try:
-        with database_connection():
+        async with async_database_connection() as conn:
             keys = ["id", "user_username", "device_type", "device_category", "device_name", 
                     "energy_alert_threshold", "power_alert_threshold", "usage_frequency", 
                     "custom_power_min", "custom_power_max"]
             
-            result = connector.execute("""
+            result = await conn.execute("""
             SELECT p.device.id, p.device.user_username, p.device.device_type, p.device.device_category, 
                 p.device.device_name, p.device.energy_alert_threshold, p.device.power_alert_threshold, 
                 p.device.usage_frequency, p.device.custom_power_min, p.device.custom_power_max 
@@ -404,7 +375,7 @@ async def get_device(device_id: int, username: str = Depends(get_current_user)):
             WHERE p.device.id = %s AND p.device.user_username = %s
             """, (device_id, username))
             
-            json_data = convert_to_json(result, keys)
+            json_data = json_response(result, keys)
 
         return json_data
     except HTTPException:
@@ -415,11 +386,12 @@ async def get_device(device_id: int, username: str = Depends(get_current_user)):
 # ===============================================================================================
 # Endpoint to get all consumptions logs for a specific device
 @router.get("/getDeviceConsumption/{device_id}")
+@response_cache.cached("getDeviceConsumption")
 async def get_device_consumption(device_id: int, username: str = Depends(get_current_user)):
     try:
-        with database_connection():
+        async with async_database_connection() as conn:
             keys = ["consumption_id", "start_date", "end_date", "duration_days", "files_names", "power_max", "energy_max"]
-            result = connector.execute("""
+            result = await conn.execute("""
             SELECT p.consumption.id, p.consumption.start_date, p.consumption.end_date, p.consumption.duration_days, p.consumption.files_names, p.consumption.power_max, p.consumption.energy_max
             FROM p.device
             JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
@@ -427,7 +399,7 @@ async def get_device_consumption(device_id: int, username: str = Depends(get_cur
             WHERE p.device.id = %s AND p.device.user_username = %s
             ORDER BY p.consumption.start_date
             """, (device_id, username))
-            json_data = convert_to_json(result, keys)
+            json_data = json_response(result, keys)
 
         return json_data
     except HTTPException:
@@ -438,65 +410,135 @@ async def get_device_consumption(device_id: int, username: str = Depends(get_cur
 # ===============================================================================================
 # Endpoint to get all alerts for a specific device
 @router.get("/getDeviceAlerts/{device_id}")
-async def get_device_alerts(device_id: int, username: str = Depends(get_current_user)):
+async def get_device_alerts(device_id: int, from_: Optional[datetime.datetime] = Query(None, alias="from"), to: Optional[datetime.datetime] = None,
+                            after_timestamp: Optional[datetime.datetime] = None, after_id: Optional[int] = None, limit: Optional[int] = None,
+                            username: str = Depends(get_current_user)):
     try:
-        with database_connection():
-            keys = ["id", "title", "description", "device_id", "consumption_id", "device_type", "device_name", "suggestion", "date", "type", "read_status"]
-            result = connector.execute("""
+        params = check_page(from_, to, after_timestamp, after_id, limit)
+        params.update(device_id=device_id, username=username)
+        keys = ["id", "title", "description", "device_id", "consumption_id", "device_type", "device_name", "suggestion", "date", "type", "read_status"]
+
+        query = f"""
             SELECT p.alert.id, p.alert.title, p.alert.description, p.alert.device_id, p.alert.consumption_id, p.device.device_type, p.device.device_name, p.alert.suggestion, p.alert.date, p.alert.type, p.alert.read_status
             FROM p.alert
             JOIN p.device ON p.alert.device_id = p.device.id
-            WHERE p.alert.device_id = %s AND p.device.user_username = %s""", (device_id, username))
-            json_data = convert_to_json(result, keys)
-
-        return json_data
-    
+            WHERE p.alert.device_id = %(device_id)s AND p.device.user_username = %(username)s{range_conditions(params, "p.alert.date", "p.alert.id", descending=True)}"""
+        if limit is not None:
+            # Page, newest first (alert_device_date_idx)
+            query += " ORDER BY p.alert.date DESC, p.alert.id DESC LIMIT %(page_limit)s"
+
+        async with async_database_connection() as conn:
+            result = await conn.execute(query, params)
+
+        if limit is None:
+            return json_response(result, keys)
+        rows, next_cursor = page_rows(result, limit, 8, 0)
+        return json_page_response(rows, keys, next_cursor)
     except HTTPException:
-        raise e
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # =============================================================================================== 
 # Endpoint to get all power readings for a specific device, including consumption start and end dates
 @router.get("/getDevicePowerReadings/{device_id}")
-async def get_device_power_readings(device_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+async def get_device_power_readings(device_id: int, resolution: Optional[str] = None, max_points: Optional[int] = None,
+                                    from_: Optional[datetime.datetime] = Query(None, alias="from"), to: Optional[datetime.datetime] = None,
+                                    after_timestamp: Optional[datetime.datetime] = None, after_id: Optional[int] = None, limit: Optional[int] = None,
+                                    username: str = Depends(get_current_user)):
+    async with async_database_connection() as conn:
         try:
+            check_downsampling(resolution, max_points)
+            params = check_page(from_, to, after_timestamp, after_id, limit)
+            if limit is not None and (resolution or max_points):
+                raise HTTPException(status_code=400, detail="limit cannot be combined with resolution / max_points")
+            params.update(device_id=device_id, username=username, resolution=resolution)
             keys = ["power_reading_id", "consumption_id", "reading_timestamp", "power", "start_date", "end_date"]
+            conditions = range_conditions(params, "p.power_reading.reading_timestamp", "p.power_reading.id")
 
-            result = connector.execute("""
-            SELECT p.power_reading.id, p.power_reading.consumption_id, p.power_reading.reading_timestamp, p.power_reading.power, p.consumption.start_date, p.consumption.end_date
-            FROM p.device
-            JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-            JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
-            JOIN p.power_reading ON p.consumption.id = p.power_reading.consumption_id
-            WHERE p.device.id = %s AND p.device.user_username = %s
-            ORDER BY p.power_reading.reading_timestamp                           
-            """, (device_id, username))
-            json_data = convert_to_json(result, keys)
+            if limit is None:
+                query = f"""
+                SELECT p.power_reading.id, p.power_reading.consumption_id, p.power_reading.reading_timestamp, p.power_reading.power, p.consumption.start_date, p.consumption.end_date
+                FROM p.device
+                JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+                JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+                JOIN p.power_reading ON p.consumption.id = p.power_reading.consumption_id
+                    AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+                    AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'{conditions}
+                WHERE p.device.id = %(device_id)s AND p.device.user_username = %(username)s
+                ORDER BY p.power_reading.reading_timestamp
+                """
+                if resolution:
+                    query = min_max_buckets_query(query, ["id", "consumption_id", "reading_timestamp", "power", "start_date", "end_date"])
+            else:
+                # Page: at most page_limit readings of every consumption of the device, each an index range scan of
+                # power_reading_consumption_timestamp_idx from the cursor on, merged and cut to the page. Consumptions
+                # can overlap in time, so the reading id breaks ties between equal timestamps
+                query = f"""
+                SELECT readings.id, readings.consumption_id, readings.reading_timestamp, readings.power, p.consumption.start_date, p.consumption.end_date
+                FROM p.device
+                JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+                JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
+                CROSS JOIN LATERAL (
+                    SELECT p.power_reading.id, p.power_reading.consumption_id, p.power_reading.reading_timestamp, p.power_reading.power
+                    FROM p.power_reading
+                    WHERE p.power_reading.consumption_id = p.consumption.id
+                        AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+                        AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'{conditions}
+                    ORDER BY p.power_reading.reading_timestamp
+                    LIMIT %(page_limit)s
+                ) readings
+                WHERE p.device.id = %(device_id)s AND p.device.user_username = %(username)s
+                ORDER BY readings.reading_timestamp, readings.id
+                LIMIT %(page_limit)s
+                """
 
-            return json_data
+            result = await conn.execute(query, params)
+
+            if limit is None:
+                return json_response(downsample_rows(result, max_points, 2, 3), keys)
+            rows, next_cursor = page_rows(result, limit, 2, 0)
+            return json_page_response(rows, keys, next_cursor)
         except HTTPException as e:
             raise e
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
 # ================================================================================================= 
-# Endpoint to download all power readings of all consumptions for a specific device, as .xlsx file
+# Endpoint to download all power readings of all consumptions for a specific device, as .xlsx file, or streamed
+# as csv / csv.gz / parquet with ?format=
 @router.get("/downloadAllConsumptionPowerReadings/{device_id}")
-async def download_power_readings(device_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+async def download_power_readings(device_id: int, format: Optional[str] = None, username: str = Depends(get_current_user)):
+    async with async_database_connection() as conn:
         try:
+            if format is not None:
+                check_export_format(format)
+                readings_check = await conn.execute("""
+                    SELECT 1 FROM p.device
+                    JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+                    WHERE p.device.id = %s AND p.device.user_username = %s
+                        AND EXISTS (SELECT 1 FROM p.power_reading WHERE p.power_reading.consumption_id = p.device_consumption.consumption_id)
+                    LIMIT 1""",
+                    (device_id, username)
+                )
+                if not readings_check:
+                    raise HTTPException(status_code=404, detail="No data found")
+
             query = """
             SELECT p.power_reading.reading_timestamp, p.power_reading.power
             FROM p.device
             JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
             JOIN p.consumption ON p.device_consumption.consumption_id = p.consumption.id
             JOIN p.power_reading ON p.consumption.id = p.power_reading.consumption_id
+                AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+                AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
             WHERE p.device.id = %s AND p.device.user_username = %s
             ORDER BY p.power_reading.reading_timestamp
             """
-            result = connector.execute(query, (device_id, username))
+            if format is not None:
+                return power_readings_export(query, (device_id, username), format, f"{device_id}_data")
+
+            result = await conn.execute(query, (device_id, username))
 
             if result:
                 # Convert to DataFrame
@@ -518,38 +560,33 @@ async def download_power_readings(device_id: int, username: str = Depends(get_cu
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-# Endpoint to download all power readings of a single consumption for a specific device, as .csv file
+# Endpoint to download all power readings of a single consumption for a specific device, as .csv file (or
+# csv.gz / parquet with ?format=), streamed from a server-side cursor
 @router.get("/downloadConsumptionPowerReadings/{consumption_id}")
-async def download_single_consumption_power_readings(consumption_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+async def download_single_consumption_power_readings(consumption_id: int, format: str = "csv", username: str = Depends(get_current_user)):
+    async with async_database_connection() as conn:
         try:
+            check_export_format(format)
+            readings_check = await conn.execute("""
+                SELECT 1 FROM p.device_consumption
+                JOIN p.device ON p.device_consumption.device_id = p.device.id
+                WHERE p.device_consumption.consumption_id = %s AND p.device.user_username = %s
+                    AND EXISTS (SELECT 1 FROM p.power_reading WHERE p.power_reading.consumption_id = p.device_consumption.consumption_id)""",
+                (consumption_id, username)
+            )
+            if not readings_check:
+                raise HTTPException(status_code=404, detail="No data found")
+
             query = """
             SELECT p.power_reading.reading_timestamp, p.power_reading.power
             FROM p.consumption
             JOIN p.power_reading ON p.consumption.id = p.power_reading.consumption_id
+                AND p.power_reading.reading_timestamp >= date_trunc('month', p.consumption.start_date)
+                AND p.power_reading.reading_timestamp < date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
             WHERE p.consumption.id = %s
             ORDER BY p.power_reading.reading_timestamp
             """
-            result = connector.execute(query, (consumption_id,))
-
-            if result:
-                # Convert to DataFrame
-                df = pd.DataFrame(result, columns=['reading_timestamp', 'power'])
-                
-                # Convert DataFrame to CSV
-                output = io.StringIO()
-                df.to_csv(output, index=False)
-                output.seek(0)
-
-                filename = f"{consumption_id}_power_readings.csv"
-
-                return StreamingResponse(
-                    iter([output.getvalue()]), 
-                    media_type='text/csv',
-                    headers={"Content-Disposition": f"attachment;filename={filename}"}
-                )
-            else:
-                raise HTTPException(status_code=404, detail="No data found")
+            return power_readings_export(query, (consumption_id,), format, f"{consumption_id}_power_readings")
         except HTTPException as e:
             raise e
         except Exception as e:
@@ -559,9 +596,9 @@ async def download_single_consumption_power_readings(consumption_id: int, userna
 # Endpoint to remove all alerts for a specific device
 @router.delete("/removeDeviceAlerts/{device_id}")
 async def remove_device_alerts(device_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            ownership_check = connector.execute("""
+            ownership_check = await conn.execute("""
                 SELECT 1 FROM p.device
                 WHERE p.device.id = %s AND p.device.user_username = %s""",
                 (device_id, username)
@@ -569,17 +606,18 @@ async def remove_device_alerts(device_id: int, username: str = Depends(get_curre
             if not ownership_check:
                 raise HTTPException(status_code=404, detail="Device not found or not owned by user")
 
-            connector.execute("""
+            await conn.execute("""
                 DELETE FROM p.alert WHERE p.alert.device_id = %s""",
                 (device_id,)
             )
-            connector.commit()
+            await conn.commit()
+            await response_cache.invalidate(username, *ALERT_ENTRIES)
             return {"message": "Device alerts have been cleared!"}
         
         except HTTPException:
             raise e
         except Exception as e:
-            connector.rollback()
+            await conn.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -587,173 +625,209 @@ async def remove_device_alerts(device_id: int, username: str = Depends(get_curre
 # Endpoint to remove a single consumption record 
 @router.delete("/removeConsumption/{consumption_id}")
 async def remove_consumption(consumption_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:     
-            # First, delete the related alerts
-            connector.execute("""
-                DELETE FROM p.alert 
-                WHERE consumption_id IN (
-                    SELECT id FROM p.consumption WHERE id = %s AND EXISTS (
+            async with conn.transaction():
+                # First, delete the related alerts and alert evaluation watermarks
+                for table in ("p.alert", "p.alert_evaluation"):
+                    await conn.execute(f"""
+                        DELETE FROM {table}
+                        WHERE consumption_id IN (
+                            SELECT id FROM p.consumption WHERE id = %s AND EXISTS (
+                                SELECT 1 FROM p.device
+                                JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
+                                WHERE p.device_consumption.consumption_id = %s AND p.device.user_username = %s
+                            )
+                        )""",
+                        (consumption_id, consumption_id, username)
+                    )
+
+                # Then, delete the consumption record
+                removed = await conn.execute("""
+                    DELETE FROM p.device_consumption 
+                    WHERE consumption_id = %s AND EXISTS (
                         SELECT 1 FROM p.device
                         JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
                         WHERE p.device_consumption.consumption_id = %s AND p.device.user_username = %s
                     )
-                )""",
-                (consumption_id, consumption_id, username)
-            )
+                    RETURNING device_id""",
+                    (consumption_id, consumption_id, username)
+                )
 
-            # Then, delete the consumption record
-            connector.execute("""
-                DELETE FROM p.device_consumption 
-                WHERE consumption_id = %s AND EXISTS (
-                    SELECT 1 FROM p.device
-                    JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                    WHERE p.device_consumption.consumption_id = %s AND p.device.user_username = %s
-                )""",
-                (consumption_id, consumption_id, username)
-            )
+                # Finally, recompute the device's usage rollups for the months of the consumption
+                for (device_id,) in removed or []:
+                    await conn.execute("""
+                        SELECT p.refresh_device_usage(%s, start_date, end_date) FROM p.consumption WHERE id = %s""",
+                        (device_id, consumption_id)
+                    )
+
+            for (device_id,) in removed or []:
+                await response_cache.invalidate(username, *CONSUMPTION_ENTRIES, ("getDeviceConsumption", device_id))
 
-            connector.commit()
             return {"message": "Consumption record and related alerts removed successfully!"}
 
         except HTTPException as e:
             raise e
         except Exception as e:
-            connector.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 # ===============================================================================================
 # Endpoint to remove all consumption records for a specific device (and, optionally associated alerts)
 @router.delete("/removeAllDeviceConsumption/{device_id}")
 async def remove_all_device_consumption(device_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:     
-            # First, delete related alerts
-            connector.execute("""
-                DELETE FROM p.alert 
-                WHERE consumption_id IN (
-                    SELECT p.consumption.id FROM p.consumption
-                    JOIN p.device_consumption ON p.consumption.id = p.device_consumption.consumption_id
-                    WHERE p.device_consumption.device_id = %s AND EXISTS (
-                        SELECT 1 FROM p.device WHERE id = %s AND user_username = %s
+            async with conn.transaction():
+                # First, delete related alerts and alert evaluation watermarks
+                for table in ("p.alert", "p.alert_evaluation"):
+                    await conn.execute(f"""
+                        DELETE FROM {table}
+                        WHERE consumption_id IN (
+                            SELECT p.consumption.id FROM p.consumption
+                            JOIN p.device_consumption ON p.consumption.id = p.device_consumption.consumption_id
+                            WHERE p.device_consumption.device_id = %s AND EXISTS (
+                                SELECT 1 FROM p.device WHERE id = %s AND user_username = %s
+                            )
+                        )""",
+                        (device_id, device_id, username)
                     )
-                )""",
-                (device_id, device_id, username)
-            )
 
-            # Then, delete all device consumption records
-            connector.execute("""
-                DELETE FROM p.device_consumption 
-                WHERE device_id = %s AND EXISTS (
-                    SELECT 1 FROM p.device WHERE id = %s AND user_username = %s
-                )""",
-                (device_id, device_id, username)
-            )
+                # Then, delete all device consumption records
+                await conn.execute("""
+                    DELETE FROM p.device_consumption 
+                    WHERE device_id = %s AND EXISTS (
+                        SELECT 1 FROM p.device WHERE id = %s AND user_username = %s
+                    )""",
+                    (device_id, device_id, username)
+                )
+
+                # Finally, clear the device's usage rollups
+                for table in ("p.device_daily_usage", "p.device_monthly_usage"):
+                    await conn.execute(f"""
+                        DELETE FROM {table}
+                        WHERE device_id = %s AND EXISTS (
+                            SELECT 1 FROM p.device WHERE id = %s AND user_username = %s
+                        )""",
+                        (device_id, device_id, username)
+                    )
 
-            connector.commit()
+            await response_cache.invalidate(username, *CONSUMPTION_ENTRIES, ("getDeviceConsumption", device_id))
             return {"message": "All device consumption records and related alerts have been cleared!"}
 
         except HTTPException as e:
             raise e
         except Exception as e:
-            connector.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 # ===============================================================================================
 # Endpoint to remove all consumption records for all devices of a specific user (and, optionally associated alerts)
 @router.delete("/removeAllUserConsumptions")
 async def remove_all_user_consumptions(username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            # First, delete related alerts for all devices of the user
-            connector.execute("""
-                DELETE FROM p.alert 
-                WHERE consumption_id IN (
-                    SELECT p.consumption.id FROM p.consumption
-                    JOIN p.device_consumption ON p.consumption.id = p.device_consumption.consumption_id
-                    JOIN p.device ON p.device_consumption.device_id = p.device.id
-                    WHERE p.device.user_username = %s
-                )""",
-                (username,)
-            )
+            async with conn.transaction():
+                # First, delete related alerts and alert evaluation watermarks for all devices of the user
+                for table in ("p.alert", "p.alert_evaluation"):
+                    await conn.execute(f"""
+                        DELETE FROM {table}
+                        WHERE consumption_id IN (
+                            SELECT p.consumption.id FROM p.consumption
+                            JOIN p.device_consumption ON p.consumption.id = p.device_consumption.consumption_id
+                            JOIN p.device ON p.device_consumption.device_id = p.device.id
+                            WHERE p.device.user_username = %s
+                        )""",
+                        (username,)
+                    )
 
-            # Then, delete all consumption records for all devices of the user
-            connector.execute("""
-                DELETE FROM p.device_consumption 
-                WHERE device_id IN (
-                    SELECT id FROM p.device WHERE user_username = %s
-                )""",
-                (username,)
-            )
+                # Then, delete all consumption records for all devices of the user
+                await conn.execute("""
+                    DELETE FROM p.device_consumption 
+                    WHERE device_id IN (
+                        SELECT id FROM p.device WHERE user_username = %s
+                    )""",
+                    (username,)
+                )
 
-            connector.commit()
+                # Finally, clear the usage rollups of the user's devices
+                for table in ("p.device_daily_usage", "p.device_monthly_usage"):
+                    await conn.execute(f"""
+                        DELETE FROM {table}
+                        WHERE device_id IN (
+                            SELECT id FROM p.device WHERE user_username = %s
+                        )""",
+                        (username,)
+                    )
+
+            await response_cache.invalidate(username, *CONSUMPTION_ENTRIES, "getDeviceConsumption")
             return {"message": "All consumption records and related alerts have been cleared!"}
 
         except HTTPException as e:
             raise e
         except Exception as e:
-            connector.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 # ===============================================================================================
 # Endpoint to add a device to user's devices
 @router.post("/addDevice")
 async def add_device(data: DeviceData, username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            connector.execute(
+            await conn.execute(
                 "INSERT INTO p.device (user_username, device_type, device_category, device_name, energy_alert_threshold, power_alert_threshold, usage_frequency, custom_power_min, custom_power_max) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
                 (username, data.device_type, data.device_category, data.device_name, data.energy_alert_threshold, data.power_alert_threshold, data.usage_frequency, data.custom_power_min, data.custom_power_max)
             )
-            connector.commit()
+            await conn.commit()
+            await response_cache.invalidate(username, *DEVICE_ENTRIES)
             return {"message": f"Device '{data.device_name}' added successfully!"}
         except HTTPException:
             raise
         except Exception as e:
-            connector.rollback()
+            await conn.rollback()
             raise HTTPException(status_code=500, detail=str(e))
         
 # ===============================================================================================
 # Endpoint to edit a user's device
 @router.patch("/editDevice/{device_id}")
 async def edit_device(device_id: int, data: DeviceData, username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            connector.execute(
+            await conn.execute(
                 "UPDATE p.device SET device_type = %s, device_category = %s, device_name = %s, energy_alert_threshold = %s, power_alert_threshold = %s, usage_frequency = %s, custom_power_min = %s, custom_power_max = %s WHERE id = %s AND user_username = %s",
                 (data.device_type, data.device_category, data.device_name, data.energy_alert_threshold, data.power_alert_threshold, data.usage_frequency, data.custom_power_min, data.custom_power_max, device_id, username)
             )
-            connector.commit()
+            await conn.commit()
+            await response_cache.invalidate(username, *DEVICE_ENTRIES, ("getDevice", device_id))
             return {"message": f"Device '{data.device_name}' updated successfully!"}
         except HTTPException:
             raise
         except Exception as e:
-            connector.rollback()
+            await conn.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 # ===============================================================================================
 # Endpoint remove a user's device
 @router.delete("/removeDevice/{device_id}")
 async def remove_device(device_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            result = connector.execute(
+            result = await conn.execute(
                 """SELECT * FROM p.device WHERE p.device.id = %s AND p.device.user_username = %s""", (device_id, username)
             )
             if not result:
                 raise HTTPException(
                     status_code=404, detail=f"Device with id {device_id} does not exist."
                 )
-            connector.execute(
+            await conn.execute(
                 "DELETE FROM p.device WHERE p.device.id = %s", (device_id,)
             )
-            connector.commit()
+            await conn.commit()
+            await response_cache.invalidate(username, *DEVICE_ENTRIES, ("getDevice", device_id), ("getDeviceConsumption", device_id))
             return {"message": "Device removed successfully!"}
 
         except HTTPException as e:
             raise e
         except Exception as e:
-            connector.rollback()
+            await conn.rollback()
             raise HTTPException(status_code=500, detail=str(e))
         
 
@@ -764,192 +838,343 @@ async def remove_device(device_id: int, username: str = Depends(get_current_user
 # **************************************************************************************************** #
 
 # ===============================================================================================
-# Endpoint to get all power readings for all consumptions of a device - Enhanced
+# Endpoint to generate power readings for a device, as monthly consumption records - Enhanced
+# Runs as a job: inline by default, or on the background worker pool when 'background' is set,
+# in which case the job id is returned right away and progress is polled through /jobs/{job_id}
 @router.post("/addConsumptionPowerReadings")
 def generate_power_readings(data: AddConsumptionPowerReadings, username: str = Depends(get_current_user)):
-    with database_connection():
+    with database_connection() as conn:
         try:
-            # Get device type details
-            device_details = connector.execute("""
-                SELECT p.device.device_type, p.device.custom_power_min, p.device.custom_power_max, p.device_type.power_draw_pattern, p.device.device_category, p.device.device_name 
-                FROM p.device 
-                JOIN p.device_type ON p.device.device_type = p.device_type.type_name 
-                WHERE p.device.id = %s AND p.device.user_username = %s
+            ownership_check = conn.execute("""
+                SELECT 1 FROM p.device WHERE p.device.id = %s AND p.device.user_username = %s
                 """, (data.device_id, username))
 
-            if not device_details:
+            if not ownership_check:
                 print(f"No device found with ID {data.device_id}")
                 return
 
-            device_type, custom_power_min, custom_power_max, power_draw_pattern, device_category, device_name = device_details[0]
-            
-            # List to store the newly created consumption IDs
-            consumption_ids = [] 
-            
-            # Conversion to float 
-            power_min_float = float(custom_power_min)
-            power_max_float = float(custom_power_max)
-            
-            # Define the frequency of readings
-            delta = datetime.timedelta(hours=1)
-            
-            # Initialize previous reading for the first iteration, and reset inactivity duation
-            previous_power = random.uniform(power_min_float, power_max_float)
-            was_spike = False
-            was_inactive = False
-            inactivity_duration = 0
-            
-            # Parse the start and end dates from the request
-            current_interval_start = datetime.datetime.combine(data.start_date, datetime.datetime.min.time())
-            end_date = datetime.datetime.combine(data.end_date, datetime.datetime.min.time())
-            
-            # Breakdown the period into monthly intervals
-            while current_interval_start < end_date:
-                year, month = current_interval_start.year, current_interval_start.month
-                last_day = calendar.monthrange(year, month)[1]
-                interval_end = datetime.datetime(year, month, last_day, 23, 59, 59)
-
-                # Adjust if interval_end exceeds end_date
-                if interval_end > end_date:
-                    interval_end = end_date
-
-                interval_duration = (interval_end - current_interval_start).days +1;
-                max_power_for_interval = 0
-                max_energy_for_interval = 0
-                energy_accumulated = 0
-
-                # Remove invalid characters from device_name
-                invalid_chars = "!@#$%^&*()[]{};:,/<>?\|`~=_+"
-                cleaned_device_name = device_name.translate(str.maketrans("", "", invalid_chars))
-                
-                # Convert to lowercase, replace spaces with underscores, format dates 
-                formatted_device_name = cleaned_device_name.lower().replace(" ", "_")
-                start_date_formatted = current_interval_start.strftime('%d%m%Y')
-                end_date_formatted = interval_end.strftime('%d%m%Y')
-                
-                # Define the file name with underscores and the correct file extension
-                file_name = f"{formatted_device_name}_{start_date_formatted}_{end_date_formatted}.csv"
-                
-                # Create a new consumption record for the interval and get the ID
-                insert_consumption_query = """
-                    INSERT INTO p.consumption (start_date, end_date, duration_days, device_type, device_category, device_name, files_names) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;
-                """
-                try:
-                    result = connector.execute(insert_consumption_query, (current_interval_start, interval_end, interval_duration, device_type, device_category, device_name, file_name))
-                    if result is not None and len(result) > 0:
-                        consumption_id = result[0][0]
-                    else:
-                        print("No ID returned from the consumption insert query")
-                        connector.rollback()
-                        return
-                except Exception as e:
-                    connector.rollback()
-                    print(f"Error inserting consumption record: {e}")
-                    raise HTTPException(status_code=500, detail=str(e))
-
-                # Link the consumption record with the device
-                connector.execute("""
-                    INSERT INTO p.device_consumption (device_id, consumption_id)
-                    VALUES (%s, %s);
-                    """, (data.device_id, consumption_id))
-                
-                # GENERATE POWER READINGS
-                #-----------------------------------
-                # Generate readings for the interval
-                current_time = current_interval_start
-                while current_time <= interval_end:
-                    # Set power to 0 for periods of inactivity
-                    if was_inactive and inactivity_duration > 0:
-                        power = 0
-                        inactivity_duration -= 1
-                    else:
-                        if random.random() < 0.0008:  # 0,08% chance to spike
-                            power = random.uniform(power_max_float, power_max_float * 1.2)
-                            was_spike = True
-                            was_inactive = False
-                        elif (power_draw_pattern == 'Occasional' and random.random() < 0.35) or \
-                            (power_draw_pattern == 'Rare' and random.random() < 0.75):
-                            if (power_draw_pattern == 'Occasional'):
-                                inactivity_duration = random.randint(6, 10)
-                            else:
-                                inactivity_duration = random.randint(12, 24)
-                            power = 0
-                            was_inactive = True
-                            was_spike = False
-                        else:
-                            # Randomly choose a percentage between 1% and 3%
-                            fluctuation_percentage = random.uniform(0.01, 0.03)  # Random percentage between 1% and 3%
-                            max_change = (power_max_float - power_min_float) * fluctuation_percentage
-                            
-                            # Reset to a normal range value if the previous reading was a spike or inactive
-                            if was_spike or was_inactive:
-                                previous_power = random.uniform(power_min_float, power_max_float)
-                                was_spike = False
-                                was_inactive = False
-
-                            # Generate the next normal reading
-                            next_min = max(power_min_float, previous_power - max_change)
-                            next_max = min(power_max_float, previous_power + max_change)
-                            power = random.uniform(next_min, next_max)
-
-                    # Energy calculation (for hourly power redings)
-                    # Convert power (W) to energy (kWh) for one hour
-                    energy = power * 1 / 1000  
-                    energy_accumulated += energy
-
-                    # Update max energy if needed
-                    if energy_accumulated > max_energy_for_interval:
-                        max_energy_for_interval = energy_accumulated
-
-                    connector.execute("""
-                        INSERT INTO p.power_reading (consumption_id, reading_timestamp, power) 
-                        VALUES (%s, %s, %s);
-                        """, (consumption_id, current_time, power))
-                    current_time += delta
-
-                    if not (was_spike or was_inactive):
-                        previous_power = power
-
-                    if power > max_power_for_interval:
-                        max_power_for_interval = power
-
-                # Move to the first day of the next month
-                next_month = current_interval_start.replace(day=1, month=month % 12 + 1, year=year + (month // 12))
-                current_interval_start = next_month if next_month > current_interval_start else next_month.replace(year=year + 1)
-
-                # After generating power readings for the interval, update max_power in p.consumption
-                connector.execute("""
-                    UPDATE p.consumption SET power_max = %s, energy_max = %s WHERE p.consumption.id = %s
-                    """, (max_power_for_interval, max_energy_for_interval, consumption_id))
-
-                # Add the consumption_id to the list
-                consumption_ids.append(consumption_id)
-                
-                # Reset max_power_for_interval, max_energy_for_interval for the next interval
-                max_power_for_interval = 0
-                max_energy_for_interval = 0
-            
-            connector.commit()
-            return {"message": "Consumption added successfully!", "consumption_ids": consumption_ids}
+            params = {
+                "device_id": data.device_id,
+                "start_date": data.start_date.isoformat(),
+                "end_date": data.end_date.isoformat(),
+                "seed": data.seed,
+            }
+            months_total = len(list(monthly_intervals(data.start_date, data.end_date)))
+
+            with conn.transaction():
+                job_id = job_runner.create(conn, username, GENERATE_CONSUMPTION_JOB, data.device_id, params, months_total)
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    if data.background:
+        job_runner.submit(job_id)
+        return {"message": "Consumption generation started!", "job_id": job_id}
+
+    job = job_runner.run(job_id)
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=500, detail=job["error"] or f"Consumption generation {job['status']}")
+    return {"message": "Consumption added successfully!", "consumption_ids": job["consumption_ids"], "job_id": job_id}
+
+# Breakdown a period into monthly intervals of (interval_start, interval_end)
+def monthly_intervals(start_date, end_date):
+    current_interval_start = datetime.datetime.combine(start_date, datetime.datetime.min.time())
+    end_date = datetime.datetime.combine(end_date, datetime.datetime.min.time())
+
+    while current_interval_start < end_date:
+        year, month = current_interval_start.year, current_interval_start.month
+        last_day = calendar.monthrange(year, month)[1]
+        interval_end = datetime.datetime(year, month, last_day, 23, 59, 59)
+
+        # Adjust if interval_end exceeds end_date
+        if interval_end > end_date:
+            interval_end = end_date
+
+        yield current_interval_start, interval_end
+
+        # Move to the first day of the next month
+        next_month = current_interval_start.replace(day=1, month=month % 12 + 1, year=year + (month // 12))
+        current_interval_start = next_month if next_month > current_interval_start else next_month.replace(year=year + 1)
+
+# Job handler - generates one consumption record per monthly interval, committing each interval
+# together with the job's progress, so that a cancelled or interrupted job keeps the finished months
+def run_consumption_generation_job(conn, job):
+    params = job["params"]
+
+    # Get device type details
+    device_details = conn.execute("""
+        SELECT p.device.device_type, p.device.custom_power_min, p.device.custom_power_max, p.device_type.power_draw_pattern, p.device.device_category, p.device.device_name,
+            p.device.power_alert_threshold, p.device.energy_alert_threshold
+        FROM p.device 
+        JOIN p.device_type ON p.device.device_type = p.device_type.type_name 
+        WHERE p.device.id = %s AND p.device.user_username = %s
+        """, (params["device_id"], job["username"]))
+
+    if not device_details:
+        raise Exception(f"No device found with ID {params['device_id']}")
+
+    device_type, custom_power_min, custom_power_max, power_draw_pattern, device_category, device_name, power_alert_threshold, energy_alert_threshold = device_details[0]
+
+    # Vectorized reading generator, seeded per request (reproducible when a seed is given),
+    # restored from the last checkpoint when the job is resumed
+    generator = PowerReadingGenerator(custom_power_min, custom_power_max, power_draw_pattern, np.random.default_rng(params["seed"]))
+    if job["state"]:
+        generator.set_state(job["state"])
+
+    # Create the monthly partitions of p.power_reading for the whole period up front, in a short transaction
+    # of its own, so the per-month transactions below never hold the partition lock
+    with conn.transaction():
+        conn.ensure_power_reading_partitions(params["start_date"], params["end_date"])
+
+    # Alerts of the generated consumptions, evaluated as their readings are written
+    alert_batch = AlertBatch()
+
+    intervals = monthly_intervals(datetime.date.fromisoformat(params["start_date"]), datetime.date.fromisoformat(params["end_date"]))
+    for current_interval_start, interval_end in itertools.islice(intervals, job["months_done"], None):
+        job_runner.check_cancelled(conn, job["id"])
+
+        # One transaction per month: the interval's rows and the job checkpoint commit together,
+        # without waiting on the WAL flush, since generated readings can simply be generated again
+        with conn.transaction(synchronous_commit=False):
+            interval_duration = (interval_end - current_interval_start).days +1;
+
+            # Remove invalid characters from device_name
+            invalid_chars = "!@#$%^&*()[]{};:,/<>?\|`~=_+"
+            cleaned_device_name = device_name.translate(str.maketrans("", "", invalid_chars))
+        
+            # Convert to lowercase, replace spaces with underscores, format dates 
+            formatted_device_name = cleaned_device_name.lower().replace(" ", "_")
+            start_date_formatted = current_interval_start.strftime('%d%m%Y')
+            end_date_formatted = interval_end.strftime('%d%m%Y')
+        
+            # Define the file name with underscores and the correct file extension
+            file_name = f"{formatted_device_name}_{start_date_formatted}_{end_date_formatted}.csv"
+        
+            # Create a new consumption record for the interval and get the ID
+            insert_consumption_query = """
+                INSERT INTO p.consumption (start_date, end_date, duration_days, device_type, device_category, device_name, files_names) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;
+            """
+            result = conn.execute(insert_consumption_query, (current_interval_start, interval_end, interval_duration, device_type, device_category, device_name, file_name))
+            if result is not None and len(result) > 0:
+                consumption_id = result[0][0]
+            else:
+                raise Exception("No ID returned from the consumption insert query")
+
+            # Link the consumption record with the device
+            conn.execute("""
+                INSERT INTO p.device_consumption (device_id, consumption_id)
+                VALUES (%s, %s);
+                """, (params["device_id"], consumption_id))
+        
+            # GENERATE POWER READINGS
+            #-----------------------------------
+            # Generate readings for the interval
+            timestamps, power = generator.generate(current_interval_start, interval_end)
+
+            # Energy calculation (for hourly power readings): power (W) to energy (kWh) for one hour.
+            # Readings are never negative, so the accumulated energy peaks at the interval total
+            max_power_for_interval = float(power.max()) if power.size else 0
+            max_energy_for_interval = float(power.sum()) / 1000 if power.size else 0
+
+            # Stream the interval's readings with COPY
+            conn.copy_power_readings(zip(itertools.repeat(consumption_id), timestamps.tolist(), power.tolist()))
+
+            # Evaluate the alert rules over the interval's readings, and write the alerts (and the watermark)
+            # with the readings, so a resumed job never evaluates a month twice
+            alert_evaluator = AlertEvaluator(job["username"], consumption_id, params["device_id"], custom_power_min, custom_power_max,
+                                             power_alert_threshold, energy_alert_threshold)
+            alert_evaluator.update(timestamps, power)
+            alert_batch.add(alert_evaluator.result())
+            alert_batch.flush(conn)
+
+            # After generating power readings for the interval, update max_power in p.consumption
+            conn.execute("""
+                UPDATE p.consumption SET power_max = %s, energy_max = %s WHERE p.consumption.id = %s
+                """, (max_power_for_interval, max_energy_for_interval, consumption_id))
+
+            # Fold the interval into the device's daily / monthly usage rollups
+            conn.refresh_device_usage(params["device_id"], current_interval_start, interval_end)
+
+            job_runner.checkpoint(conn, job["id"], consumption_id, int(power.size), generator.get_state())
+
+        response_cache.invalidate_sync(job["username"], *CONSUMPTION_ENTRIES, ("getDeviceConsumption", params["device_id"]))
+
+# The site-wide statistics are refreshed once the job's readings are in, whether it completed or not
+def run_consumption_generation(conn, job):
+    try:
+        run_consumption_generation_job(conn, job)
+    finally:
+        statistics_refresher.request_refresh()
+
+job_runner.register(GENERATE_CONSUMPTION_JOB, run_consumption_generation)
+
+# ===============================================================================================
+# Endpoint to import the readings of a device from a meter export (multipart upload of a .csv, .csv.gz or
+# .parquet file with timestamp and power columns, at any rate - e.g. per second)
+#
+# The upload is spooled to disk by the server, then parsed a chunk at a time and resampled to hourly readings
+# on the fly, by the resampler of the dataset loader (see model/resampling.py), so memory depends on the time
+# span of the file, not its size. Rows must be in time order, except within a chunk.
+# The hourly readings are written like generated ones: one consumption record per calendar month, streamed
+# with COPY, evaluated for alerts and folded into the usage rollups - all in one transaction, so a failed
+# import leaves nothing behind
+#-----------------------------------------------------------------------------------------------
+IMPORT_COPY_CHUNK_SIZE = 10000
+
+@router.post("/importReadings")
+def import_readings(device_id: int = Form(...), file: UploadFile = File(...), username: str = Depends(get_current_user)):
+    started = time.perf_counter()
+    file_format = import_format(file.filename)
+    if file_format is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported file, expected one of: {', '.join(IMPORT_FORMATS)}")
+
+    with database_connection() as conn:
+        try:
+            device_details = conn.execute("""
+                SELECT p.device.device_type, p.device.device_category, p.device.device_name, p.device.custom_power_min, p.device.custom_power_max,
+                    p.device.power_alert_threshold, p.device.energy_alert_threshold
+                FROM p.device
+                WHERE p.device.id = %s AND p.device.user_username = %s""", (device_id, username))
+            if not device_details:
+                raise HTTPException(status_code=404, detail="Device not found or not owned by user")
+            device_type, device_category, device_name, custom_power_min, custom_power_max, power_alert_threshold, energy_alert_threshold = device_details[0]
+
+            # Parse and resample
+            resampler = HourlyResampler()
+            try:
+                timestamps, power = resampler.resample(read_chunks(file.file, file_format))
+            except (ValueError, OSError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid {file_format} file: {e}")
+            parsed = time.perf_counter()
+
+            power = power.round(2)  # NUMERIC(10, 2), as stored
+            if not len(timestamps):
+                raise HTTPException(status_code=400, detail=f"No valid readings found ({resampler.rows_rejected} rows rejected)")
+
+            # Write
+            with conn.transaction():
+                conn.ensure_power_reading_partitions(timestamps[0].item(), timestamps[-1].item())
+
+            consumption_ids = []
+            alert_batch = AlertBatch()
+            with conn.transaction():
+                for start, end in month_ranges(timestamps):
+                    month_timestamps, month_power = timestamps[start:end], power[start:end]
+                    start_date, end_date = month_timestamps[0].item(), month_timestamps[-1].item()
+
+                    result = conn.execute("""
+                        INSERT INTO p.consumption (start_date, end_date, duration_days, device_type, device_category, device_name, files_names, power_max, energy_max)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
+                        (start_date, end_date, round((end - start) / 24, 1), device_type, device_category, device_name, file.filename,
+                         float(month_power.max()), float(month_power.sum()) / 1000))
+                    if not result:
+                        raise Exception("No ID returned from the consumption insert query")
+                    consumption_id = result[0][0]
+                    consumption_ids.append(consumption_id)
+
+                    conn.execute("""
+                        INSERT INTO p.device_consumption (device_id, consumption_id)
+                        VALUES (%s, %s)""", (device_id, consumption_id))
+
+                    # COPY a chunk of readings at a time
+                    for offset in range(0, len(month_timestamps), IMPORT_COPY_CHUNK_SIZE):
+                        chunk_timestamps = month_timestamps[offset:offset + IMPORT_COPY_CHUNK_SIZE].tolist()
+                        chunk_power = month_power[offset:offset + IMPORT_COPY_CHUNK_SIZE].tolist()
+                        conn.copy_power_readings(zip(itertools.repeat(consumption_id), chunk_timestamps, chunk_power))
+
+                    alert_evaluator = AlertEvaluator(username, consumption_id, device_id, custom_power_min, custom_power_max,
+                                                     power_alert_threshold, energy_alert_threshold)
+                    alert_evaluator.update(month_timestamps, month_power)
+                    alert_batch.add(alert_evaluator.result())
+
+                alert_batch.flush(conn)
+                conn.refresh_device_usage(device_id, timestamps[0].item(), timestamps[-1].item())
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    response_cache.invalidate_sync(username, *CONSUMPTION_ENTRIES, ("getDeviceConsumption", device_id))
+    statistics_refresher.request_refresh()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "message": "Readings imported successfully!",
+        "consumption_ids": consumption_ids,
+        "rows_read": resampler.rows_read,
+        "rows_rejected": resampler.rows_rejected,
+        "hourly_readings": len(timestamps),
+        "start_date": timestamps[0].item(),
+        "end_date": timestamps[-1].item(),
+        "parse_seconds": parsed - started,
+        "total_seconds": elapsed,
+        "rows_per_second": resampler.rows_read / elapsed if elapsed else None,
+    }
+
+# ===============================================================================================
+# Endpoint to get the status and progress of a background job
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int, username: str = Depends(get_current_user)):
+    async with async_database_connection() as conn:
+        try:
+            keys = ["id", "kind", "status", "device_id", "months_total", "months_done", "readings_written", "consumption_ids", "cancel_requested", "error", "created_at", "updated_at"]
+            result = await conn.execute("""
+                SELECT p.job.id, p.job.kind, p.job.status, p.job.device_id, p.job.months_total, p.job.months_done, p.job.readings_written,
+                       p.job.consumption_ids, p.job.cancel_requested, p.job.error, p.job.created_at, p.job.updated_at
+                FROM p.job
+                WHERE p.job.id = %s AND p.job.username = %s""", (job_id, username))
+            if not result:
+                raise HTTPException(status_code=404, detail=f"Job with id {job_id} does not exist.")
+
+            return json_object_response(result[0], keys)
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+# ===============================================================================================
+# Endpoint to cancel a queued or running background job (months already generated are kept)
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int, username: str = Depends(get_current_user)):
+    async with async_database_connection() as conn:
+        try:
+            result = await conn.execute("""
+                UPDATE p.job SET cancel_requested = TRUE, updated_at = NOW()
+                WHERE p.job.id = %s AND p.job.username = %s AND p.job.status IN ('queued', 'running')
+                RETURNING p.job.id""", (job_id, username))
+            await conn.commit()
+            if not result:
+                raise HTTPException(status_code=404, detail=f"No queued or running job with id {job_id}.")
+
+            return {"message": "Job cancellation requested!"}
         except HTTPException as e:
-            connector.rollback()
             raise e
         except Exception as e:
-            connector.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 
 # ===============================================================================================
 # Endpoint to get all power readings for a specific consumption
 @router.get("/getConsumptionPowerReadings/{consumption_id}")
-async def get_consumption_power_readings(consumption_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+async def get_consumption_power_readings(consumption_id: int, resolution: Optional[str] = None, max_points: Optional[int] = None,
+                                         from_: Optional[datetime.datetime] = Query(None, alias="from"), to: Optional[datetime.datetime] = None,
+                                         after_timestamp: Optional[datetime.datetime] = None, after_id: Optional[int] = None, limit: Optional[int] = None,
+                                         username: str = Depends(get_current_user)):
+    async with async_database_connection() as conn:
         try:
+            check_downsampling(resolution, max_points)
+            params = check_page(from_, to, after_timestamp, after_id, limit)
+            if limit is not None and (resolution or max_points):
+                raise HTTPException(status_code=400, detail="limit cannot be combined with resolution / max_points")
             keys = ["reading_timestamp", "power"]
 
-            ownership_check = connector.execute("""
-                SELECT 1 FROM p.consumption
+            # The ownership check also returns the months of the consumption, so the readings query
+            # only touches their partitions of p.power_reading
+            ownership_check = await conn.execute("""
+                SELECT date_trunc('month', p.consumption.start_date), date_trunc('month', p.consumption.end_date) + INTERVAL '1 month'
+                FROM p.consumption
                 JOIN p.device_consumption ON p.consumption.id = p.device_consumption.consumption_id
                 JOIN p.device ON p.device_consumption.device_id = p.device.id
                 WHERE p.consumption.id = %s AND p.device.user_username = %s""",
@@ -957,15 +1182,28 @@ async def get_consumption_power_readings(consumption_id: int, username: str = De
             )
             if not ownership_check:
                 raise HTTPException(status_code=404, detail="Consumption data not found or not owned by user")
+            first_month, end_month = ownership_check[0]
 
-            result = connector.execute("""
+            params.update(consumption_id=consumption_id, first_month=first_month, end_month=end_month, resolution=resolution)
+
+            # The timestamps of a consumption are unique, so its pages need no id in the cursor
+            query = f"""
                 SELECT p.power_reading.reading_timestamp, p.power_reading.power
                 FROM p.power_reading
-                WHERE p.power_reading.consumption_id = %s
-                ORDER BY p.power_reading.reading_timestamp ASC""", (consumption_id,))
-            json_data = convert_to_json(result, keys)
-            
-            return json_data
+                WHERE p.power_reading.consumption_id = %(consumption_id)s
+                    AND p.power_reading.reading_timestamp >= %(first_month)s AND p.power_reading.reading_timestamp < %(end_month)s{range_conditions(params, "p.power_reading.reading_timestamp", "p.power_reading.id")}
+                ORDER BY p.power_reading.reading_timestamp ASC"""
+            if resolution:
+                query = min_max_buckets_query(query, keys)
+            if limit is not None:
+                query += " LIMIT %(page_limit)s"
+
+            result = await conn.execute(query, params)
+
+            if limit is None:
+                return json_response(downsample_rows(result, max_points, 0, 1), keys)
+            rows, next_cursor = page_rows(result, limit, 0)
+            return json_page_response(rows, keys, next_cursor)
         except HTTPException as e:
             raise e
         except Exception as e:
@@ -981,11 +1219,12 @@ async def get_consumption_power_readings(consumption_id: int, username: str = De
 # ===============================================================================================
 # Endpoint to get counts of total devices, alerts and consumptions for current user        
 @router.get("/getDashboardCounters")
+@response_cache.cached("getDashboardCounters")
 async def get_dashboard_counters(username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
             keys = ["total_devices", "total_consumptions", "total_alerts"]
-            result = connector.execute("""
+            result = await conn.execute("""
                 SELECT COUNT(DISTINCT device.id), COUNT(DISTINCT consumption.id) , COUNT(DISTINCT alert.id)
                 FROM p.user
                 LEFT JOIN p.device ON p.user.username = p.device.user_username
@@ -994,7 +1233,7 @@ async def get_dashboard_counters(username: str = Depends(get_current_user)):
                 LEFT JOIN p.alert ON p.user.username = p.alert.username
                 WHERE p.user.username = %s""", (username,))
             
-            json_data = convert_to_json(result, keys)
+            json_data = json_response(result, keys)
 
             return json_data
         except HTTPException as e:
@@ -1005,20 +1244,20 @@ async def get_dashboard_counters(username: str = Depends(get_current_user)):
 # ===============================================================================================
 # Endpoint to get total power consumption, per device
 @router.get("/getTotalPowerPerDevice")
+@response_cache.cached("getTotalPowerPerDevice")
 async def get_total_power_per_device(username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
             keys = ["device_id", "device_name", "device_category", "device_type", "total_power"]
-            result = connector.execute("""
-                SELECT p.device.id, p.device.device_name, p.device.device_category, p.device.device_type, COALESCE(SUM(p.power_reading.power), 0) / 1000 AS total_power
+            result = await conn.execute("""
+                SELECT p.device.id, p.device.device_name, p.device.device_category, p.device.device_type, COALESCE(SUM(p.device_monthly_usage.power_sum), 0) / 1000 AS total_power
                 FROM p.device
-                LEFT JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                LEFT JOIN p.power_reading ON p.device_consumption.consumption_id = p.power_reading.consumption_id
+                LEFT JOIN p.device_monthly_usage ON p.device.id = p.device_monthly_usage.device_id
                 WHERE p.device.user_username = %s
                 GROUP BY p.device.id, p.device.device_name
                 ORDER BY total_power DESC""", (username,))
             
-            json_data = convert_to_json(result, keys)
+            json_data = json_response(result, keys)
 
             return json_data
         except HTTPException as e:
@@ -1029,25 +1268,26 @@ async def get_total_power_per_device(username: str = Depends(get_current_user)):
 # ===============================================================================================
 # Endpoint to get average power peak, per device
 @router.get("/getAveragePowerPerDevice")
+@response_cache.cached("getAveragePowerPerDevice")
 async def get_average_power_per_device(username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
             keys = ["device_id", "device_name", "device_category", "device_type", "average_power"]
-            result = connector.execute("""
+            result = await conn.execute("""
                 SELECT 
                     p.device.id, 
                     p.device.device_name, 
                     p.device.device_category, 
                     p.device.device_type, 
-                    COALESCE(AVG(NULLIF(p.power_reading.power, 0)), 0) AS average_power
+                    SUM(p.device_monthly_usage.active_sum) / SUM(p.device_monthly_usage.active_count) AS average_power
                 FROM p.device
-                LEFT JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                LEFT JOIN p.power_reading ON p.device_consumption.consumption_id = p.power_reading.consumption_id
-                WHERE p.device.user_username = %s AND p.power_reading.power <> 0
+                JOIN p.device_monthly_usage ON p.device.id = p.device_monthly_usage.device_id
+                WHERE p.device.user_username = %s
                 GROUP BY p.device.id, p.device.device_name
+                HAVING SUM(p.device_monthly_usage.active_count) > 0
                 ORDER BY average_power DESC""", (username,))
             
-            json_data = convert_to_json(result, keys)
+            json_data = json_response(result, keys)
 
             return json_data
         except HTTPException as e:
@@ -1056,95 +1296,48 @@ async def get_average_power_per_device(username: str = Depends(get_current_user)
             raise HTTPException(status_code=500, detail=str(e))
 
 # ===============================================================================================
-# Endpoint to get peak power analysis for a device
+# Endpoint to get peak power analysis for a device.
+#
+# The analysis is incremental and idempotent: it evaluates only the readings after the consumption's watermark
+# (all of them again if the device thresholds have changed), then saves the new watermark and upserts the
+# alerts of the power and energy rules, one per consumption each - analyzing the same data again writes
+# nothing. With readOnly=true it only returns the analysis and the alerts it would raise
 @router.get("/getPeakPowerAnalysis/{consumption_id}")
-async def get_peak_power_analysis(consumption_id: int, username: str = Depends(get_current_user)):
-    with database_connection():
+async def get_peak_power_analysis(consumption_id: int, readOnly: bool = False, username: str = Depends(get_current_user)):
+    async with async_database_connection() as conn:
         try:
-            keys = ["consumption_id", "timestamp", "power", "power_max", "power_min," "exceeded"]
-
-            result = connector.execute("""
-                SELECT p.power_reading.consumption_id, p.power_reading.reading_timestamp, p.power_reading.power,
-                       p.device.custom_power_max, p.device.custom_power_min,
-                       CASE WHEN p.power_reading.power > p.device.custom_power_max THEN TRUE
-                            ELSE NULL END AS exceeded
-                FROM p.power_reading
-                INNER JOIN p.device_consumption ON p.power_reading.consumption_id = p.device_consumption.consumption_id
-                INNER JOIN p.device ON p.device_consumption.device_id = p.device.id
-                INNER JOIN p.device_type ON p.device.device_type = p.device_type.type_name
-                INNER JOIN p.user ON p.device.user_username = p.user.username
-                WHERE p.power_reading.consumption_id = %s AND p.user.username = %s
-            """, (consumption_id, username))
-
-            if not result:
-                return []
-            
-            # Filter for records that are over or close to the limit
-            peaks = [row for row in result if row[-1] is not None]
-
-            json_data = convert_to_json(peaks, keys)
-            
-            # Fetch the power alert threshold for the device
-            power_alert_threshold_result = connector.execute("""
-                SELECT p.device.power_alert_threshold
-                FROM p.device
-                INNER JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                WHERE p.device_consumption.consumption_id = %s AND p.device.user_username = %s
-                LIMIT 1
-            """, (consumption_id, username))
-            
-            power_alert_threshold = 0
-            if power_alert_threshold_result:
-                power_alert_threshold = power_alert_threshold_result[0][0]
-
-            # Split in peaks that exceeded and not exceeded max power rating
-            exceeded_peaks = [row for row in peaks if row[-1]]
-            non_exceeded_peaks = [row for row in result if not row[-1]]
-
-            # Generate either Warning or Critical alerts
-            alert_message = generate_alert_message(exceeded_peaks, non_exceeded_peaks, consumption_id, power_alert_threshold)
-            if alert_message:
-                alert_title, alert_description, alert_suggestion, alert_type = alert_message
-                
-                connector.execute("""
-                    INSERT INTO p.alert (username, device_id, consumption_id, title, description, suggestion, date, type, read_status)
-                    VALUES (%s, (SELECT device_id FROM p.device_consumption WHERE consumption_id = %s LIMIT 1), %s, %s, %s, %s, NOW(), %s, 'N');
-                """, (username, consumption_id, consumption_id, alert_title, alert_description, alert_suggestion, alert_type))
-
-            # Fetch the energy and power consumption threshold for the device
-            energy_threshold_result = connector.execute("""
-                SELECT p.device.energy_alert_threshold
-                FROM p.device
-                INNER JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                WHERE p.device_consumption.consumption_id = %s AND p.device.user_username = %s
-                LIMIT 1
-            """, (consumption_id, username))
-
-            # Ensure there is a result and extract the threshold
-            if energy_threshold_result:
-                energy_threshold = energy_threshold_result[0][0]
-                
-                # Check if the threshold is non-zero (since zero means 'disabled')
-                if (energy_threshold != 0):  
-                    # Calculate total energy consumption and compare with threshold
-                    total_energy_consumption = sum([float(row[2]) for row in result]) / 1000.0
-                    alert_message = generate_energy_alert_message(total_energy_consumption, energy_threshold, consumption_id)
-                    if alert_message:
-                        alert_title, alert_description, alert_suggestion, alert_type = alert_message
-
-                        # Insert the alert into the database
-                        connector.execute("""
-                            INSERT INTO p.alert (username, device_id, consumption_id, title, description, suggestion, date, type, read_status)
-                            VALUES (%s, (SELECT device_id FROM p.device_consumption WHERE consumption_id = %s LIMIT 1), %s, %s, %s, %s, NOW(), %s, 'N');
-                        """, (username, consumption_id, consumption_id, alert_title, alert_description, alert_suggestion, alert_type))
-
-            connector.commit()
-            return json_data
+            async with conn.transaction():
+                result = await conn.execute(ALERT_EVALUATION_QUERY, {"consumption_id": consumption_id, "username": username})
+
+                # Not owned by the user
+                if not result:
+                    return []
+
+                evaluation, changed = merge_evaluation(username, consumption_id, result[0])
+                alerts = evaluation_alerts(evaluation)
+
+                if changed and not readOnly:
+                    for query, params in evaluation_statements([evaluation]):
+                        await conn.execute(query, params)
+
+            if changed and not readOnly:
+                await response_cache.invalidate(username, *ALERT_ENTRIES)
+
+            keys = ["consumption_id", "device_id", "read_only", "evaluated", "new_readings", "reading_count", "evaluated_until",
+                    "total_energy", "warning_threshold", "highest_exceeded_peak", "highest_warning_peak", "alerts"]
+            analysis = [
+                consumption_id, evaluation["device_id"], readOnly, changed, evaluation["new_readings"],
+                evaluation["reading_count"], evaluation["evaluated_until"], evaluation["total_energy"], evaluation["warning_threshold"],
+                {"timestamp": evaluation["exceeded_timestamp"], "power": evaluation["exceeded_power"]} if evaluation["exceeded_timestamp"] else None,
+                {"timestamp": evaluation["warning_timestamp"], "power": evaluation["warning_power"]} if evaluation["warning_timestamp"] else None,
+                [{"rule": rule, "title": alert_message[0], "description": alert_message[1], "type": alert_message[3]}
+                    for rule, alert_message in alerts if alert_message],
+            ]
+            return json_object_response(analysis, keys)
 
         except HTTPException as e:
             raise e
         except Exception as e:
-            connector.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1158,23 +1351,20 @@ async def get_peak_power_analysis(consumption_id: int, username: str = Depends(g
 # Endpoint to get the global top 10 devices, with the highest average power draw 
 @router.get("/getTopTenDevicesByPowerDraw")
 async def get_top_ten_devices_by_power_draw():
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            keys = ["device_name", "average_power_draw"]
+            keys = ["device_name", "average_power_draw", "as_of"]
             query = """
-                SELECT p.device.device_name, AVG(p.power_reading.power) AS average_power_draw
-                FROM p.power_reading
-                JOIN p.device_consumption ON p.power_reading.consumption_id = p.device_consumption.consumption_id
-                JOIN p.device ON p.device_consumption.device_id = p.device.id
-                WHERE p.power_reading.power > 0
-                GROUP BY p.device.device_name
+                SELECT device_name, average_power_draw,
+                    (SELECT refreshed_at FROM p.statistics_refresh WHERE view_name = 'p.device_power_draw_statistics') AS as_of
+                FROM p.device_power_draw_statistics
                 ORDER BY average_power_draw DESC
                 LIMIT 10
                 """
 
-            result = connector.execute(query)
+            result = await conn.execute(query)
             if result is not None:
-                json_data = convert_to_json(result, keys)
+                json_data = json_response(result, keys)
                 return json_data
             else:
                 return {"message": "No data found"}
@@ -1187,21 +1377,17 @@ async def get_top_ten_devices_by_power_draw():
 # Endpoint to get the total power consumption per user
 @router.get("/getTotalPowerConsumptionByUser")
 async def get_total_power_consumption_by_user():
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            keys = ["username", "total_power_consumption"]
-            result = connector.execute("""
-                SELECT p.user.username, SUM(p.power_reading.power) AS total_power_consumption
-                FROM p.user
-                JOIN p.device ON p.user.username = p.device.user_username
-                JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                JOIN p.power_reading ON p.device_consumption.consumption_id = p.power_reading.consumption_id
-                WHERE p.user.visibility = 'public'
-                GROUP BY p.user.username
+            keys = ["username", "total_power_consumption", "as_of"]
+            result = await conn.execute("""
+                SELECT username, total_power_consumption,
+                    (SELECT refreshed_at FROM p.statistics_refresh WHERE view_name = 'p.user_power_statistics') AS as_of
+                FROM p.user_power_statistics
                 ORDER BY total_power_consumption DESC
                 """)
             
-            json_data = convert_to_json(result, keys)
+            json_data = json_response(result, keys)
 
             return json_data
         except HTTPException as e:
@@ -1214,7 +1400,7 @@ async def get_total_power_consumption_by_user():
 # and the average for other users
 @router.get("/getUserUsageComparisonByCategory")
 async def get_user_usage_comparison_by_category(username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
             keys = ["device_category", "user_total_usage_hours", "average_other_users_usage_hours"]
             query = """
@@ -1247,8 +1433,8 @@ async def get_user_usage_comparison_by_category(username: str = Depends(get_curr
                 ORDER BY user_usage.device_category
                 """
 
-            result = connector.execute(query, (username, username))
-            json_data = convert_to_json(result, keys)
+            result = await conn.execute(query, (username, username))
+            json_data = json_response(result, keys)
 
             return json_data
         except HTTPException as e:
@@ -1261,23 +1447,21 @@ async def get_user_usage_comparison_by_category(username: str = Depends(get_curr
 # and the average for other users
 @router.get("/getUserConsumptionComparisonByCategory")
 async def get_user_consumption_comparison_by_category(username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
             keys = ["device_category", "user_total_power_consumption", "average_other_users_power_consumption"]
             query = """
                 WITH user_consumption AS (
-                    SELECT p.device.device_category, SUM(p.power_reading.power) / 1000 AS total_energy_kWh
-                    FROM p.power_reading
-                    JOIN p.device_consumption ON p.power_reading.consumption_id = p.device_consumption.consumption_id
-                    JOIN p.device ON p.device_consumption.device_id = p.device.id
+                    SELECT p.device.device_category, SUM(p.device_monthly_usage.power_sum) / 1000 AS total_energy_kWh
+                    FROM p.device_monthly_usage
+                    JOIN p.device ON p.device_monthly_usage.device_id = p.device.id
                     WHERE p.device.user_username = %s
                     GROUP BY p.device.device_category
                 ),
                 other_users_consumption AS (
-                    SELECT p.device.device_category, AVG(SUM(p.power_reading.power) / 1000) OVER (PARTITION BY p.device.device_category) AS avg_energy_kWh
-                    FROM p.power_reading
-                    JOIN p.device_consumption ON p.power_reading.consumption_id = p.device_consumption.consumption_id
-                    JOIN p.device ON p.device_consumption.device_id = p.device.id
+                    SELECT p.device.device_category, AVG(SUM(p.device_monthly_usage.power_sum) / 1000) OVER (PARTITION BY p.device.device_category) AS avg_energy_kWh
+                    FROM p.device_monthly_usage
+                    JOIN p.device ON p.device_monthly_usage.device_id = p.device.id
                     WHERE p.device.user_username != %s
                     GROUP BY p.device.device_category, p.device.user_username
                 )
@@ -1287,8 +1471,8 @@ async def get_user_consumption_comparison_by_category(username: str = Depends(ge
                 ORDER BY user_consumption.device_category
                 """
 
-            result = connector.execute(query, (username, username))
-            json_data = convert_to_json(result, keys)
+            result = await conn.execute(query, (username, username))
+            json_data = json_response(result, keys)
 
             return json_data
         except HTTPException as e:
@@ -1300,30 +1484,17 @@ async def get_user_consumption_comparison_by_category(username: str = Depends(ge
 # Endpoint to get the average total energy consumption per age group, measured in kilowatt-hours
 @router.get("/getAverageEnergyConsumptionByAgeGroup")
 async def get_average_energy_consumption_by_age_group():
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            keys = ["age_group", "average_total_power_consumption"]
-            result = connector.execute("""
-                SELECT 
-                    CASE
-                        WHEN CAST(p.user.age AS INTEGER) BETWEEN 18 AND 25 THEN '18-25'
-                        WHEN CAST(p.user.age AS INTEGER) BETWEEN 26 AND 35 THEN '26-35'
-                        WHEN CAST(p.user.age AS INTEGER) BETWEEN 36 AND 45 THEN '36-45'
-                        WHEN CAST(p.user.age AS INTEGER) BETWEEN 46 AND 55 THEN '46-55'
-                        WHEN CAST(p.user.age AS INTEGER) > 55 THEN '55+'
-                        ELSE 'Other'
-                    END AS age_group,
-                    SUM(p.power_reading.power) / COUNT(DISTINCT p.user.username) / 1000 AS average_total_power_consumption
-                FROM p.user
-                JOIN p.device ON p.user.username = p.device.user_username
-                JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                JOIN p.power_reading ON p.device_consumption.consumption_id = p.power_reading.consumption_id
-                WHERE p.user.visibility = 'public' AND p.user.age <> ''
-                GROUP BY age_group
+            keys = ["age_group", "average_total_power_consumption", "as_of"]
+            result = await conn.execute("""
+                SELECT age_group, average_total_power_consumption,
+                    (SELECT refreshed_at FROM p.statistics_refresh WHERE view_name = 'p.age_group_energy_statistics') AS as_of
+                FROM p.age_group_energy_statistics
                 """)
             
             if result is not None:
-                json_data = convert_to_json(result, keys)
+                json_data = json_response(result, keys)
                 return json_data
             else:
                 return {"message": "No data found"}
@@ -1336,21 +1507,17 @@ async def get_average_energy_consumption_by_age_group():
 # Endpoint to get the average total energy consumption per gender, measured in kilowatt-hours (kWh)
 @router.get("/getAverageEnergyConsumptionByGender")
 async def get_average_energy_consumption_by_gender():
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            keys = ["gender", "average_total_power_consumption"]
-            result = connector.execute("""
-                SELECT p.user.gender, SUM(p.power_reading.power) / COUNT(DISTINCT p.user.username) / 1000 AS average_total_power_consumption
-                FROM p.user
-                JOIN p.device ON p.user.username = p.device.user_username
-                JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                JOIN p.power_reading ON p.device_consumption.consumption_id = p.power_reading.consumption_id
-                WHERE p.user.visibility = 'public' AND p.user.gender <> ''
-                GROUP BY p.user.gender
+            keys = ["gender", "average_total_power_consumption", "as_of"]
+            result = await conn.execute("""
+                SELECT gender, average_total_power_consumption,
+                    (SELECT refreshed_at FROM p.statistics_refresh WHERE view_name = 'p.gender_energy_statistics') AS as_of
+                FROM p.gender_energy_statistics
                 """)
             
             if result is not None:
-                json_data = convert_to_json(result, keys)
+                json_data = json_response(result, keys)
                 return json_data
             else:
                 return {"message": "No data found"}
@@ -1363,21 +1530,17 @@ async def get_average_energy_consumption_by_gender():
 # Endpoint to get the average total energy consumption per country, measured in kilowatt-hours (kWh)
 @router.get("/getAverageEnergyConsumptionByCountry")
 async def get_average_energy_consumption_by_country():
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
-            keys = ["country", "average_total_power_consumption"]
-            result = connector.execute("""
-                SELECT p.user.country, SUM(p.power_reading.power) / COUNT(DISTINCT p.user.username) / 1000 AS average_total_power_consumption
-                FROM p.user
-                JOIN p.device ON p.user.username = p.device.user_username
-                JOIN p.device_consumption ON p.device.id = p.device_consumption.device_id
-                JOIN p.power_reading ON p.device_consumption.consumption_id = p.power_reading.consumption_id
-                WHERE p.user.visibility = 'public' AND p.user.country <> ''
-                GROUP BY p.user.country
+            keys = ["country", "average_total_power_consumption", "as_of"]
+            result = await conn.execute("""
+                SELECT country, average_total_power_consumption,
+                    (SELECT refreshed_at FROM p.statistics_refresh WHERE view_name = 'p.country_energy_statistics') AS as_of
+                FROM p.country_energy_statistics
                 """)
             
             if result is not None:
-                json_data = convert_to_json(result, keys)
+                json_data = json_response(result, keys)
                 return json_data
             else:
                 return {"message": "No data found"}
@@ -0,0 +1,168 @@
+import os
+import json
+import uuid
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Job statuses
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+
+JOB_COLUMNS = ["id", "username", "device_id", "kind", "status", "params", "state", "months_total", "months_done",
+               "readings_written", "consumption_ids", "cancel_requested", "error", "created_at", "updated_at"]
+
+
+# Seconds a running job stays claimed by its runner without a heartbeat, before another runner may take it over
+JOB_LEASE_SECONDS = 120
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# The job was taken over by another runner (its lease expired): stop without touching it
+class JobLost(Exception):
+    pass
+
+
+# ===============================================================================================
+# In-process runner for long jobs, backed by the p.job table.
+#
+# A job is created in the database (status 'queued'), then run either on the worker pool (submit) or on the
+# calling thread (run). Handlers do their work in chunks, each chunk in its own transaction together with a
+# checkpoint() of the job's progress, so a job interrupted by a restart is picked up by resume() and continues
+# after its last committed chunk. Cancellation is a flag on the job row, checked by the handler between chunks.
+#
+# Several server processes (uvicorn workers, or an old and a new process during a restart) share the table, so
+# a job is claimed before it runs, in a single UPDATE: a queued job, or a running one whose runner stopped
+# sending heartbeats for lease_seconds. Only the runner whose claim returned the row runs the handler, and
+# its heartbeats (check_cancelled, checkpoint) fail with JobLost once another runner has taken the job over.
+class JobRunner:
+    def __init__(self, connector, max_workers=2, lease_seconds=JOB_LEASE_SECONDS):
+        self.connector = connector
+        self.max_workers = max_workers
+        self.lease_seconds = lease_seconds
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self.executor = None
+        self.resume_timer = None
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def create(self, conn, username, kind, device_id, params, months_total):
+        result = conn.execute("""
+            INSERT INTO p.job (username, device_id, kind, status, params, months_total)
+            VALUES (%s, %s, %s, %s, %s::jsonb, %s) RETURNING id""",
+            (username, device_id, kind, QUEUED, json.dumps(params), months_total))
+        return result[0][0]
+
+    def submit(self, job_id):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        return self.executor.submit(self.run, job_id)
+
+    # Run a job to completion on the calling thread, and return its final row. A job another runner holds
+    # (or already finished) is not run, and its current row is returned
+    def run(self, job_id):
+        with self.connector.connection() as conn:
+            job = self.claim(conn, job_id)
+            if job is None:
+                return self.load(conn, job_id)
+
+            try:
+                self.handlers[job["kind"]](conn, job)
+                status, error = COMPLETED, None
+            except JobCancelled:
+                status, error = CANCELLED, None
+            except JobLost:
+                print(f"-- Job {job_id} was taken over by another runner")
+                conn.rollback()
+                return self.load(conn, job_id)
+            except Exception as e:
+                traceback.print_exc()
+                status, error = FAILED, str(e)[:512]
+
+            conn.rollback()
+            conn.execute("""
+                UPDATE p.job SET status = %s, error = %s, updated_at = NOW()
+                WHERE id = %s AND claimed_by = %s""",
+                (status, error, job_id, self.runner_id))
+            conn.commit()
+            return self.load(conn, job_id)
+
+    # Take a job for this runner, atomically: None unless it was queued, or running with an expired lease
+    def claim(self, conn, job_id):
+        result = conn.execute(f"""
+            UPDATE p.job
+            SET status = %s, claimed_by = %s, heartbeat = NOW(), updated_at = NOW()
+            WHERE id = %s AND (status = %s OR (status = %s AND (heartbeat IS NULL OR heartbeat < NOW() - make_interval(secs => %s))))
+            RETURNING {', '.join(JOB_COLUMNS)}""",
+            (RUNNING, self.runner_id, job_id, QUEUED, RUNNING, self.lease_seconds))
+        conn.commit()
+        return dict(zip(JOB_COLUMNS, result[0])) if result else None
+
+    def load(self, conn, job_id):
+        result = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM p.job WHERE id = %s", (job_id,))
+        return dict(zip(JOB_COLUMNS, result[0])) if result else None
+
+    # Record one finished chunk - call inside the chunk's transaction, so progress commits with the data.
+    # Also a heartbeat: raises JobLost (rolling the chunk back) if the job is no longer claimed by this runner
+    def checkpoint(self, conn, job_id, consumption_id, readings_written, state):
+        result = conn.execute("""
+            UPDATE p.job
+            SET months_done = months_done + 1,
+                readings_written = readings_written + %s,
+                consumption_ids = array_append(consumption_ids, %s),
+                state = %s::jsonb,
+                heartbeat = NOW(),
+                updated_at = NOW()
+            WHERE id = %s AND claimed_by = %s
+            RETURNING id""",
+            (readings_written, consumption_id, json.dumps(state), job_id, self.runner_id))
+        if not result:
+            raise JobLost()
+
+    # Heartbeat between chunks, which also reads the cancellation flag
+    def check_cancelled(self, conn, job_id):
+        result = conn.execute("""
+            UPDATE p.job SET heartbeat = NOW()
+            WHERE id = %s AND claimed_by = %s
+            RETURNING cancel_requested""",
+            (job_id, self.runner_id))
+        conn.commit()
+        if not result:
+            raise JobLost()
+        if result[0][0]:
+            raise JobCancelled()
+
+    # Submit the jobs left queued, or running by a runner that stopped (e.g. a previous server process). Jobs
+    # still running under another runner's lease are looked at again once the lease could have expired, so a
+    # job whose runner dies is resumed, and one that finishes meanwhile is left alone
+    def resume(self):
+        with self.connector.connection() as conn:
+            result = conn.execute("""
+                SELECT id, status = %s AND heartbeat >= NOW() - make_interval(secs => %s)
+                FROM p.job WHERE status IN (%s, %s) ORDER BY id""",
+                (RUNNING, self.lease_seconds, QUEUED, RUNNING))
+
+        leased = 0
+        for job_id, held in result or []:
+            if held:
+                leased += 1
+                continue
+            print(f"-- Resuming job {job_id}")
+            self.submit(job_id)
+
+        if leased:
+            self.resume_timer = threading.Timer(self.lease_seconds, self.resume)
+            self.resume_timer.daemon = True
+            self.resume_timer.start()
+
+    def shutdown(self):
+        # Running jobs stay 'running' in the database, and are resumed once their lease expires
+        if self.resume_timer is not None:
+            self.resume_timer.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,64 @@
+import time
+import threading
+import traceback
+
+# Materialized views of the site-wide statistics endpoints (see create_db_schema.sql)
+STATISTICS_VIEWS = [
+    "p.device_power_draw_statistics",
+    "p.user_power_statistics",
+    "p.age_group_energy_statistics",
+    "p.gender_energy_statistics",
+    "p.country_energy_statistics",
+]
+
+
+# ===============================================================================================
+# Background refresher of the site-wide statistics views.
+#
+# The views are refreshed CONCURRENTLY, so the statistics endpoints keep reading the previous contents while
+# a refresh runs, every `interval` seconds and whenever request_refresh() is called (e.g. after bulk
+# ingestion). Requests made while a refresh is running are coalesced into the next one. The refresh time of
+# each view is recorded in p.statistics_refresh, and served by the endpoints as `as_of`.
+class StatisticsRefresher:
+    def __init__(self, connector, interval=300, views=STATISTICS_VIEWS):
+        self.connector = connector
+        self.interval = interval
+        self.views = views
+        self.requested = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.requested.set()  # Refresh once on startup
+            self.thread = threading.Thread(target=self._run, name="statistics-refresh", daemon=True)
+            self.thread.start()
+
+    def request_refresh(self):
+        self.requested.set()
+
+    def refresh(self):
+        started = time.monotonic()
+        with self.connector.connection() as conn:
+            for view in self.views:
+                with conn.transaction():
+                    conn.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+                    conn.execute("""
+                        INSERT INTO p.statistics_refresh (view_name, refreshed_at) VALUES (%s, clock_timestamp())
+                        ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at""", (view,))
+        return time.monotonic() - started
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.requested.wait(self.interval)
+            if self.stopped.is_set():
+                break
+            self.requested.clear()
+            try:
+                self.refresh()
+            except Exception:
+                traceback.print_exc()
+
+    def shutdown(self):
+        self.stopped.set()
+        self.requested.set()
@@ -1,16 +1,18 @@
 import json
+import asyncio
 import collections
 import jwt
 import bcrypt
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from decimal import Decimal
-from ...model.dbconnector import PostgresConnector
+from ...model.async_dbconnector import AsyncPostgresConnector
 
 router = APIRouter()
 
-connector = PostgresConnector(
+connector = AsyncPostgresConnector(
     host="localhost",
     port=5432,
     database="postgres",
@@ -18,6 +20,11 @@ connector = PostgresConnector(
     password="password",
 )
 
+@asynccontextmanager
+async def async_database_connection():
+    async with connector.connection() as conn:
+        yield conn
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, Decimal):
@@ -42,72 +49,71 @@ JWT_SECRET_KEY = "7f59da32cdeef05ac9ec8a5da22b9f120c152bccfc1a02a57b96db5c14db52
 # Endpoint to register as a new user
 @router.post("/register")
 async def register_user(data: RegisterData):
-    connector.connect()
-
-    try:
-        # Case check - Blank username or white-space
-        if not data.username.strip():
-            raise HTTPException(
-                status_code=400, detail="Username cannot be blank!")
-
-        # Case check - Blank password or white-space
-        if not data.password.strip():
-            raise HTTPException(
-                status_code=400, detail="Password cannot be blank!")
-
-        # Case check - Blank email or white-space
-        if not data.email.strip():
-            raise HTTPException(
-                status_code=400, detail="Email cannot be blank")
-
-        # Case check - Password validation failed
-        if (data.password != data.password2):
-            raise HTTPException(
-                status_code=400, detail="Passwords do not match!")
-
-        # Case check - Username already exists
-        result = connector.execute(
-            "SELECT p.user.username FROM p.user WHERE p.user.username = %s", (
-                data.username,)
-        )
-        if result:
-            raise HTTPException(
-                status_code=400, detail=f"Username '{data.username}' already exists!")
-
-        # Hash the password before storing
-        hashed_password = bcrypt.hashpw(data.password.encode(), bcrypt.gensalt())
-
-        connector.execute(
-            "INSERT INTO p.user (username, email, password, first_name, last_name, age, gender, country, visibility, notifications) VALUES (%s, %s, %s, '', '', '', '', '', 'public', 'on')",
-            (data.username, data.email, hashed_password.decode('utf-8'))
-        )
-
-        connector.commit()
-        return {"message": "Account registered successfully!"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        connector.rollback()
-        raise HTTPException(status_code=500, detail="Something went wrong!")
+    # Case check - Blank username or white-space
+    if not data.username.strip():
+        raise HTTPException(
+            status_code=400, detail="Username cannot be blank!")
+
+    # Case check - Blank password or white-space
+    if not data.password.strip():
+        raise HTTPException(
+            status_code=400, detail="Password cannot be blank!")
+
+    # Case check - Blank email or white-space
+    if not data.email.strip():
+        raise HTTPException(
+            status_code=400, detail="Email cannot be blank")
+
+    # Case check - Password validation failed
+    if (data.password != data.password2):
+        raise HTTPException(
+            status_code=400, detail="Passwords do not match!")
+
+    # Hash the password before storing - bcrypt takes hundreds of ms, so in a worker thread and before taking a
+    # pooled connection
+    hashed_password = await asyncio.to_thread(bcrypt.hashpw, data.password.encode(), bcrypt.gensalt())
+
+    async with async_database_connection() as conn:
+        try:
+            # Case check - Username already exists
+            result = await conn.execute(
+                "SELECT p.user.username FROM p.user WHERE p.user.username = %s", (
+                    data.username,)
+            )
+            if result:
+                raise HTTPException(
+                    status_code=400, detail=f"Username '{data.username}' already exists!")
+
+            await conn.execute(
+                "INSERT INTO p.user (username, email, password, first_name, last_name, age, gender, country, visibility, notifications) VALUES (%s, %s, %s, '', '', '', '', '', 'public', 'on')",
+                (data.username, data.email, hashed_password.decode('utf-8'))
+            )
+
+            await conn.commit()
+            return {"message": "Account registered successfully!"}
+        except HTTPException:
+            raise
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail="Something went wrong!")
 
 # ===============================================================================================
 # Endpoint to login as an existing user
 @router.post("/login")
 async def login_user(data: LoginData):
-    connector.connect()
-
     try:
-        result = connector.execute(
-            "SELECT * FROM p.user WHERE p.user.username = %s", (data.username,)
-        )
+        async with async_database_connection() as conn:
+            result = await conn.execute(
+                "SELECT * FROM p.user WHERE p.user.username = %s", (data.username,)
+            )
 
         if result:
             user = result[0]
         else:
             user = None
 
-        # Case check - Incorrect username or password
-        if user is None or not bcrypt.checkpw(data.password.encode(), user[2].encode('utf-8')):
+        # Case check - Incorrect username or password (bcrypt in a worker thread, the connection released)
+        if user is None or not await asyncio.to_thread(bcrypt.checkpw, data.password.encode(), user[2].encode('utf-8')):
             raise HTTPException(
                 status_code=400, detail="Incorrect username or password!")
 
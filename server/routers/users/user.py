@@ -1,16 +1,13 @@
-import json
-import collections
-import datetime
-from contextlib import contextmanager
-from decimal import Decimal
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from fastapi import APIRouter, Depends, HTTPException
-from ...model.dbconnector import PostgresConnector
+from ...model.async_dbconnector import AsyncPostgresConnector
+from ...model.serialization import json_response
 from ..users.authentication import get_current_user
 
 router = APIRouter()
 
-connector = PostgresConnector(
+connector = AsyncPostgresConnector(
     host="localhost",
     port=5432,
     database="postgres",
@@ -18,14 +15,6 @@ connector = PostgresConnector(
     password="password",
 )
 
-class ExtendedEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, Decimal):
-            return float(o)
-        if isinstance(o, datetime.datetime):
-            return o.isoformat()
-        return super().default(o)
-
 class GetData(BaseModel):
     username: str
     email: str
@@ -46,30 +35,22 @@ class UserUpdateData(BaseModel):
     visibility: str
     notifications: str
 
-@contextmanager
-def database_connection():
-    try:
-        connector.connect()
-        yield
-    finally:
-        connector.disconnect()
-
-def convert_to_json(result, keys):
-    data = [collections.OrderedDict(zip(keys, row)) for row in result]
-    json_data = json.dumps(data, cls=ExtendedEncoder)
-    return json.loads(json_data)
+@asynccontextmanager
+async def async_database_connection():
+    async with connector.connection() as conn:
+        yield conn
 
 # ===============================================================================================
 # Endpoint to get the user details
 @router.get("/get/")
 async def get_user(username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         keys = ["username", "email", "first_name", "last_name", "age", "gender", "country", "visibility", "notifications"]
-        result = connector.execute(f"""
+        result = await conn.execute(f"""
             SELECT p.user.username, p.user.email, p.user.first_name, p.user.last_name, p.user.age, p.user.gender, p.user.country, p.user.visibility, p.user.notifications 
             FROM p.user
             WHERE p.user.username = %s""", (username,))
-        json_data = convert_to_json(result, keys)
+        json_data = json_response(result, keys)
 
     return json_data
 
@@ -77,19 +58,19 @@ async def get_user(username: str = Depends(get_current_user)):
 # Endpoint to update user data
 @router.patch("/update/")
 async def update_user(data: UserUpdateData, username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
             # Case check- User does not exist
-            result = connector.execute(
+            result = await conn.execute(
                 "SELECT * FROM p.user WHERE p.user.username = %s", (username,)
             )
 
             if result:
-                connector.execute(
+                await conn.execute(
                     "UPDATE p.user SET first_name = %s, last_name = %s, age = %s, gender = %s, country = %s, visibility = %s, notifications = %s WHERE username = %s",
                     (data.first_name, data.last_name, data.age, data.gender, data.country, data.visibility, data.notifications, username)
                 )
-                connector.commit()
+                await conn.commit()
                 return {"message": "User details updated successfully!"}
             else:
                 raise HTTPException(
@@ -97,26 +78,26 @@ async def update_user(data: UserUpdateData, username: str = Depends(get_current_
         except HTTPException:
             raise
         except Exception as e:
-            connector.rollback()
+            await conn.rollback()
             raise HTTPException(status_code=500, detail=str(e))
     
 # ===============================================================================================
 # Endpoint to remove a user
 @router.delete("/delete/")
 async def delete_user(username: str = Depends(get_current_user)):
-    with database_connection():
+    async with async_database_connection() as conn:
         try:
             # Case check- User does not exist
-            result = connector.execute(
+            result = await conn.execute(
                 "SELECT * FROM p.user WHERE p.user.username = %s", (username,)
             )
 
             if result:
-                connector.execute(
+                await conn.execute(
                     "DELETE FROM p.user WHERE username = %s",
                     (username,)
                 )
-                connector.commit()
+                await conn.commit()
                 return {"message": "Account deleted successfully!"}
             else:
                 raise HTTPException(
@@ -124,5 +105,5 @@ async def delete_user(username: str = Depends(get_current_user)):
         except HTTPException:
             raise
         except Exception as e:
-            connector.rollback()
+            await conn.rollback()
             raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,157 @@
+import os
+import glob
+import tempfile
+import unittest
+import tracemalloc
+import numpy as np
+import pandas as pd
+from ..model.resampling import HourlyResampler, resample_csv_chunks
+
+# The streaming hourly resampler (model/resampling.py), shared by the dataset loader and the importReadings
+# endpoint, against a whole-file pandas resample of the same valid rows: the hourly values must be equal to
+# the last bit, whatever the chunk size. Run with:
+#   python -m unittest discover -s server/tests -t .
+# Set RESAMPLING_DATASET_FILES to a glob of dataset files (e.g. "server/database/*_*.csv") to check them too,
+# which takes a few minutes.
+
+CHUNK_SIZES = [101, 997, 1000000]
+
+
+# Whole-file reference: the reject rules (unparseable ISO 8601 timestamp, missing / non-numeric / infinite or
+# negative power), then pandas' resample('1h').mean().ffill() over the valid rows
+def reference_resample(df):
+    timestamps = pd.to_datetime(df["timestamp"], utc=True, errors="coerce", format="ISO8601")
+    power = pd.to_numeric(df["power"], errors="coerce")
+    valid = timestamps.notna() & np.isfinite(power) & (power >= 0)
+    series = pd.Series(power[valid].to_numpy(dtype=np.float64), index=pd.DatetimeIndex(timestamps[valid]))
+    resampled = series.sort_index(kind="stable").resample("1h").mean().ffill()
+    return resampled.index.tz_convert(None).to_numpy().astype("datetime64[s]"), resampled.to_numpy(dtype=np.float64), int((~valid).sum())
+
+
+def streaming_resample(df, chunk_size):
+    resampler = HourlyResampler()
+    timestamps, power = resampler.resample(df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+    return timestamps, power, resampler
+
+
+# Rows at the given seconds from a start time, with dataset-like timestamps ("2021-03-27 22:59:30+00:00")
+def readings(seconds, power, start="2021-03-27 22:59:30"):
+    timestamps = (pd.Timestamp(start, tz="UTC") + pd.to_timedelta(seconds, unit="s")).strftime("%Y-%m-%d %H:%M:%S%z")
+    return pd.DataFrame({"timestamp": [f"{t[:-2]}:{t[-2:]}" for t in timestamps], "power": power})
+
+
+def cases():
+    rng = np.random.default_rng(7)
+    seconds = np.arange(3 * 86400, step=7)
+    yield "regular", readings(seconds, rng.uniform(0, 2000, len(seconds)).round(1))
+
+    # Multi-hour and multi-day gaps, forward filled across chunk boundaries
+    gaps = seconds[(seconds < 5000) | ((seconds > 40000) & (seconds < 41000)) | (seconds > 200000)]
+    yield "gaps", readings(gaps, rng.uniform(0, 2000, len(gaps)).round(1))
+
+    # NaN readings (rejected), including a whole first hour and a whole later hour
+    power = rng.uniform(0, 2000, len(seconds)).round(1)
+    power[(seconds < 3600) | ((seconds >= 36000) & (seconds < 39600)) | (rng.random(len(seconds)) < 0.2)] = np.nan
+    yield "nan readings", readings(seconds, power)
+
+    # Hours split over many chunks, with rows in any order within the hour
+    seconds = np.arange(6 * 3600)
+    shuffled = np.concatenate([rng.permutation(hour) for hour in np.split(seconds, 6)])
+    yield "unordered within hours", readings(shuffled, rng.uniform(0, 50, len(shuffled)).round(2), start="2021-03-28 00:00:00")
+
+    # Timestamps of several UTC offsets (e.g. across a daylight saving change), and naive ones
+    df = readings(np.arange(0, 4 * 3600, 60), rng.uniform(0, 100, 240).round(1))
+    df.loc[::3, "timestamp"] = pd.to_datetime(df["timestamp"][::3]).dt.tz_convert("Europe/Athens").astype(str)
+    df.loc[1::3, "timestamp"] = df["timestamp"][1::3].str[:19]
+    yield "mixed offsets", df
+
+    yield "single reading", readings(np.array([0]), np.array([42.0]))
+    yield "header only", readings(np.array([], dtype=np.int64), np.array([]))
+
+
+class HourlyResamplerTest(unittest.TestCase):
+    def assertSameReadings(self, expected, actual, label):
+        (expected_timestamps, expected_power), (timestamps, power) = expected, actual
+        np.testing.assert_array_equal(timestamps, expected_timestamps, err_msg=label)
+        # Equal to the last bit (assert_array_equal also compares NaN positions)
+        np.testing.assert_array_equal(power.view(np.int64), expected_power.view(np.int64), err_msg=label)
+
+    def test_equal_to_whole_file_resample(self):
+        for name, df in cases():
+            expected_timestamps, expected_power, rejected = reference_resample(df)
+            # Tiny chunks too for the short cases, so that every hour spans several chunks
+            for chunk_size in ([1, 7] if len(df) < 2000 else []) + CHUNK_SIZES:
+                timestamps, power, resampler = streaming_resample(df, chunk_size)
+                label = f"{name}, chunks of {chunk_size} rows"
+                self.assertSameReadings((expected_timestamps, expected_power), (timestamps, power), label)
+                self.assertEqual(resampler.rows_read, len(df), label)
+                self.assertEqual(resampler.rows_rejected, rejected, label)
+
+    def test_rejected_rows(self):
+        df = readings(np.arange(0, 7200, 600), [10.0, -1.0, np.nan, 20.0, np.inf, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0])
+        df.loc[3, "timestamp"] = "not a timestamp"
+        df["power"] = df["power"].astype(object)
+        df.loc[5, "power"] = "abc"
+
+        timestamps, power, resampler = streaming_resample(df, 4)
+        self.assertEqual(resampler.rows_rejected, 5)
+        self.assertSameReadings(reference_resample(df)[:2], (timestamps, power), "rejected rows")
+        self.assertEqual(power[0], 10.0)
+
+    def test_hours_without_valid_rows_are_forward_filled(self):
+        df = readings(np.array([0, 1800, 3600 * 3]), [10.0, 20.0, 40.0], start="2024-01-01 00:00:00")
+        timestamps, power, _ = streaming_resample(df, 1)
+        self.assertEqual(timestamps.tolist(), list(np.arange("2024-01-01T00", "2024-01-01T04", dtype="datetime64[h]").astype("datetime64[s]")))
+        self.assertEqual(power.tolist(), [15.0, 15.0, 15.0, 40.0])
+
+    def test_chunks_out_of_time_order(self):
+        df = readings(np.arange(0, 4 * 3600, 60), np.ones(240))
+        resampler = HourlyResampler()
+        resampler.add(df.iloc[120:])
+        with self.assertRaises(ValueError):
+            resampler.add(df.iloc[:120])
+
+    def test_csv_file(self):
+        for name, df in cases():
+            with tempfile.TemporaryDirectory() as directory:
+                file_path = os.path.join(directory, "plug.csv")
+                df.to_csv(file_path, index=False)
+                expected = reference_resample(pd.read_csv(file_path, dtype={"timestamp": str}))[:2]
+                for chunk_size in CHUNK_SIZES:
+                    chunks = list(resample_csv_chunks(file_path, chunk_size))
+                    actual = (np.concatenate([chunk[0] for chunk in chunks] or [np.empty(0, dtype="datetime64[s]")]),
+                              np.concatenate([chunk[1] for chunk in chunks] or [np.empty(0)]))
+                    self.assertSameReadings(expected, actual, f"{name} csv, chunks of {chunk_size} rows")
+
+    # Memory of the streaming resampler depends on the chunk size, not on the length of the file
+    def test_bounded_memory(self):
+        rng = np.random.default_rng(3)
+        seconds = np.arange(0, 20 * 86400, 2)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "plug.csv")
+            readings(seconds, rng.uniform(0, 2000, len(seconds)).round(1)).to_csv(file_path, index=False)
+
+            peaks = {}
+            for chunk_size in (10000, len(seconds)):
+                tracemalloc.start()
+                try:
+                    for _ in resample_csv_chunks(file_path, chunk_size):
+                        pass
+                    peaks[chunk_size] = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            self.assertLess(peaks[10000] * 5, peaks[len(seconds)])
+
+    @unittest.skipUnless(os.environ.get("RESAMPLING_DATASET_FILES"), "set RESAMPLING_DATASET_FILES to check the dataset files")
+    def test_dataset_files(self):
+        file_paths = sorted(path for path in glob.glob(os.environ["RESAMPLING_DATASET_FILES"]) if os.path.basename(path) != "consumption.csv")
+        self.assertTrue(file_paths)
+        for file_path in file_paths:
+            expected = reference_resample(pd.read_csv(file_path, dtype={"timestamp": str}))[:2]
+            chunks = list(resample_csv_chunks(file_path))
+            actual = np.concatenate([chunk[0] for chunk in chunks]), np.concatenate([chunk[1] for chunk in chunks])
+            self.assertSameReadings(expected, actual, os.path.basename(file_path))
+
+
+if __name__ == "__main__":
+    unittest.main()